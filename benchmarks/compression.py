@@ -0,0 +1,138 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+
+from model.chat_model import ChatModel, ImageMessage
+from model.chat_server import ChatServer
+from model.compression import CODECS
+
+# Compara el chat con y sin compresión por trama:
+#   python -m benchmarks.compression --messages 2000 --images 20
+# Para cada códec (y sin compresión) se arranca un servidor en loopback y dos clientes: uno envía
+# y el otro cuenta lo recibido. Se mide el tiempo total, el tiempo de CPU del proceso (servidor y
+# ambos clientes, que corren aquí mismo) y los bytes que llegan al receptor por el socket.
+# Cargas:
+#   - textos largos: líneas de log de ~4KB (lo que más se beneficia de comprimir)
+#   - chat corto: mensajes de unas pocas palabras (por debajo del umbral, no se comprimen)
+#   - imágenes: PNG de ruido (ya comprimidas; sus trozos nunca se comprimen)
+
+WORDS = ("conexión", "servidor", "cliente", "imagen", "error", "mensaje", "trama", "socket",
+         "historial", "usuario", "hola", "vale", "gracias", "mañana", "enviado", "recibido")
+RECEIVE_TIMEOUT = 120
+
+
+def long_texts(count):
+    rng = random.Random(1)
+    texts = []
+    for i in range(count):
+        lines = []
+        while sum(len(line) for line in lines) < 4096:
+            lines.append(f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} "
+                         f"[{rng.choice(('INFO', 'DEBUG', 'ERROR'))}] {' '.join(rng.choices(WORDS, k=8))} "
+                         f"id={rng.randint(0, 99999)}")
+        texts.append(f"bench: {i} " + "\n".join(lines))
+    return texts
+
+
+def short_texts(count):
+    rng = random.Random(2)
+    return [f"bench: {' '.join(rng.choices(WORDS, k=rng.randint(2, 8)))}" for _ in range(count)]
+
+
+def noise_images(count, directory):
+    from PIL import Image  # Solo hace falta para esta carga
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"ruido_{i}.png")
+        Image.effect_noise((640, 480), 40 + i).convert("RGB").save(path)
+        paths.append(path)
+    return paths
+
+
+def run(codec_name, workload, items):
+    """Envía `items` (textos o rutas de imagen) y devuelve (segundos, segundos de CPU, bytes recibidos)."""
+    compression = [codec_name] if codec_name else []
+    received = threading.Event()
+    expected = len(items)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # Silencia los [DEBUG] de servidor y clientes
+        server = ChatServer("127.0.0.1", 0)
+        server.start()
+        port = server.listen_sock.getsockname()[1]
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        sender = ChatModel("bench", compression=compression)
+        receiver = ChatModel("otro", compression=compression)
+        sender.start_client("127.0.0.1", port)
+        receiver.start_client("127.0.0.1", port)
+
+        def receive_loop():
+            count = 0
+            while count < expected:
+                try:
+                    msg = receiver.receive_message()
+                except (OSError, ConnectionError):
+                    return
+                if isinstance(msg, str) or isinstance(msg, ImageMessage):
+                    count += 1
+            received.set()
+
+        def drain_loop():
+            # El emisor también tiene que leer: el servidor le pide el contenido de las imágenes (NEED)
+            while True:
+                try:
+                    sender.receive_message()
+                except (OSError, ConnectionError):
+                    return
+
+        threading.Thread(target=receive_loop, daemon=True).start()
+        threading.Thread(target=drain_loop, daemon=True).start()
+        time.sleep(0.1)  # Ambos clientes registrados en el servidor antes de empezar
+
+        start_bytes = receiver.reader.bytes_read
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        for item in items:
+            sender.send_message(("IMG:" + item) if workload == "imágenes" else item)
+        completed = received.wait(RECEIVE_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        wire = receiver.reader.bytes_read - start_bytes
+
+        sender.close()
+        receiver.close()
+        server.stop()
+        server_thread.join()
+    if not completed:
+        raise RuntimeError(f"{workload}/{codec_name or 'sin compresión'}: no llegaron todos los mensajes")
+    return elapsed, cpu, wire
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendimiento del chat con y sin compresión")
+    parser.add_argument("--messages", type=int, default=2000, help="Mensajes de texto por carga (por defecto: 2000)")
+    parser.add_argument("--images", type=int, default=20, help="Imágenes de la carga de imágenes (por defecto: 20)")
+    parser.add_argument("--codecs", default=",".join(CODECS),
+                        help=f"Códecs a comparar con la opción sin compresión (por defecto: {','.join(CODECS)})")
+    args = parser.parse_args()
+
+    codecs = [None] + [name for name in args.codecs.split(",") if name in CODECS]
+    with tempfile.TemporaryDirectory(prefix="bench_") as temp_dir:
+        workloads = [("textos largos", long_texts(args.messages)),
+                     ("chat corto", short_texts(args.messages)),
+                     ("imágenes", noise_images(args.images, temp_dir))]
+        print(f"{'carga':<14} {'códec':<8} {'msgs/s':>10} {'MB/s':>8} {'CPU (s)':>8} {'en el cable':>12} {'ratio':>6}")
+        for workload, items in workloads:
+            baseline = None
+            for codec_name in codecs:
+                elapsed, cpu, wire = run(codec_name, workload, items)
+                baseline = baseline or wire
+                print(f"{workload:<14} {codec_name or 'no':<8} {len(items) / elapsed:10.0f} "
+                      f"{wire / elapsed / (1024 * 1024):8.1f} {cpu:8.2f} {wire / 1024:10.0f}KB "
+                      f"{wire / baseline:6.2f}")
@@ -0,0 +1,64 @@
+import argparse
+import contextlib
+import io
+import os
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Sin ventana: se puede ejecutar en un servidor
+
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtWidgets import QApplication
+
+from view.chat_view import ChatView
+
+# Mide cuántos mensajes por segundo muestra la ventana del chat ante una ráfaga:
+#   python -m benchmarks.gui_burst --messages 500
+# Un hilo entrega los mensajes como lo hace el hilo de red del controlador y se espera, procesando
+# eventos, a que estén todos en la lista y pintados. Se comparan dos formas de entregarlos:
+#   - por mensaje: una señal new_message_signal por mensaje (un aviso, una inserción, un
+#     desplazamiento y un sonido por mensaje)
+#   - por lotes: queue_incoming, que agrupa lo que llega mientras la interfaz está ocupada
+# Con QT_QPA_PLATFORM=offscreen (por defecto) no se abre ninguna ventana.
+
+
+def run(app, view, messages, deliver):
+    """Entrega `messages` desde otro hilo; devuelve (segundos hasta verlos pintados, avisos a la interfaz)."""
+    view.timeline_model.reset_entries()
+    notices = [0]
+    count_notice = lambda *args: notices.__setitem__(0, notices[0] + 1)
+    view.new_message_signal.connect(count_notice)
+    view.incoming_ready.connect(count_notice)
+
+    start = time.perf_counter()
+    producer = threading.Thread(target=lambda: [deliver(msg, None) for msg in messages])
+    producer.start()
+    while view.timeline_model.rowCount() < len(messages):
+        app.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents, 50)
+    view.timeline_view.viewport().repaint()  # La última pantalla, ya pintada
+    elapsed = time.perf_counter() - start
+    producer.join()
+
+    view.new_message_signal.disconnect(count_notice)
+    view.incoming_ready.disconnect(count_notice)
+    return elapsed, notices[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mensajes por segundo que muestra la interfaz en una ráfaga")
+    parser.add_argument("--messages", type=int, default=500, help="Mensajes de la ráfaga (por defecto: 500)")
+    parser.add_argument("--rounds", type=int, default=3, help="Repeticiones de cada forma (por defecto: 3)")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    with contextlib.redirect_stdout(io.StringIO()):  # Silencia los avisos del sonido de notificación
+        view = ChatView("bench")
+    view.show()
+    messages = [f"otro: mensaje {i} de la ráfaga" for i in range(args.messages)]
+
+    print(f"{'entrega':<12} {'msgs/s':>10} {'avisos':>8}")
+    for name, deliver in (("por mensaje", view.new_message_signal.emit), ("por lotes", view.queue_incoming)):
+        for _ in range(args.rounds):
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, notices = run(app, view, messages, deliver)
+            print(f"{name:<12} {len(messages) / elapsed:10.0f} {notices:8d}")
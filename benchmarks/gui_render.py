@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Sin ventana: se puede ejecutar en un servidor
+
+from PyQt5.QtCore import QEventLoop, QTimer, Qt
+from PyQt5.QtWidgets import QApplication
+
+from model.chat_model import ImageMessage
+from view.chat_view import ChatView
+
+# Coste de mostrar mensajes en la ventana del chat:
+#   python -m benchmarks.gui_render --texts 5000 --images 500 --json render.json
+# Un hilo entrega textos sintéticos y luego imágenes (ImageMessage con un PNG en memoria, como las
+# que llegan de la red) a ChatView, por new_message_signal (un aviso por mensaje) o, con
+# --delivery batched, por queue_incoming (por lotes, como hace el controlador). Para cada carga:
+#   - coste de inserción por mensaje: lo que tarda display_message (o display_messages, repartido
+#     entre los mensajes del lote) en el hilo de la interfaz
+#   - bloqueos del bucle de eventos: un temporizador de 5ms anota el tiempo entre ticks; un hueco
+#     de más de 50ms es un bloqueo que el usuario nota
+#   - widgets vivos y memoria residente (RSS) antes y después
+# Se espera a que los mensajes estén en la lista, pintados y con las imágenes visibles decodificadas.
+
+HEARTBEAT_MS = 5
+STALL_THRESHOLD_MS = 50
+WAIT_TIMEOUT = 300
+WORDS = ("hola", "vale", "mañana", "servidor", "imagen", "enviado", "gracias", "reunión", "archivo", "luego")
+
+
+def percentile(sorted_values, p):
+    """Percentil `p` (0-100) por rango más cercano de una lista ordenada."""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def rss_bytes():
+    """Memoria residente actual del proceso (en Linux; si no, el pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def synthetic_texts(count):
+    rng = random.Random(1)
+    texts = []
+    for i in range(count):
+        lines = [" ".join(rng.choices(WORDS, k=rng.randint(2, 14))) for _ in range(rng.choice((1, 1, 1, 2, 4)))]
+        texts.append(f"otro: {i} " + "\n".join(lines))
+    return texts
+
+
+def synthetic_images(count, distinct=20):
+    """`count` imágenes recibidas; hay `distinct` PNG distintos, pero cada mensaje tiene su propia
+    clave, así que todas se decodifican."""
+    from PIL import Image
+
+    pngs = []
+    for i in range(distinct):
+        buffer = io.BytesIO()
+        Image.effect_noise((400, 300), 20 + i).convert("RGB").save(buffer, format="PNG")
+        pngs.append(buffer.getvalue())
+    return [ImageMessage(pngs[i % distinct], "PNG", 400, 300, "otro", digest=f"bench-{time.time_ns()}-{i}")
+            for i in range(count)]
+
+
+class StallMonitor:
+    """Temporizador del bucle de eventos: anota el tiempo entre ticks."""
+
+    def __init__(self):
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(HEARTBEAT_MS)
+        self.timer.timeout.connect(self.tick)
+        self.gaps = []
+        self.last = 0
+
+    def start(self):
+        self.gaps = []
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.gaps.append((now - self.last) * 1000)
+        self.last = now
+
+    def stop(self):
+        self.timer.stop()
+        self.tick()  # Hasta el final de la medida
+
+    def summary(self):
+        gaps = sorted(self.gaps)
+        stalls = [gap for gap in gaps if gap > STALL_THRESHOLD_MS]
+        return {
+            "max_gap_ms": gaps[-1],
+            "p99_gap_ms": percentile(gaps, 99),
+            "stalls": len(stalls),
+            "stalled_ms": sum(stalls),
+        }
+
+
+def wait_until(app, condition):
+    deadline = time.perf_counter() + WAIT_TIMEOUT
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("La interfaz no terminó de mostrar los mensajes")
+        app.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents, 20)
+
+
+def run(app, view, monitor, messages, delivery, rate):
+    """Entrega `messages` desde otro hilo y mide lo que cuesta mostrarlos."""
+    view.timeline_model.reset_entries()
+    app.processEvents()
+    costs = []
+    if delivery == "signal":
+        handler = "display_message"
+        deliver = view.new_message_signal.emit
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            original(*args, **kwargs)
+            costs.append(time.perf_counter_ns() - start)
+    else:
+        handler = "display_messages"
+        deliver = view.queue_incoming
+
+        def timed(batch):
+            start = time.perf_counter_ns()
+            original(batch)
+            costs.extend([(time.perf_counter_ns() - start) / len(batch)] * len(batch))
+    original = getattr(view, handler)
+    setattr(view, handler, timed)  # Las señales llaman al método por su nombre en cada aviso
+
+    def produce():
+        for msg in messages:
+            deliver(msg, None)
+            if rate:
+                time.sleep(1 / rate)
+
+    widgets_before = len(QApplication.allWidgets())
+    rss_before = rss_bytes()
+    monitor.start()
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce)
+    producer.start()
+    try:
+        wait_until(app, lambda: view.timeline_model.rowCount() >= len(messages))
+        view.timeline_view.viewport().repaint()
+        wait_until(app, lambda: not view.loading_images)  # Imágenes visibles decodificadas y pintadas
+        view.timeline_view.viewport().repaint()
+    finally:
+        elapsed = time.perf_counter() - start
+        monitor.stop()
+        producer.join()
+        delattr(view, handler)
+
+    costs.sort()
+    return {
+        "messages": len(messages),
+        "delivery": delivery,
+        "seconds": elapsed,
+        "msgs_per_s": len(messages) / elapsed,
+        "insert_us": {
+            "p50": percentile(costs, 50) / 1000,
+            "p99": percentile(costs, 99) / 1000,
+            "mean": sum(costs) / len(costs) / 1000,
+            "max": costs[-1] / 1000,
+        },
+        "event_loop": monitor.summary(),
+        "widgets": {"before": widgets_before, "after": len(QApplication.allWidgets())},
+        "rss_growth_mb": (rss_bytes() - rss_before) / (1024 * 1024),
+    }
+
+
+def print_summary(results):
+    print(f"{'carga':<10} {'entrega':<8} {'msgs/s':>8} {'ins. p50':>9} {'ins. p99':>9} {'máx. hueco':>11} "
+          f"{'bloqueado':>10} {'widgets':>9} {'RSS':>8}")
+    for name, result in results["workloads"].items():
+        insert, loop, widgets = result["insert_us"], result["event_loop"], result["widgets"]
+        print(f"{name:<10} {result['delivery']:<8} {result['msgs_per_s']:8.0f} {insert['p50']:7.0f}us "
+              f"{insert['p99']:7.0f}us {loop['max_gap_ms']:9.0f}ms {loop['stalled_ms']:8.0f}ms "
+              f"{widgets['before']:>4}>{widgets['after']:<4} {result['rss_growth_mb']:+6.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coste de mostrar mensajes en ChatView (sin ventana)")
+    parser.add_argument("--texts", type=int, default=5000, help="Textos a mostrar (por defecto: 5000)")
+    parser.add_argument("--images", type=int, default=500, help="Imágenes a mostrar (por defecto: 500)")
+    parser.add_argument("--delivery", choices=("signal", "batched"), default="signal",
+                        help="signal: new_message_signal por mensaje; batched: queue_incoming (por defecto: signal)")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Mensajes por segundo que entrega el hilo (por defecto: 0, sin pausa)")
+    parser.add_argument("--json", metavar="RUTA", help="Escribe los resultados en JSON en RUTA ('-' para la salida estándar)")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    with contextlib.redirect_stdout(io.StringIO()):  # Silencia los avisos del sonido de notificación
+        view = ChatView("bench")
+    view.show()
+    monitor = StallMonitor()
+    workloads = {"textos": synthetic_texts(args.texts), "imágenes": synthetic_images(args.images)}
+
+    results = {"benchmark": "gui_render", "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+               "platform": os.environ["QT_QPA_PLATFORM"], "workloads": {}}
+    for name, messages in workloads.items():
+        if messages:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["workloads"][name] = run(app, view, monitor, messages, args.delivery, args.rate)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,247 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from model.chat_model import ChatModel, ImageMessage, PROTOCOL_VERSION
+from model.chat_server import ChatServer
+
+# Rendimiento del protocolo de ChatModel, sin Qt:
+#   python -m benchmarks.protocol --json resultados.json
+# Un cliente envía y otro recibe, en este mismo proceso (el reloj de ambos es el mismo, así que la
+# latencia de un sentido se mide directamente). Transportes:
+#   - server: un ChatServer en loopback entre los dos clientes (el camino real de un mensaje)
+#   - socketpair: los dos ChatModel unidos directamente por un socketpair, sin servidor. Mide solo
+#     la codificación y decodificación del cliente; las imágenes necesitan al servidor (NEED/FETCH)
+#     y no se miden con este transporte.
+# Cargas:
+#   - textos: ráfaga de textos cortos (mensajes/s y latencia con la cola llena) y textos de uno en
+#     uno, esperando a que llegue cada uno (latencia p50/p99 sin carga)
+#   - imágenes: PNG de ruido distintos de varias resoluciones (MB/s). Caben en 800x600, así que se
+#     envían tal cual desde el disco, con su vista previa si pasan de 32KB.
+# Los resultados se escriben en JSON (--json) para comparar una ejecución con otra. No se usa
+# compresión: los textos cortos no se comprimen y las imágenes nunca.
+
+RECEIVE_TIMEOUT = 120
+TEXT_PADDING = "x" * 24  # Textos de ~50 bytes, como un mensaje de chat corto
+
+
+def percentile(sorted_values, p):
+    """Percentil `p` (0-100) por rango más cercano de una lista ordenada."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def latency_summary(latencies_ns):
+    values = sorted(latencies_ns)
+    return {
+        "samples": len(values),
+        "p50_us": percentile(values, 50) / 1000,
+        "p99_us": percentile(values, 99) / 1000,
+        "mean_us": sum(values) / len(values) / 1000,
+        "max_us": values[-1] / 1000,
+    }
+
+
+def noise_images(resolution, count, directory):
+    from PIL import Image  # Solo hace falta para esta carga
+
+    width, height = resolution
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"ruido_{width}x{height}_{i}.png")
+        Image.effect_noise((width, height), 20 + i).convert("RGB").save(path)
+        paths.append(path)
+    return paths
+
+
+class Endpoints:
+    """Emisor y receptor conectados por el transporte elegido. Lo recibido va a `received` como
+    (instante de llegada en ns, mensaje)."""
+
+    def __init__(self, transport):
+        self.server = None
+        self.received = queue.Queue()
+        self.sender = ChatModel("bench", compression=[])
+        self.receiver = ChatModel("otro", compression=[])
+        if transport == "server":
+            self.server = ChatServer("127.0.0.1", 0)
+            self.server.start()
+            port = self.server.listen_sock.getsockname()[1]
+            self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.server_thread.start()
+            self.sender.start_client("127.0.0.1", port)
+            self.receiver.start_client("127.0.0.1", port)
+            # El emisor también tiene que leer: el servidor le pide el contenido de las imágenes (NEED)
+            threading.Thread(target=self._drain_loop, daemon=True).start()
+        else:
+            sender_sock, receiver_sock = socket.socketpair()
+            self.sender.use_socket(sender_sock)
+            self.receiver.use_socket(receiver_sock)
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        time.sleep(0.1)  # Ambos clientes registrados en el servidor antes de empezar
+
+    def _receive_loop(self):
+        while True:
+            try:
+                msg = self.receiver.receive_message()
+            except (OSError, ConnectionError):
+                return
+            if isinstance(msg, (str, ImageMessage)):
+                self.received.put((time.perf_counter_ns(), msg))
+
+    def _drain_loop(self):
+        while True:
+            try:
+                self.sender.receive_message()
+            except (OSError, ConnectionError):
+                return
+
+    def wait(self):
+        try:
+            return self.received.get(timeout=RECEIVE_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("No llegaron todos los mensajes") from None
+
+    def close(self):
+        self.sender.close()
+        self.receiver.close()
+        if self.server:
+            self.server.stop()
+            self.server_thread.join()
+
+
+def text_burst(endpoints, count):
+    """Envía `count` textos seguidos; devuelve (segundos hasta recibirlos todos, latencias en ns)."""
+    start = time.perf_counter_ns()
+    for i in range(count):
+        endpoints.sender.send_message(f"bench: {i} {time.perf_counter_ns()} {TEXT_PADDING}")
+    latencies = []
+    for _ in range(count):
+        arrived, msg = endpoints.wait()
+        latencies.append(arrived - int(msg.split()[2]))
+    return (time.perf_counter_ns() - start) / 1e9, latencies
+
+
+def text_paced(endpoints, count):
+    """Envía `count` textos de uno en uno, esperando a cada uno; devuelve las latencias en ns."""
+    latencies = []
+    for i in range(count):
+        sent = time.perf_counter_ns()
+        endpoints.sender.send_message(f"bench: {i} {sent} {TEXT_PADDING}")
+        arrived, _ = endpoints.wait()
+        latencies.append(arrived - sent)
+    return latencies
+
+
+def image_transfer(endpoints, paths):
+    """Envía las imágenes y espera a recibirlas todas; devuelve los segundos que tarda."""
+    start = time.perf_counter()
+    for path in paths:
+        endpoints.sender.send_message("IMG:" + path)
+    for _ in paths:
+        endpoints.wait()
+    return time.perf_counter() - start
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    resolutions = [tuple(int(side) for side in size.split("x")) for size in args.image_sizes.split(",") if size]
+    results = {
+        "benchmark": "protocol",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "protocol_version": PROTOCOL_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "transport": args.transport,
+        "texts": None,
+        "images": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as temp_dir:
+        images = {resolution: noise_images(resolution, args.images, temp_dir)
+                  for resolution in (resolutions if args.transport == "server" else [])}
+
+        with contextlib.redirect_stdout(io.StringIO()):  # Silencia los [DEBUG] de servidor y clientes
+            endpoints = Endpoints(args.transport)
+            try:
+                text_paced(endpoints, min(args.warmup, args.messages))  # Calentamiento: no se cuenta
+                seconds, burst_latencies = text_burst(endpoints, args.messages)
+                paced_latencies = text_paced(endpoints, args.latency_samples)
+                results["texts"] = {
+                    "messages": args.messages,
+                    "seconds": seconds,
+                    "msgs_per_s": args.messages / seconds,
+                    "latency_burst": latency_summary(burst_latencies),
+                    "latency": latency_summary(paced_latencies),
+                }
+                for (width, height), paths in images.items():
+                    total = sum(os.path.getsize(path) for path in paths)
+                    seconds = image_transfer(endpoints, paths)
+                    results["images"].append({
+                        "resolution": f"{width}x{height}",
+                        "images": len(paths),
+                        "bytes": total,
+                        "seconds": seconds,
+                        "mb_per_s": total / seconds / (1024 * 1024),
+                    })
+            finally:
+                endpoints.close()
+    return results
+
+
+def print_summary(results):
+    texts = results["texts"]
+    print(f"transporte: {results['transport']}  revisión: {results['revision'] or '?'}")
+    print(f"textos: {texts['msgs_per_s']:.0f} msgs/s ({texts['messages']} en ráfaga)")
+    for name, key in (("sin carga", "latency"), ("en ráfaga", "latency_burst")):
+        latency = texts[key]
+        print(f"latencia {name}: p50 {latency['p50_us']:.0f} us, p99 {latency['p99_us']:.0f} us "
+              f"({latency['samples']} muestras)")
+    for image in results["images"]:
+        print(f"imágenes {image['resolution']:>9}: {image['mb_per_s']:7.1f} MB/s "
+              f"({image['images']} de {image['bytes'] / image['images'] / 1024:.0f}KB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendimiento del protocolo de ChatModel (sin interfaz)")
+    parser.add_argument("--transport", choices=("server", "socketpair"), default="server",
+                        help="server: ChatServer en loopback; socketpair: clientes unidos directamente (por defecto: server)")
+    parser.add_argument("--messages", type=int, default=5000, help="Textos de la ráfaga (por defecto: 5000)")
+    parser.add_argument("--latency-samples", type=int, default=1000,
+                        help="Textos enviados de uno en uno para medir la latencia (por defecto: 1000)")
+    parser.add_argument("--warmup", type=int, default=200, help="Textos de calentamiento (por defecto: 200)")
+    parser.add_argument("--image-sizes", default="128x128,400x300,800x600",
+                        help="Resoluciones de las imágenes (por defecto: 128x128,400x300,800x600)")
+    parser.add_argument("--images", type=int, default=10, help="Imágenes de cada resolución (por defecto: 10)")
+    parser.add_argument("--json", metavar="RUTA", help="Escribe los resultados en JSON en RUTA ('-' para la salida estándar)")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,119 @@
+import argparse
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import tracemalloc
+
+from model.chat_model import (ChatModel, TransferOffer, IncomingTransfer, encode_frame, read_frame,
+                              MSG_TRANSFER_OFFER, MSG_TRANSFER_CHUNK, CHUNK_HEADER, CHUNK_SIZE,
+                              TRANSFER_IMAGE, SPOOL_THRESHOLD)
+
+# Mide cuánta memoria reserva la recepción de imágenes por cada MB recibido:
+#   python -m benchmarks.recv_alloc --images 32 --size-mb 2
+# Se envían imágenes por un par de sockets locales y se recibe con dos rutas:
+#   - receive_message: la del cliente (FrameReader con buffers reutilizables, trozos recibidos
+#     directamente en el buffer de la imagen)
+#   - read_frame: un buffer nuevo por trama y copia del trozo al buffer de la imagen (referencia)
+# Con tracemalloc se suma, para cada lectura, el pico de memoria reservada por encima de la que
+# había al empezar. El buffer final de cada imagen en memoria se reserva en cualquier caso (1MB por
+# MB): se muestra también lo reservado aparte de él, que es el coste de la ruta de recepción. Las
+# imágenes de más de 4MB se reciben en un fichero temporal y no tienen ese buffer.
+
+
+def build_stream(images, size):
+    """Tramas de `images` imágenes de `size` bytes, ya codificadas en un único bloque."""
+    parts = []
+    data = os.urandom(size)
+    digest = hashlib.sha256(data).hexdigest()
+    for transfer_id in range(1, images + 1):
+        offer = TransferOffer(transfer_id, TRANSFER_IMAGE, "PNG", 1, 1, size, digest, "bench")
+        parts.append(encode_frame(MSG_TRANSFER_OFFER, offer.pack()))
+        for offset in range(0, size, CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            parts.append(encode_frame(MSG_TRANSFER_CHUNK, CHUNK_HEADER.pack(transfer_id, offset) + chunk))
+    return b"".join(parts)
+
+
+def measure(receive_one, images):
+    """Llama a `receive_one` hasta completar `images` imágenes; devuelve los bytes reservados."""
+    allocated = 0
+    completed = 0
+    while completed < images:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        if receive_one() is not None:
+            completed += 1
+        allocated += max(0, tracemalloc.get_traced_memory()[1] - before)
+    return allocated
+
+
+def run_receive_message(sock, images):
+    model = ChatModel("bench")
+    model.use_socket(sock)
+    try:
+        return measure(model.receive_message, images)
+    finally:
+        model.close()
+
+
+def run_read_frame(sock, images):
+    with tempfile.TemporaryDirectory(prefix="bench_") as temp_dir:
+        return _run_read_frame(sock, images, temp_dir)
+
+
+def _run_read_frame(sock, images, temp_dir):
+    transfers = {}
+
+    def receive_one():
+        msg_type, flags, msg_id, payload = read_frame(sock)
+        if msg_type == MSG_TRANSFER_OFFER:
+            offer = TransferOffer.unpack(payload)
+            transfers[offer.transfer_id] = IncomingTransfer(offer, temp_dir)
+            return None
+        transfer_id, offset = CHUNK_HEADER.unpack_from(payload)
+        transfer = transfers[transfer_id]
+        transfer.write(offset, memoryview(payload)[CHUNK_HEADER.size:])
+        if not transfer.is_complete():
+            return None
+        del transfers[transfer_id]
+        image = transfer.finish()
+        if image.path:
+            os.unlink(image.path)
+        return image
+
+    return measure(receive_one, images)
+
+
+def run(name, receiver, stream, images, size):
+    receiving, sending = socket.socketpair()
+    # Un único sendall desde otro hilo: el emisor apenas reserva memoria durante la medida
+    sender = threading.Thread(target=sending.sendall, args=(stream,), daemon=True)
+    tracemalloc.start()
+    sender.start()
+    try:
+        allocated = receiver(receiving, images)
+    finally:
+        tracemalloc.stop()
+        sender.join()
+        receiving.close()
+        sending.close()
+
+    mb = images * size / (1024 * 1024)
+    extra = allocated - (images * size if size <= SPOOL_THRESHOLD else 0)
+    print(f"{name:<16} {mb:8.1f} MB  {allocated / mb / 1024:10.1f} KB/MB  "
+          f"{extra / mb / 1024:10.1f} KB/MB sin el buffer de la imagen")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memoria reservada por MB recibido")
+    parser.add_argument("--images", type=int, default=32, help="Imágenes a recibir (por defecto: 32)")
+    parser.add_argument("--size-mb", type=float, default=2,
+                        help="Tamaño de cada imagen en MB (por defecto: 2, por debajo del umbral de fichero temporal)")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    stream = build_stream(args.images, size)
+    run("receive_message", run_receive_message, stream, args.images, size)
+    run("read_frame", run_read_frame, stream, args.images, size)
@@ -0,0 +1,59 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Mide el arranque en frío de la aplicación hasta que se muestra la ventana de login:
+#   python -m benchmarks.startup --rounds 5
+# Cada ronda lanza main.py en un proceso nuevo con CHAT_STARTUP_REPORT=exit (se cierra nada más
+# mostrar la ventana) y `python -X importtime`. Se informa del tiempo hasta la primera ventana
+# (mediana) y del desglose de imports por paquete, con el tiempo acumulado de cada import de primer
+# nivel. Con QT_QPA_PLATFORM=offscreen (por defecto) no se abre ninguna ventana.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+FIRST_WINDOW = re.compile(r"Primera ventana en ([\d.]+) ms")
+
+
+def run_once():
+    """Arranca la aplicación una vez; devuelve (ms hasta la ventana, {paquete: ms de import}, informe)."""
+    env = dict(os.environ, CHAT_STARTUP_REPORT="exit")
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    result = subprocess.run([sys.executable, "-X", "importtime", "main.py"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    match = FIRST_WINDOW.search(result.stdout)
+    if not match:
+        raise RuntimeError(f"La aplicación no informó del arranque:\n{result.stdout}{result.stderr}")
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        parsed = IMPORT_LINE.match(line)
+        if parsed and len(parsed.group(3)) == 1:  # Import de primer nivel (los anidados ya van en su acumulado)
+            package = parsed.group(4).split(".")[0]
+            imports[package] = imports.get(package, 0) + int(parsed.group(2)) / 1000
+    report = [line for line in result.stdout.splitlines() if line.startswith("[DEBUG]")]
+    return float(match.group(1)), imports, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de arranque hasta la ventana de login")
+    parser.add_argument("--rounds", type=int, default=5, help="Arranques a medir (por defecto: 5)")
+    parser.add_argument("--top", type=int, default=10, help="Paquetes del desglose de imports (por defecto: 10)")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.rounds)]
+    times = [first_window for first_window, _, _ in runs]
+    print(f"Primera ventana: mediana {statistics.median(times):.1f} ms "
+          f"(mín. {min(times):.1f}, máx. {max(times):.1f}, {args.rounds} arranques)")
+    for line in runs[-1][2][1:]:
+        print(line.replace("[DEBUG] ", ""))
+
+    packages = {}
+    for _, imports, _ in runs:
+        for package, ms in imports.items():
+            packages.setdefault(package, []).append(ms)
+    print(f"\n{'import':<28} {'ms':>8}")
+    for package, values in sorted(packages.items(), key=lambda item: -statistics.median(item[1]))[:args.top]:
+        print(f"{package:<28} {statistics.median(values):8.1f}")
@@ -0,0 +1,339 @@
+import argparse
+import contextlib
+import heapq
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from model.chat_model import ChatModel, ImageMessage, ImagePreview
+from model.metrics import Histogram
+
+# Generador de carga para dimensionar el servidor: N clientes sin interfaz que hablan el mismo
+# protocolo que la aplicación (son ChatModel conectados con start_client), todo en esta máquina:
+#   python -m benchmarks.swarm --clients 50 --processes 4 --duration 30 --rate 2 --image-ratio 0.1
+# Por defecto arranca un servidor propio (`python -m server`) en un puerto libre de 127.0.0.1; con
+# --connect se usa uno ya en marcha (y con --server-pid se miden su CPU y su memoria).
+# Los clientes se reparten entre varios procesos para que el GIL del generador no sea el cuello de
+# botella. Cada cliente envía mensajes a intervalos aleatorios (llegadas de Poisson) con el ritmo
+# medio de --rate; una fracción (--image-ratio) son imágenes de --image-kb KB, todas distintas (el
+# servidor no puede ahorrarse la subida). Cada mensaje lleva el instante en que se envió
+# (time.monotonic_ns, común a todos los procesos de la máquina) y quien lo recibe anota la
+# latencia de reparto: desde que el emisor llama a send_message hasta que le llega a cada receptor.
+# Se informa del rendimiento total, la distribución de latencias, los errores y desconexiones, y la
+# CPU y memoria del servidor.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_START_TIMEOUT = 10
+SAMPLE_INTERVAL = 1.0  # Segundos entre muestras de CPU y memoria del servidor
+STAMP_SIZE = 8         # Las imágenes terminan con el instante de envío (ns, big-endian)
+
+
+def png_base():
+    """PNG pequeño al que se añaden bytes para alcanzar el tamaño pedido (PIL solo lee la cabecera)."""
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 64), 30).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    process = subprocess.Popen([sys.executable, "-m", "server", "--host", "127.0.0.1", "--port", str(port),
+                                "--backlog", "1024"], cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("El servidor no arrancó a tiempo")
+
+
+def process_usage(pid):
+    """(segundos de CPU, bytes de memoria residente) de un proceso, leídos de /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+class SwarmClient:
+    """Un cliente de la carga: un ChatModel, su hilo de recepción y sus contadores."""
+
+    def __init__(self, name, compression, stats_from):
+        self.model = ChatModel(name, compression=compression)
+        self.stats_from = stats_from  # Lo enviado antes (p. ej. el historial del servidor) no cuenta
+        self.latency = Histogram()
+        self.sent = {"texts": 0, "images": 0}
+        self.received = {"texts": 0, "images": 0, "previews": 0}
+        self.errors = {"connect": 0, "send": 0, "receive": 0}
+        self.disconnects = 0
+        self.reconnects = 0
+        self.model.on_send_error = lambda msg_id, error: self._count_error("send")
+        self.model.on_connection_state = self._connection_state
+
+    def _count_error(self, kind):
+        self.errors[kind] += 1
+
+    def _connection_state(self, connected):
+        if connected:
+            self.reconnects += 1
+        else:
+            self.disconnects += 1
+
+    def connect(self, address):
+        try:
+            self.model.start_client(*address)
+        except OSError:
+            self.errors["connect"] += 1
+            return False
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        return True
+
+    def _receive_loop(self):
+        while True:
+            try:
+                msg = self.model.receive_message()
+            except Exception:
+                if not self.model.closed.is_set():
+                    self.errors["receive"] += 1
+                return
+            now = time.monotonic_ns()
+            if isinstance(msg, str):
+                parts = msg.split(" ", 2)
+                stamp, kind = (int(parts[1]), "texts") if len(parts) > 1 and parts[1].isdigit() else (0, None)
+            elif isinstance(msg, ImageMessage):
+                stamp, kind = image_stamp(msg), "images"
+            else:
+                if isinstance(msg, ImagePreview):
+                    self.received["previews"] += 1
+                continue
+            if kind and stamp >= self.stats_from:
+                self.received[kind] += 1
+                self.latency.record((now - stamp) / 1000)
+
+    def send_text(self, padding):
+        self.model.send_message(f"{self.model.username}: {time.monotonic_ns()} {padding}")
+        self.sent["texts"] += 1
+
+    def send_image(self, path, base, padding):
+        with open(path, "wb") as f:
+            f.write(base)
+            f.write(padding)
+            f.write(time.monotonic_ns().to_bytes(STAMP_SIZE, "big"))
+        self.model.send_message("IMG:" + path)
+        self.sent["images"] += 1
+
+    def bytes_in(self):
+        return self.model.reader.bytes_read if self.model.reader else 0
+
+
+def image_stamp(image):
+    if image.path:
+        with open(image.path, "rb") as f:
+            f.seek(-STAMP_SIZE, os.SEEK_END)
+            return int.from_bytes(f.read(STAMP_SIZE), "big")
+    return int.from_bytes(bytes(image.data[-STAMP_SIZE:]), "big")
+
+
+def run_worker(index, count, args, address, barrier, results):
+    """Proceso de carga: conecta `count` clientes, envía durante args.duration y devuelve sus contadores."""
+    sys.stdout = open(os.devnull, "w")  # Silencia los [DEBUG] de los clientes
+    rng = random.Random(index)
+    started = time.monotonic_ns()
+    clients = [SwarmClient(f"carga{index}-{i}", args.compression, started) for i in range(count)]
+    connected = [client for client in clients if client.connect(address)]
+    text_padding = "x" * max(0, args.text_size - 40)
+    base = png_base()
+    image_padding = os.urandom(max(0, args.image_kb * 1024 - len(base) - STAMP_SIZE))
+    barrier.wait()  # Todos los procesos conectados: empieza la medida
+
+    with tempfile.TemporaryDirectory(prefix="swarm_") as temp_dir:
+        start = time.monotonic()
+        bytes_before = sum(client.bytes_in() for client in connected)
+        # Próximo envío de cada cliente; llegadas de Poisson con el ritmo medio pedido
+        schedule = [(start + rng.expovariate(args.rate), i) for i in range(len(connected))] if args.rate else []
+        heapq.heapify(schedule)
+        images = 0
+        while schedule:
+            when, i = heapq.heappop(schedule)
+            if when - start >= args.duration:
+                break
+            time.sleep(max(0.0, when - time.monotonic()))
+            client = connected[i]
+            try:
+                if rng.random() < args.image_ratio:
+                    images += 1
+                    client.send_image(os.path.join(temp_dir, f"{i}_{images}.png"), base, image_padding)
+                else:
+                    client.send_text(text_padding)
+            except Exception:
+                client.errors["send"] += 1
+            heapq.heappush(schedule, (when + rng.expovariate(args.rate), i))
+        time.sleep(max(0.0, start + args.duration - time.monotonic()) + args.drain)  # Lo que aún está en camino
+        bytes_in = sum(client.bytes_in() for client in connected) - bytes_before
+
+        latency = Histogram()
+        totals = {"sent": {}, "received": {}, "errors": {}, "disconnects": 0, "reconnects": 0}
+        for client in clients:
+            latency.merge(client.latency)
+            for key in ("sent", "received", "errors"):
+                for name, value in getattr(client, key).items():
+                    totals[key][name] = totals[key].get(name, 0) + value
+            totals["disconnects"] += client.disconnects
+            totals["reconnects"] += client.reconnects
+            with contextlib.suppress(Exception):
+                client.model.close()
+    totals.update(clients=len(connected), bytes_in=bytes_in, latency=latency)
+    results.put(totals)
+
+
+def run(args):
+    server = None
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        address, server_pid = (host, int(port)), args.server_pid
+    else:
+        port = free_port()
+        server = start_server(port)
+        address, server_pid = ("127.0.0.1", port), server.pid
+
+    processes = max(1, min(args.processes, args.clients))
+    barrier = multiprocessing.Barrier(processes + 1)
+    results = multiprocessing.Queue()
+    workers = []
+    for index in range(processes):
+        count = args.clients // processes + (1 if index < args.clients % processes else 0)
+        worker = multiprocessing.Process(target=run_worker, args=(index, count, args, address, barrier, results))
+        worker.start()
+        workers.append(worker)
+
+    samples = []
+    try:
+        barrier.wait(timeout=60)
+        start = time.monotonic()
+        if server_pid:
+            last_cpu, _ = process_usage(server_pid)
+            last = start
+            while time.monotonic() - start < args.duration + args.drain:
+                time.sleep(SAMPLE_INTERVAL)
+                cpu, rss = process_usage(server_pid)
+                now = time.monotonic()
+                samples.append(((cpu - last_cpu) / (now - last) * 100, rss))
+                last_cpu, last = cpu, now
+        totals = [results.get(timeout=args.duration + args.drain + 60) for _ in workers]
+    finally:
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+    return summarize(args, totals, samples)
+
+
+def summarize(args, totals, samples):
+    latency = Histogram()
+    sent, received, errors = {}, {}, {}
+    for worker in totals:
+        latency.merge(worker["latency"])
+        for target, values in ((sent, worker["sent"]), (received, worker["received"]), (errors, worker["errors"])):
+            for name, value in values.items():
+                target[name] = target.get(name, 0) + value
+    clients = sum(worker["clients"] for worker in totals)
+    messages_sent = sent.get("texts", 0) + sent.get("images", 0)
+    deliveries = received.get("texts", 0) + received.get("images", 0)
+    return {
+        "benchmark": "swarm",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "parameters": {name: value for name, value in vars(args).items() if name not in ("json",)},
+        "clients_connected": clients,
+        "sent": sent,
+        "received": received,
+        "throughput": {
+            "sent_msgs_per_s": messages_sent / args.duration,
+            "delivered_msgs_per_s": deliveries / args.duration,
+            "received_mb_per_s": sum(worker["bytes_in"] for worker in totals) / args.duration / (1024 * 1024),
+        },
+        # Cada mensaje debería llegar a todos los demás clientes conectados
+        "undelivered": max(0, messages_sent * max(0, clients - 1) - deliveries),
+        "latency_ms": {f"p{p}": latency.percentile(p) / 1000 if latency.count else None
+                       for p in (50, 90, 99, 99.9)} | {"max": latency.max / 1000, "samples": latency.count},
+        "errors": errors,
+        "disconnects": sum(worker["disconnects"] for worker in totals),
+        "reconnects": sum(worker["reconnects"] for worker in totals),
+        "server": {
+            "cpu_percent_mean": sum(cpu for cpu, _ in samples) / len(samples),
+            "cpu_percent_max": max(cpu for cpu, _ in samples),
+            "rss_mb_max": max(rss for _, rss in samples) / (1024 * 1024),
+            "rss_mb_last": samples[-1][1] / (1024 * 1024),
+        } if samples else None,
+    }
+
+
+def print_summary(results):
+    throughput, latency = results["throughput"], results["latency_ms"]
+    print(f"clientes conectados: {results['clients_connected']}")
+    print(f"enviados: {results['sent']}  recibidos: {results['received']}")
+    print(f"rendimiento: {throughput['sent_msgs_per_s']:.0f} msgs/s enviados, "
+          f"{throughput['delivered_msgs_per_s']:.0f} entregas/s, {throughput['received_mb_per_s']:.1f} MB/s recibidos")
+    if latency["samples"]:
+        print(f"latencia de reparto: p50 {latency['p50']:.1f} ms, p90 {latency['p90']:.1f} ms, "
+              f"p99 {latency['p99']:.1f} ms, p99.9 {latency['p99.9']:.1f} ms, máx. {latency['max']:.1f} ms "
+              f"({latency['samples']} entregas)")
+    print(f"sin entregar: {results['undelivered']}  errores: {results['errors']}  "
+          f"desconexiones: {results['disconnects']}  reconexiones: {results['reconnects']}")
+    server = results["server"]
+    if server:
+        print(f"servidor: CPU media {server['cpu_percent_mean']:.0f}% (máx. {server['cpu_percent_max']:.0f}%), "
+              f"memoria máx. {server['rss_mb_max']:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de carga: clientes sin interfaz contra un servidor local")
+    parser.add_argument("--clients", type=int, default=20, help="Clientes simulados (por defecto: 20)")
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Procesos entre los que se reparten los clientes (por defecto: hasta 4)")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de carga (por defecto: 30)")
+    parser.add_argument("--drain", type=float, default=2,
+                        help="Segundos de espera al final para lo que aún está en camino (por defecto: 2)")
+    parser.add_argument("--rate", type=float, default=1, help="Mensajes por segundo de cada cliente (por defecto: 1)")
+    parser.add_argument("--image-ratio", type=float, default=0.05,
+                        help="Fracción de los mensajes que son imágenes (por defecto: 0.05)")
+    parser.add_argument("--text-size", type=int, default=80, help="Bytes de cada texto (por defecto: 80)")
+    parser.add_argument("--image-kb", type=int, default=100, help="KB de cada imagen (por defecto: 100)")
+    parser.add_argument("--compression", default=None,
+                        help="Códecs que ofrecen los clientes ('none' para ninguno; por defecto, como la aplicación)")
+    parser.add_argument("--connect", metavar="HOST:PUERTO", help="Usa un servidor ya en marcha en vez de arrancar uno")
+    parser.add_argument("--server-pid", type=int, help="PID del servidor de --connect, para medir su CPU y memoria")
+    parser.add_argument("--json", metavar="RUTA", help="Escribe los resultados en JSON en RUTA ('-' para la salida estándar)")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
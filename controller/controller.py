@@ -1,108 +1,233 @@
-from PyQt5.QtWidgets import QMessageBox
-from model.user_model import UserModel
-from model.chat_model import ChatModel
-from view.login_view import LoginView
-from view.chat_view import ChatView
-import threading
-import os
-
-class Controller:
-    def __init__(self, model, view):
-        self.model = model          # Modelo que almacena el nombre del usuario
-        self.view = view            # Vista de login
-        self.view.button.clicked.connect(self.start_chat)  # Conecta botón de login con el método start_chat
-
-        self.chat_view = None       # Se inicializará al pasar a la vista de chat
-        self.chat_model = None      # Modelo de red (cliente/servidor) para el chat
-
-    def start_chat(self):
-        """Maneja el inicio del chat: valida el nombre, establece conexión y abre la vista de chat."""
-        username = self.view.get_username()
-        if username.strip() == "":
-            # Muestra advertencia si el nombre está vacío
-            QMessageBox.warning(self.view, "Error", "Por favor, introduce un nombre.")
-            return
-
-        self.model.set_username(username)
-        print(f"[DEBUG] Nombre introducido: {self.model.get_username()}")
-
-        # Inicializa el modelo de chat con el nombre
-        self.chat_model = ChatModel(username)
-
-        # Intenta conectarse como cliente
-        try:
-            self.chat_model.start_client()
-            self.is_server = False
-            print("[DEBUG] Se ha conectado como cliente.")
-        except Exception as e:
-            # Si falla, inicia como servidor
-            print(f"[DEBUG] Fallo como cliente, iniciando como servidor: {e}")
-            try:
-                self.chat_model.start_server()
-                self.is_server = True
-                print("[DEBUG] Se ha iniciado como servidor.")
-            except Exception as e2:
-                # Si falla también como servidor, muestra error y termina
-                QMessageBox.warning(self.view, "Error", f"No se pudo iniciar como cliente ni como servidor:\nCliente: {e}\nServidor: {e2}")
-                return
-
-        # Cierra vista de login y abre la vista de chat
-        self.view.close()
-        self.chat_view = ChatView(username)
-
-        # Conecta los botones de enviar mensaje e imagen con sus funciones
-        self.chat_view.send_button.clicked.connect(self.send_message)
-        self.chat_view.image_button.clicked.connect(self.upload_image)
-        self.chat_view.show()
-
-        # Inicia hilo para recibir mensajes de forma continua
-        threading.Thread(target=self.receive_messages, daemon=True).start()
-
-    def send_message(self):
-        """Envía un mensaje de texto al otro usuario."""
-        msg = self.chat_view.get_message().strip()
-        if msg == "":
-            return
-
-        full_msg = f"{self.model.get_username()}: {msg}"
-        try:
-            self.chat_model.send_message(full_msg)            # Envía mensaje por red
-            self.chat_view.display_message(full_msg)          # Muestra mensaje localmente
-            self.chat_view.clear_input()                      # Limpia el campo de entrada
-        except Exception as e:
-            QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar el mensaje: {e}")
-
-    def upload_image(self):
-        """Permite seleccionar y enviar una imagen."""
-        try:
-            from PyQt5.QtWidgets import QFileDialog
-            file_path, _ = QFileDialog.getOpenFileName(
-                self.chat_view, "Seleccionar Imagen", "", "Imágenes (*.png *.jpg *.jpeg *.bmp *.gif)"
-            )
-            
-            if file_path:
-                if not os.path.exists(file_path):
-                    QMessageBox.warning(self.chat_view, "Error", "El archivo seleccionado no existe.")
-                    return
-
-                # Formato del mensaje de imagen
-                full_msg = f"{self.model.get_username()}: {file_path}"
-                try:
-                    self.chat_model.send_message(f"IMG:{file_path}")           # Enviar como imagen
-                    self.chat_view.display_image_from_path(full_msg)           # Mostrar imagen en interfaz
-                except Exception as e:
-                    QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar la imagen: {e}")
-        except Exception as e:
-            QMessageBox.warning(self.chat_view, "Error", f"Error al procesar la imagen: {e}")
-
-    def receive_messages(self):
-        #Hilo que recibe mensajes del otro usuario y los muestra en pantalla.
-        while True:
-            try:
-                msg = self.chat_model.receive_message()
-                if msg:
-                    # Emite señal para mostrar texto o imagen dependiendo del tipo
-                    self.chat_view.new_message_signal.emit(msg)
-            except Exception as e:
-                print(f"[ERROR] Error recibiendo mensajes: {e}")
-                break
+from PyQt5.QtWidgets import QMessageBox, QApplication
+import importlib
+import threading
+import os
+
+# La red, el historial, PIL y la ventana de chat se importan al entrar al chat (o antes, en segundo plano,
+# con preload_chat_modules); así la ventana de login se muestra sin cargarlos
+CHAT_MODULES = ("model.chat_model", "model.history_store", "view.chat_view", "PIL.Image")
+
+# Dirección del servidor de chat; se puede cambiar para conectarse a un servidor remoto
+CHAT_HOST = os.environ.get("CHAT_HOST", "localhost")
+CHAT_PORT = int(os.environ.get("CHAT_PORT", "12345"))
+
+# Errores seguidos (no de red) tras los que se deja de recibir: uno suelto no corta el chat, pero
+# uno que se repite en cada vuelta dejaría el hilo girando sin fin
+MAX_RECEIVE_ERRORS = 5
+
+class Controller:
+    def __init__(self, model, view):
+        self.model = model          # Modelo que almacena el nombre del usuario
+        self.view = view            # Vista de login
+        self.view.button.clicked.connect(self.start_chat)  # Conecta botón de login con el método start_chat
+
+        self.chat_view = None       # Se inicializará al pasar a la vista de chat
+        self.chat_model = None      # Modelo de red (cliente/servidor) para el chat
+        self.history = None         # Historial local de la conversación
+
+    def preload_chat_modules(self):
+        """Importa en segundo plano los módulos del chat mientras el usuario escribe su nombre."""
+        threading.Thread(target=lambda: [importlib.import_module(name) for name in CHAT_MODULES],
+                         daemon=True).start()
+
+    def start_chat(self):
+        """Maneja el inicio del chat: valida el nombre, establece conexión y abre la vista de chat."""
+        username = self.view.get_username()
+        if username.strip() == "":
+            # Muestra advertencia si el nombre está vacío
+            QMessageBox.warning(self.view, "Error", "Por favor, introduce un nombre.")
+            return
+
+        self.model.set_username(username)
+        print(f"[DEBUG] Nombre introducido: {self.model.get_username()}")
+
+        from model.chat_model import ChatModel
+        from model.history_store import HistoryStore
+        from view.chat_view import ChatView
+
+        # Historial local; su almacén de imágenes sirve también de caché para no volver a descargarlas
+        self.history = HistoryStore(username)
+
+        # Inicializa el modelo de chat con el nombre; al conectar recibirá los mensajes que se
+        # enviaron desde la última vez que se cerró el chat (si el servidor aún los guarda)
+        self.chat_model = ChatModel(username, self.history.blobs)
+        self.chat_model.set_sync_position(*self.history.load_sync_position())
+
+        # Intenta conectarse como cliente
+        try:
+            self.chat_model.start_client(CHAT_HOST, CHAT_PORT)
+            self.is_server = False
+            print("[DEBUG] Se ha conectado como cliente.")
+        except Exception as e:
+            # Si falla, inicia como servidor
+            print(f"[DEBUG] Fallo como cliente, iniciando como servidor: {e}")
+            try:
+                self.chat_model.start_server(CHAT_HOST, CHAT_PORT)
+                self.is_server = True
+                print("[DEBUG] Se ha iniciado como servidor.")
+            except Exception as e2:
+                # Si falla también como servidor, muestra error y termina
+                QMessageBox.warning(self.view, "Error", f"No se pudo iniciar como cliente ni como servidor:\nCliente: {e}\nServidor: {e2}")
+                self.history.close()
+                return
+
+        # Cierra vista de login y abre la vista de chat
+        self.view.close()
+        self.chat_view = ChatView(username)
+
+        # Conecta los botones de enviar mensaje e imagen con sus funciones
+        self.chat_view.send_button.clicked.connect(self.send_message)
+        self.chat_view.image_button.clicked.connect(self.upload_image)
+        self.chat_view.file_button.clicked.connect(self.upload_file)
+        self.chat_view.send_error_signal.connect(self.show_send_error)
+        self.chat_model.on_progress = self.chat_view.transfer_progress_signal.emit
+        self.chat_model.on_transfer_error = self.chat_view.transfer_error_signal.emit
+        self.chat_model.on_sent = self.chat_view.message_sent_signal.emit
+        self.chat_model.on_send_error = lambda msg_id, e: self.chat_view.send_error_signal.emit(str(e))
+        self.chat_model.on_connection_state = self.chat_view.connection_state_signal.emit
+        self.chat_view.show()
+
+        # Historial: se muestra la última página y el resto se carga al subir por la conversación
+        self.chat_view.history_requested.connect(self.load_older_history)
+        self.chat_view.history_newer_requested.connect(self.load_newer_history)
+        self.chat_view.history_jump_requested.connect(self.load_history_around)
+        self.chat_view.live_requested.connect(self.load_live_history)
+        self.chat_view.search_requested.connect(self.search_history)
+        QApplication.instance().aboutToQuit.connect(self.close_history)
+        # Después del historial, para guardar la posición final: cierra la conexión (y el servidor,
+        # si se inició aquí) y borra los ficheros temporales de las transferencias
+        QApplication.instance().aboutToQuit.connect(self.chat_model.close)
+        self.load_live_history()
+
+        # Inicia hilo para recibir mensajes de forma continua
+        threading.Thread(target=self.receive_messages, daemon=True).start()
+
+    def send_message(self):
+        """Envía un mensaje de texto al otro usuario."""
+        msg = self.chat_view.get_message().strip()
+        if msg == "":
+            return
+
+        full_msg = f"{self.model.get_username()}: {msg}"
+        try:
+            msg_id = self.chat_model.send_message(full_msg)   # Encola el mensaje para enviarlo por red
+            record_id = self.history.add_text(full_msg)       # Lo guarda en el historial (y en el índice de búsqueda)
+            self.chat_view.display_message(full_msg, msg_id, record_id)  # Lo muestra localmente (pendiente de envío)
+            self.chat_view.clear_input()                      # Limpia el campo de entrada
+        except Exception as e:
+            QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar el mensaje: {e}")
+
+    def show_send_error(self, error):
+        """Avisa de un mensaje que el hilo de envío no pudo enviar."""
+        QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar el mensaje: {error}")
+
+    def upload_image(self):
+        """Permite seleccionar y enviar una imagen."""
+        try:
+            from PyQt5.QtWidgets import QFileDialog
+            file_path, _ = QFileDialog.getOpenFileName(
+                self.chat_view, "Seleccionar Imagen", "", "Imágenes (*.png *.jpg *.jpeg *.bmp *.gif)"
+            )
+            
+            if file_path:
+                if not os.path.exists(file_path):
+                    QMessageBox.warning(self.chat_view, "Error", "El archivo seleccionado no existe.")
+                    return
+
+                # Formato del mensaje de imagen
+                full_msg = f"{self.model.get_username()}: {file_path}"
+                try:
+                    self.chat_model.send_message(f"IMG:{file_path}")           # Enviar como imagen
+                    record_id = self.history.add_image_file(self.model.get_username(), file_path)
+                    self.chat_view.display_image_from_path(full_msg, record_id)  # Mostrar imagen en interfaz
+                except Exception as e:
+                    QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar la imagen: {e}")
+        except Exception as e:
+            QMessageBox.warning(self.chat_view, "Error", f"Error al procesar la imagen: {e}")
+
+    def upload_file(self):
+        """Permite seleccionar y enviar un archivo de cualquier tipo."""
+        from PyQt5.QtWidgets import QFileDialog
+        file_path, _ = QFileDialog.getOpenFileName(self.chat_view, "Adjuntar archivo", "", "Todos los archivos (*)")
+        if not file_path:
+            return
+        username = self.model.get_username()
+        try:
+            msg_id = self.chat_model.send_message(f"FILE:{file_path}")  # Se envía desde el disco, sin cargarlo en memoria
+            record_id = self.history.add_file_path(username, file_path)
+            self.chat_view.display_file(username, os.path.basename(file_path), os.path.getsize(file_path),
+                                        file_path, msg_id, record_id)  # Pendiente de envío
+        except Exception as e:
+            QMessageBox.warning(self.chat_view, "Error", f"No se pudo enviar el archivo: {e}")
+
+    def load_live_history(self):
+        """Muestra la última página del historial seguida de los mensajes en vivo."""
+        self.chat_view.show_history_window(self.history.load_page(), at_tail=True)
+
+    def load_older_history(self, before_id):
+        """Carga en la vista la página de mensajes anterior a la más antigua mostrada."""
+        self.chat_view.prepend_history(self.history.load_page(before_id))
+
+    def load_newer_history(self, after_id):
+        """Carga la página siguiente al navegar por una zona antigua del historial."""
+        from model.history_store import PAGE_SIZE
+        records = self.history.load_after(after_id)
+        self.chat_view.append_history(records, at_tail=len(records) < PAGE_SIZE)
+
+    def load_history_around(self, record_id):
+        """Muestra el tramo del historial que rodea a un mensaje (p. ej. un resultado de búsqueda)."""
+        from model.history_store import PAGE_SIZE
+        older = self.history.load_page(record_id, PAGE_SIZE // 2)
+        newer = self.history.load_after(record_id - 1, PAGE_SIZE // 2)
+        self.chat_view.show_history_window(older + newer, at_tail=len(newer) < PAGE_SIZE // 2,
+                                           focus_record_id=record_id)
+
+    def search_history(self, text):
+        self.chat_view.show_search_results(self.history.search(text))
+
+    def close_history(self):
+        """Guarda la posición en el historial del servidor y cierra el historial local."""
+        self.history.save_sync_position(*self.chat_model.sync_position())
+        self.history.close()
+
+    def receive_messages(self):
+        #Hilo que recibe mensajes del otro usuario y los muestra en pantalla.
+        from model.chat_model import ImageMessage, FileMessage, ImagePreview
+        saved_position = None
+        errors = 0
+        while True:
+            try:
+                msg = self.chat_model.receive_message()
+                # Posición en el historial del servidor, que se guarda junto al mensaje (si ha cambiado).
+                # De un lote de sincronización, solo con el último: los anteriores aún no están guardados
+                position = self.chat_model.sync_position()
+                if self.chat_model.pending or position == saved_position or isinstance(msg, ImagePreview):
+                    position = None
+                if position:
+                    saved_position = position
+                if msg:
+                    # Se guarda en el historial desde este mismo hilo (el escritor trabaja en segundo plano)
+                    if isinstance(msg, ImagePreview):
+                        record_id = None  # Se guarda la imagen completa cuando llegue
+                    elif isinstance(msg, ImageMessage):
+                        record_id = self.history.add_image(msg.sender, msg, position)
+                    elif isinstance(msg, FileMessage):
+                        record_id = self.history.add_file(msg.sender, msg, position)
+                    else:
+                        record_id = self.history.add_text(msg, position)
+                    # Se pasa a la interfaz, que muestra por lotes los mensajes que llegan seguidos
+                    self.chat_view.queue_incoming(msg, record_id, self.chat_model.received_trace)
+                elif position:
+                    # Confirmaciones de mensajes propios y mensajes repetidos también avanzan la posición
+                    self.history.save_sync_position(*position)
+                errors = 0
+            except OSError as e:
+                # El modelo ya reconecta solo: si llega aquí, la conexión se cerró para siempre
+                print(f"[DEBUG] Fin de la recepción: {e}")
+                break
+            except Exception as e:
+                print(f"[ERROR] Error recibiendo mensajes: {e}")
+                errors += 1
+                if errors >= MAX_RECEIVE_ERRORS:
+                    print(f"[ERROR] Se deja de recibir tras {errors} errores seguidos")
+                    break
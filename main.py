@@ -1,16 +1,50 @@
-import sys
-from PyQt5.QtWidgets import QApplication
-from model.user_model import UserModel
-from view.login_view import LoginView
-from controller.controller import Controller
-
-# se crean las instancias del modelo, la vista y el controlador, y se lanza la interfaz gráfica.
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-
-    model = UserModel()
-    view = LoginView()
-    controller = Controller(model, view)
-
-    view.show()
-    sys.exit(app.exec_())
+import time
+STARTED = time.perf_counter()  # Antes de cualquier otro import, para medir el arranque completo
+
+import os
+import sys
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+from model.user_model import UserModel
+from view.login_view import LoginView
+from controller.controller import Controller, CHAT_MODULES
+
+# Módulos pesados que no deberían estar cargados al mostrarse la ventana de login
+HEAVY_MODULES = CHAT_MODULES + ("PyQt5.QtMultimedia", "http.server")
+
+
+def report_startup():
+    """Informe de arranque (CHAT_STARTUP_REPORT=1): tiempo hasta la primera ventana y módulos cargados.
+    Con CHAT_STARTUP_REPORT=exit cierra la aplicación después (lo usa benchmarks/startup.py)."""
+    print(f"[DEBUG] Primera ventana en {(time.perf_counter() - STARTED) * 1000:.1f} ms")
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"[DEBUG] Módulos pesados ya cargados: {', '.join(loaded) or 'ninguno'}")
+    if os.environ.get("CHAT_STARTUP_REPORT") == "exit":
+        QApplication.instance().quit()
+
+
+# se crean las instancias del modelo, la vista y el controlador, y se lanza la interfaz gráfica.
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    if any(name.startswith("CHAT_METRICS_") for name in os.environ):
+        from model.metrics import start_metrics_reporting  # Sin métricas no se carga en el arranque
+        reporter = start_metrics_reporting()  # Solo si se piden con CHAT_METRICS_LOG/FILE/PORT
+        if reporter:
+            app.aboutToQuit.connect(reporter.stop)
+    if os.environ.get("CHAT_DIAGNOSTICS", "0") != "0" or os.environ.get("CHAT_PROFILE", "0") != "0":
+        from view.diagnostics import start_diagnostics
+        diagnostics = start_diagnostics(app)
+        if diagnostics:
+            app.aboutToQuit.connect(diagnostics.stop)
+
+    model = UserModel()
+    view = LoginView()
+    controller = Controller(model, view)
+
+    view.show()
+    # Lo primero que procesa el bucle de eventos tras mostrar la ventana
+    if os.environ.get("CHAT_STARTUP_REPORT"):
+        QTimer.singleShot(0, report_startup)
+    if os.environ.get("CHAT_STARTUP_REPORT") != "exit":
+        QTimer.singleShot(0, controller.preload_chat_modules)  # El resto se carga mientras se escribe el nombre
+    sys.exit(app.exec_())
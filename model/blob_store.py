@@ -0,0 +1,85 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Almacén de ficheros direccionado por contenido: cada blob se guarda una sola vez, con el hash
+# SHA-256 de sus bytes como nombre (<dir>/ab/abcdef...). La misma imagen enviada o recibida varias
+# veces ocupa el disco una única vez.
+class BlobStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest))
+
+    # Guarda unos bytes y devuelve su hash (si ya se conoce el hash, no se vuelve a calcular)
+    def put_bytes(self, data, digest=None):
+        digest = digest or hashlib.sha256(data).hexdigest()
+        if not self.has(digest):
+            with self._atomic_writer(digest) as f:
+                f.write(data)
+        return digest
+
+    # Copia un fichero al almacén y devuelve su hash
+    def put_file(self, path):
+        digest = file_digest(path)
+        if not self.has(digest):
+            with open(path, 'rb') as src, self._atomic_writer(digest) as dst:
+                shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+        return digest
+
+    # Mueve al almacén un fichero ya completo cuyo hash se conoce (p. ej. una imagen recibida).
+    # Si el fichero está en el mismo disco es solo un renombrado, sin copiar los datos.
+    def adopt_file(self, path, digest):
+        final_path = self.path(digest)
+        if self.has(digest):
+            os.unlink(path)
+            return digest
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        try:
+            os.replace(path, final_path)
+        except OSError:
+            with open(path, 'rb') as src, self._atomic_writer(digest) as dst:
+                shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+            os.unlink(path)
+        return digest
+
+    # Escribe en un temporal y lo renombra al final, así nunca queda un blob a medias
+    def _atomic_writer(self, digest):
+        return _AtomicFile(self.path(digest))
+
+
+class _AtomicFile:
+    def __init__(self, final_path):
+        self.final_path = final_path
+
+    def __enter__(self):
+        directory = os.path.dirname(self.final_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        self.file = os.fdopen(fd, 'wb')
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.final_path)
+        else:
+            os.unlink(self.temp_path)
+
+
+# Hash SHA-256 de un fichero, leído por trozos para no cargarlo entero en memoria
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
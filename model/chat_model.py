@@ -1,166 +1,1106 @@
-import socket
-import threading
-import base64
-from PIL import Image
-import io
-import os
-
-# Modelo que gestiona la comunicación cliente-servidor y el envío/recepción de mensajes e imágenes
-class ChatModel:
-    def __init__(self, username):
-        self.username = username  # Nombre del usuario
-        self.sock = None          # Socket principal
-        self.conn = None          # Socket de conexión entrante (modo servidor)
-        self.addr = None          # Dirección del cliente conectado (modo servidor)
-        self.is_server = False    # Indicador de modo (cliente o servidor)
-        self.max_buffer_size = 10 * 1024 * 1024  # Límite de tamaño de recepción (10MB)
-
-    # Inicia el modelo en modo servidor
-    def start_server(self, host='localhost', port=12345):
-        self.is_server = True
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.bind((host, port))
-        self.sock.listen(1)
-        print("[DEBUG] Servidor esperando conexión...")
-        self.conn, self.addr = self.sock.accept()
-        print(f"[DEBUG] Conexión establecida con {self.addr}")
-
-    # Intenta conectar como cliente
-    def start_client(self, host='localhost', port=12345):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((host, port))
-        print("[DEBUG] Cliente conectado al servidor")
-
-    # Enviar mensaje (texto o imagen según el prefijo)
-    def send_message(self, msg):
-        if msg.startswith("IMG:"):
-            self._send_image(msg[4:])  # Se extrae la ruta de imagen y se envía
-        else:
-            self._send_text(msg)      # Se envía texto normal
-
-    # Envío de mensaje de texto con prefijo 'TEXT:'
-    def _send_text(self, msg):
-        if self.is_server:
-            self.conn.sendall(f"TEXT:{msg}".encode())
-        else:
-            self.sock.sendall(f"TEXT:{msg}".encode())
-
-    # Envío de imagen codificada en base64
-    def _send_image(self, img_path):
-        try:
-            if not os.path.exists(img_path):
-                print(f"[ERROR] El archivo {img_path} no existe.")
-                return
-
-            # Abre y opcionalmente redimensiona la imagen
-            with Image.open(img_path) as img:
-                if img.width > 800 or img.height > 600:
-                    img.thumbnail((800, 600))  # Redimensionar manteniendo proporciones
-
-                buffer = io.BytesIO()
-                img.save(buffer, format=img.format or 'PNG')
-                img_bytes = buffer.getvalue()
-                
-                # Codifica en base64
-                img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                full_message = f"IMG:DATA:{img_base64}"
-
-                # Envía como string
-                if self.is_server:
-                    self.conn.sendall(full_message.encode('utf-8'))
-                else:
-                    self.sock.sendall(full_message.encode('utf-8'))
-
-                print(f"[DEBUG] Imagen enviada: {len(img_base64)} bytes")
-        except Exception as e:
-            print(f"[ERROR] Error al enviar imagen: {e}")
-
-    # Recepción de mensaje (texto o imagen)
-    def receive_message(self):
-        try:
-            # Lee encabezado (los primeros 5 caracteres)
-            if self.is_server:
-                header = self.conn.recv(5).decode('utf-8')
-            else:
-                header = self.sock.recv(5).decode('utf-8')
-
-            if not header:
-                return None
-
-            # Según el encabezado, determina el tipo de mensaje
-            if header == "TEXT:":
-                return self._receive_text(header)
-            elif header == "IMG:D":
-                # Leer los siguientes 4 bytes "ATA:" para completar "IMG:DATA:"
-                if self.is_server:
-                    self.conn.recv(4)
-                else:
-                    self.sock.recv(4)
-                return self._receive_image()
-            else:
-                # Formato antiguo o inesperado
-                return self._receive_legacy_message(header)
-        except ConnectionError:
-            print("[DEBUG] Conexión cerrada.")
-            return None
-        except Exception as e:
-            print(f"[ERROR] Error recibiendo mensaje: {e}")
-            return None
-
-    # Recepción de mensaje de texto
-    def _receive_text(self, header_already_read):
-        if self.is_server:
-            data = self.conn.recv(1024)
-        else:
-            data = self.sock.recv(1024)
-
-        if not data:
-            return None
-
-        full_message = header_already_read + data.decode('utf-8')
-        return full_message[5:]  # Retirar "TEXT:"
-
-    # Recepción de mensaje de imagen codificada
-    def _receive_image(self):
-        chunks = []
-        bytes_received = 0
-
-        while bytes_received < self.max_buffer_size:
-            if self.is_server:
-                chunk = self.conn.recv(8192)
-            else:
-                chunk = self.sock.recv(8192)
-
-            if not chunk:
-                break
-
-            chunks.append(chunk)
-            bytes_received += len(chunk)
-
-            if len(chunk) < 8192:
-                break  # Se ha recibido todo
-
-        data = b''.join(chunks)
-        img_base64 = data.decode('utf-8')
-
-        return f"IMG:DATA:{img_base64}"
-
-    # Método de compatibilidad con formatos antiguos
-    def _receive_legacy_message(self, partial_data):
-        if self.is_server:
-            data = self.conn.recv(1024)
-        else:
-            data = self.sock.recv(1024)
-
-        if not data:
-            return None
-
-        return partial_data + data.decode('utf-8')
-
-    # Cierre seguro de sockets
-    def close(self):
-        if self.is_server:
-            self.conn.close()
-            self.sock.close()
-        else:
-            self.sock.close()
+import socket
+import struct
+import threading
+import itertools
+import queue
+import tempfile
+import shutil
+import random
+import io
+import os
+import hashlib
+import time
+from collections import OrderedDict, deque
+
+from model.compression import CODECS, CompressionError, compress_payload
+from model.metrics import metrics, MessageTrace
+
+# Formato de trama del protocolo (versión 1). Cada mensaje viaja como una cabecera binaria fija
+# seguida del payload:
+#   versión (1 byte) | tipo (1 byte) | flags (2 bytes) | longitud del payload (4 bytes) | id de mensaje (4 bytes)
+# Todos los campos van en orden de red (big-endian). La longitud permite leer exactamente el
+# payload, así varios mensajes seguidos en el mismo socket nunca se mezclan ni se cortan.
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!BBHII")
+
+# Flags de la cabecera
+FLAG_COMPRESSED = 0x0001  # Payload comprimido con el códec acordado en el saludo (MSG_HELLO)
+
+# Tipos de mensaje
+MSG_TEXT = 1
+MSG_TRANSFER_OFFER = 3   # Oferta de una imagen/fichero: metadatos y hash del contenido
+MSG_TRANSFER_CHUNK = 4   # Un trozo de los datos de una transferencia
+MSG_TRANSFER_NEED = 5    # Servidor -> remitente: no tiene el contenido ofrecido, hay que subirlo
+MSG_TRANSFER_HAVE = 6    # Servidor -> remitente: ya tiene el contenido, no hace falta subirlo
+MSG_TRANSFER_FETCH = 7   # Cliente -> servidor: pide el contenido de una oferta que no tiene en caché
+MSG_TRANSFER_PREVIEW = 8 # Vista previa diminuta de una imagen, enviada antes que la imagen completa
+MSG_HELLO = 9            # Saludo al conectar: el cliente ofrece sus códecs ("zlib,lzma") y el servidor
+                         # responde con el elegido (vacío = sin compresión)
+MSG_ACK = 10             # Servidor -> remitente: mensaje recibido entero (su id va en la cabecera)
+MSG_PING = 11            # Latido del cliente, para detectar conexiones caídas
+MSG_PONG = 12            # Respuesta del servidor al latido
+MSG_SYNC_BATCH = 13      # Servidor -> cliente al conectar: lote de mensajes que el cliente se ha perdido
+MSG_TRANSFER_MISSING = 14  # Servidor -> cliente: no tiene el contenido pedido con MSG_TRANSFER_FETCH
+
+# El servidor numera los mensajes de estos tipos (el número de secuencia viaja como id de mensaje
+# en las tramas que reenvía) y guarda los últimos, para enviar al cliente que se conecta los que
+# no ha visto
+SYNC_TYPES = {MSG_TEXT, MSG_TRANSFER_OFFER}
+
+# Tipos cuyo payload se comprime (si supera COMPRESS_MIN_SIZE): los textos largos comprimen muy
+# bien; imágenes y ficheros suelen estar ya comprimidos y sus trozos van siempre tal cual.
+COMPRESSIBLE_TYPES = {MSG_TEXT}
+HANDSHAKE_TIMEOUT = 5  # Segundos que espera el cliente la respuesta al saludo
+
+# Conexión: el cliente envía un latido cada HEARTBEAT_INTERVAL segundos y, si en HEARTBEAT_TIMEOUT
+# no recibe nada del servidor, da la conexión por perdida y reconecta, esperando entre intentos un
+# tiempo que se duplica desde RECONNECT_MIN_DELAY hasta RECONNECT_MAX_DELAY.
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = 30
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
+MAX_PAYLOAD_SIZE = 1024 * 1024  # Límite de tamaño de un payload (1MB)
+
+# Las imágenes y ficheros se identifican por el hash SHA-256 de sus bytes. El remitente ofrece
+# primero el hash y el servidor solo pide la subida si no tiene ya ese contenido; del mismo modo,
+# quien recibe la oferta solo pide la descarga si no lo tiene en su almacén local (BlobStore).
+# Los datos viajan como bytes crudos partidos en trozos de tamaño acotado, cada uno en su propia
+# trama, de modo que los mensajes de texto pueden colarse entre dos trozos.
+# Cabecera de MSG_TRANSFER_OFFER (seguida del nombre del fichero y del nombre del remitente, en UTF-8):
+#   id de transferencia (8 bytes) | tipo (1 byte) | formato (8 bytes ASCII, p. ej. b"PNG") |
+#   ancho (4 bytes) | alto (4 bytes) | longitud total de los datos (8 bytes) | hash SHA-256 (32 bytes) |
+#   longitud del nombre del fichero (2 bytes)
+TRANSFER_HEADER = struct.Struct("!QB8sIIQ32sH")
+# Cabecera de MSG_TRANSFER_CHUNK (seguida de los datos del trozo):
+#   id de transferencia (8 bytes) | posición del trozo dentro de los datos (8 bytes)
+CHUNK_HEADER = struct.Struct("!QQ")
+# Payload de MSG_TRANSFER_HAVE y MSG_TRANSFER_MISSING: id de transferencia (8 bytes)
+TRANSFER_REPLY = struct.Struct("!Q")
+# Payload de MSG_TRANSFER_NEED: id de transferencia (8 bytes) | posición desde la que hay que subir
+# los datos (8 bytes; distinta de 0 si se reanuda una subida cortada por una desconexión)
+TRANSFER_NEED = struct.Struct("!QQ")
+# Payload de MSG_TRANSFER_FETCH: id de transferencia (8 bytes) | hash SHA-256 (32 bytes) |
+#   posición desde la que se piden los datos (8 bytes)
+FETCH_REQUEST = struct.Struct("!Q32sQ")
+# Cabecera de MSG_HELLO (seguida de los nombres de los códecs separados por comas, en ASCII):
+#   id de sesión del cliente (8 bytes; el mismo en cada reconexión, para reanudar lo pendiente) |
+#   id de arranque del servidor (8 bytes) | último número de secuencia visto (4 bytes)
+# El cliente envía el arranque y el número del último mensaje que vio (0 y 0 si nunca se ha
+# conectado) y el servidor responde con los suyos, seguidos de los mensajes que faltan.
+HELLO_HEADER = struct.Struct("!QQI")
+# Payload de MSG_ACK: número de secuencia asignado al mensaje confirmado (0 si no se numera)
+ACK_SEQ = struct.Struct("!I")
+# Payload de MSG_SYNC_BATCH: entradas seguidas, cada una con esta cabecera y su payload:
+#   tipo (1 byte) | número de secuencia (4 bytes) | longitud del payload (4 bytes)
+SYNC_ENTRY = struct.Struct("!BII")
+# Cabecera de MSG_TRANSFER_PREVIEW (seguida del nombre del remitente y de la vista previa en JPEG):
+#   id de transferencia (8 bytes) | ancho y alto de la imagen completa (4 + 4 bytes) |
+#   longitud del nombre del remitente (2 bytes)
+PREVIEW_HEADER = struct.Struct("!QIIH")
+
+TRANSFER_IMAGE = 1
+TRANSFER_FILE = 2
+
+CHUNK_SIZE = 64 * 1024                      # Tamaño de cada trozo enviado
+SPOOL_THRESHOLD = 4 * 1024 * 1024           # Por encima de este tamaño se recibe en un fichero temporal
+MAX_TRANSFER_SIZE = 1024 * 1024 * 1024      # Límite de tamaño de una transferencia (1GB)
+ENCODED_CACHE_SIZE = 8                      # Imágenes reducidas que se recuerdan por si se reenvían
+MAX_IMAGE_SIZE = (800, 600)                 # Las imágenes más grandes se reducen antes de enviarlas
+HASH_BLOCK_SIZE = 1024 * 1024               # Bloque con el que se calcula el hash de un fichero a enviar
+PREVIEW_SIZE = 64                           # Lado máximo de la vista previa de una imagen
+PREVIEW_QUALITY = 40                        # Calidad JPEG de la vista previa (~1-2KB)
+PREVIEW_MIN_FILE_SIZE = 32 * 1024           # Las imágenes más pequeñas se envían sin vista previa
+# Formatos que se envían tal cual desde el disco si la imagen no hay que reducirla
+SENDFILE_FORMATS = {"PNG", "JPEG", "GIF", "BMP"}
+
+# Prioridades de la cola de envío (menor = antes). Tras cada trozo de una transferencia se vuelve
+# a consultar la cola, así un texto nunca espera a que termine de enviarse una imagen.
+PRIORITY_TEXT = 0
+PRIORITY_TRANSFER = 1
+
+
+class ProtocolError(Exception):
+    """Error de formato en una trama recibida."""
+
+
+def encode_frame(msg_type, payload, msg_id=0, flags=0):
+    """Construye una trama completa (cabecera + payload) lista para enviar."""
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload demasiado grande: {len(payload)} bytes")
+    return HEADER.pack(PROTOCOL_VERSION, msg_type, flags, len(payload), msg_id) + payload
+
+
+def send_frame(sock, msg_type, payload, msg_id=0, flags=0):
+    """Envía una trama. Los payloads grandes se envían tras la cabecera sin concatenarlos (sin copia)."""
+    if len(payload) <= 64 * 1024:
+        sock.sendall(encode_frame(msg_type, payload, msg_id, flags))
+    else:
+        if len(payload) > MAX_PAYLOAD_SIZE:
+            raise ProtocolError(f"Payload demasiado grande: {len(payload)} bytes")
+        sock.sendall(HEADER.pack(PROTOCOL_VERSION, msg_type, flags, len(payload), msg_id))
+        sock.sendall(payload)
+
+
+def fit_size(width, height, max_size):
+    """Tamaño de una imagen reducida para caber en `max_size`, manteniendo proporciones (como Image.thumbnail)."""
+    scale = min(max_size[0] / width, max_size[1] / height, 1) if width and height else 1
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# Trozo de un fichero que se envía como payload de una trama, detrás de unos bytes de cabecera
+class FileRegion:
+    def __init__(self, prefix, file, offset, count):
+        self.prefix = prefix
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+
+def send_file_frame(sock, msg_type, region, msg_id=0, flags=0):
+    """Envía una trama cuyo payload sale de un fichero (FileRegion). Los datos se envían con
+    socket.sendfile, que en la mayoría de sistemas los pasa del disco al socket sin copiarlos a Python."""
+    length = len(region.prefix) + region.count
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload demasiado grande: {length} bytes")
+    sock.sendall(HEADER.pack(PROTOCOL_VERSION, msg_type, flags, length, msg_id) + region.prefix)
+    sent = sock.sendfile(region.file, region.offset, region.count)
+    if sent != region.count:
+        raise ConnectionError(f"El fichero {region.file.name} ha cambiado durante el envío")
+
+
+def recv_into_exact(sock, view):
+    """Llena `view` (memoryview escribible) con bytes del socket o lanza ConnectionError si se cierra antes."""
+    size = len(view)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Conexión cerrada por el otro extremo")
+        received += n
+
+
+def recv_exact(sock, size):
+    """Lee exactamente `size` bytes del socket o lanza ConnectionError si se cierra antes."""
+    buffer = bytearray(size)
+    recv_into_exact(sock, memoryview(buffer))
+    return buffer
+
+
+def decompress_payload(codec, payload):
+    """Descomprime el payload de una trama con FLAG_COMPRESSED."""
+    if codec is None:
+        raise ProtocolError("Trama comprimida sin códec acordado")
+    try:
+        return codec.decompress(payload, MAX_PAYLOAD_SIZE)
+    except CompressionError as e:
+        raise ProtocolError(f"Payload comprimido inválido: {e}")
+
+
+def encode_hello(session_id, codec_names, epoch=0, seq=0):
+    return HELLO_HEADER.pack(session_id, epoch, seq) + ",".join(codec_names).encode('ascii')
+
+
+def decode_hello(payload):
+    """Devuelve (id de sesión, id de arranque, número de secuencia, nombres de los códecs) de un MSG_HELLO."""
+    if len(payload) < HELLO_HEADER.size:
+        raise ProtocolError("Saludo demasiado corto")
+    session_id, epoch, seq = HELLO_HEADER.unpack_from(payload)
+    try:
+        names = bytes(payload[HELLO_HEADER.size:]).decode('ascii').split(",")
+    except UnicodeDecodeError:
+        raise ProtocolError("Nombres de códec inválidos en el saludo")
+    return session_id, epoch, seq, [name for name in names if name]
+
+
+def iter_sync_entries(payload):
+    """Recorre las entradas (tipo, número de secuencia, payload) de un MSG_SYNC_BATCH."""
+    view = memoryview(payload)
+    offset = 0
+    while offset < len(view):
+        if len(view) - offset < SYNC_ENTRY.size:
+            raise ProtocolError("Entrada de sincronización incompleta")
+        msg_type, seq, length = SYNC_ENTRY.unpack_from(view, offset)
+        offset += SYNC_ENTRY.size
+        if length > len(view) - offset:
+            raise ProtocolError("Entrada de sincronización incompleta")
+        yield msg_type, seq, view[offset:offset + length]
+        offset += length
+
+
+def check_header(version, length):
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Versión de protocolo no soportada: {version}")
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload demasiado grande: {length} bytes")
+
+
+def read_frame(sock):
+    """Lee una trama completa y devuelve (tipo, flags, id de mensaje, payload) en un buffer nuevo."""
+    version, msg_type, flags, length, msg_id = HEADER.unpack(recv_exact(sock, HEADER.size))
+    check_header(version, length)
+    payload = recv_exact(sock, length) if length else bytearray()
+    return msg_type, flags, msg_id, payload
+
+
+# Lector de tramas para sockets bloqueantes que no reserva memoria por trama: la cabecera y el
+# payload se leen siempre en los mismos buffers. El payload devuelto es un memoryview que solo es
+# válido hasta la siguiente lectura; quien lo use debe consumirlo (decodificarlo, copiarlo a su
+# destino) antes. Con read_into el payload puede ir directamente a su destino final sin pasar por
+# el buffer intermedio.
+class FrameReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.header = bytearray(HEADER.size)
+        self.header_view = memoryview(self.header)
+        self.buffer = bytearray(MAX_PAYLOAD_SIZE)
+        self.view = memoryview(self.buffer)
+        self.bytes_read = 0  # Bytes leídos del socket (cabeceras incluidas)
+
+    def read_header(self):
+        """Lee la cabecera de la siguiente trama y devuelve (tipo, flags, longitud del payload, id)."""
+        recv_into_exact(self.sock, self.header_view)
+        self.bytes_read += HEADER.size
+        version, msg_type, flags, length, msg_id = HEADER.unpack(self.header)
+        check_header(version, length)
+        return msg_type, flags, length, msg_id
+
+    def read_payload(self, length):
+        """Lee `length` bytes del payload en el buffer reutilizable y devuelve un memoryview sobre ellos."""
+        view = self.view[:length]
+        recv_into_exact(self.sock, view)
+        self.bytes_read += length
+        return view
+
+    def read_into(self, view):
+        """Lee bytes del payload directamente en `view` (p. ej. el buffer de una transferencia)."""
+        recv_into_exact(self.sock, view)
+        self.bytes_read += len(view)
+
+
+# Decodificador incremental de tramas para sockets no bloqueantes: acumula los bytes que van
+# llegando y devuelve las tramas completas en cuanto están disponibles.
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Añade bytes recibidos y devuelve la lista de tramas completas (tipo, flags, id, payload)."""
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            version, msg_type, flags, length, msg_id = HEADER.unpack_from(self.buffer, offset)
+            check_header(version, length)
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((msg_type, flags, msg_id, self.buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+
+# Metadatos de una transferencia, tal y como viajan en MSG_TRANSFER_OFFER
+class TransferOffer:
+    def __init__(self, transfer_id, kind, fmt, width, height, size, digest, sender="", name=""):
+        self.transfer_id = transfer_id
+        self.kind = kind
+        self.format = fmt
+        self.width = width
+        self.height = height
+        self.size = size
+        self.digest = digest  # Hash SHA-256 del contenido, en hexadecimal
+        self.sender = sender
+        self.name = name      # Nombre del fichero (solo archivos adjuntos)
+
+    def pack(self):
+        name = self.name.encode('utf-8')
+        return (TRANSFER_HEADER.pack(self.transfer_id, self.kind, self.format.encode('ascii'), self.width,
+                                     self.height, self.size, bytes.fromhex(self.digest), len(name))
+                + name + self.sender.encode('utf-8'))
+
+    @classmethod
+    def unpack(cls, payload):
+        if len(payload) < TRANSFER_HEADER.size:
+            raise ProtocolError("Oferta de transferencia demasiado corta")
+        transfer_id, kind, fmt, width, height, size, digest, name_length = TRANSFER_HEADER.unpack_from(payload)
+        if size > MAX_TRANSFER_SIZE:
+            raise ProtocolError(f"Transferencia demasiado grande: {size} bytes")
+        name_end = TRANSFER_HEADER.size + name_length
+        if len(payload) < name_end:
+            raise ProtocolError("Oferta de transferencia demasiado corta")
+        try:
+            name = bytes(payload[TRANSFER_HEADER.size:name_end]).decode('utf-8')
+            sender = bytes(payload[name_end:]).decode('utf-8')
+            fmt = fmt.rstrip(b"\0").decode('ascii')
+        except UnicodeDecodeError:
+            raise ProtocolError("Texto inválido en la oferta de transferencia")
+        return cls(transfer_id, kind, fmt, width, height, size, digest.hex(), sender, name)
+
+    def message(self, data=None, path=None):
+        """Mensaje que se entrega a la aplicación cuando el contenido está disponible."""
+        if self.kind == TRANSFER_FILE:
+            return FileMessage(self.name, self.size, self.sender, path, self.digest)
+        return ImageMessage(data, self.format, self.width, self.height, self.sender, path, self.digest,
+                            self.transfer_id)
+
+
+# Vista previa de una imagen que aún se está transfiriendo. La imagen completa llegará después
+# como un ImageMessage con el mismo `transfer_id`.
+class ImagePreview:
+    def __init__(self, transfer_id, sender, width, height, data):
+        self.transfer_id = transfer_id
+        self.sender = sender
+        self.width = width    # Tamaño de la imagen completa (para reservar su hueco)
+        self.height = height
+        self.data = data      # JPEG diminuto
+
+    def pack(self):
+        sender = self.sender.encode('utf-8')
+        return PREVIEW_HEADER.pack(self.transfer_id, self.width, self.height, len(sender)) + sender + self.data
+
+    @classmethod
+    def unpack(cls, payload):
+        if len(payload) < PREVIEW_HEADER.size:
+            raise ProtocolError("Vista previa demasiado corta")
+        transfer_id, width, height, sender_length = PREVIEW_HEADER.unpack_from(payload)
+        sender_end = PREVIEW_HEADER.size + sender_length
+        try:
+            sender = bytes(payload[PREVIEW_HEADER.size:sender_end]).decode('utf-8')
+        except UnicodeDecodeError:
+            raise ProtocolError("Remitente inválido en la vista previa")
+        return cls(transfer_id, sender, width, height, bytes(payload[sender_end:]))
+
+
+# Imagen recibida: los bytes crudos del fichero (sin recodificar) y sus metadatos.
+# Las imágenes pequeñas llegan además en memoria (`data`); si hay almacén local, `path` es su blob.
+class ImageMessage:
+    def __init__(self, data, fmt, width, height, sender="", path=None, digest=None, transfer_id=None):
+        self.data = data      # memoryview sobre el buffer de recepción, listo para QPixmap.loadFromData
+        self.format = fmt     # Formato de la imagen ("PNG", "JPEG", ...)
+        self.width = width
+        self.height = height
+        self.sender = sender  # Nombre de quien envió la imagen
+        self.path = path      # Fichero con los datos (blob del almacén o temporal de una imagen grande)
+        self.digest = digest  # Hash SHA-256 del contenido, en hexadecimal
+        self.transfer_id = transfer_id  # Para sustituir la vista previa que llegó antes
+
+
+# Archivo adjunto recibido. Siempre está en disco (`path`): en el almacén local o en un temporal.
+class FileMessage:
+    def __init__(self, name, size, sender="", path=None, digest=None):
+        self.name = name      # Nombre original del fichero
+        self.size = size
+        self.sender = sender
+        self.path = path
+        self.digest = digest
+
+
+# Transferencia entrante en curso. Los trozos llegan en orden y se escriben directamente en su
+# posición final: en un buffer reservado de antemano o, si es grande, en un fichero temporal, de
+# modo que la memoria usada no depende del tamaño del adjunto. El hash se calcula al vuelo.
+class IncomingTransfer:
+    def __init__(self, offer, temp_dir):
+        self.offer = offer
+        self.transfer_id = offer.transfer_id
+        self.size = offer.size
+        self.received = 0
+        self.seq = 0  # Número de la oferta en el historial del servidor (lo usa el cliente)
+        self.sha = hashlib.sha256()
+        self.buffer = None
+        self.file = None
+        if self.size <= SPOOL_THRESHOLD and offer.kind != TRANSFER_FILE:
+            self.buffer = bytearray(self.size)
+        else:
+            self.file = tempfile.NamedTemporaryFile(dir=temp_dir, delete=False)
+            self.file.truncate(self.size)
+
+    def _check_chunk(self, offset, size):
+        if offset != self.received or offset + size > self.size:
+            raise ProtocolError(f"Trozo fuera de orden o de rango en la transferencia {self.transfer_id}")
+
+    def chunk_view(self, offset, size):
+        """Hueco del buffer donde va un trozo, para recibirlo directamente en él (None si va a fichero).
+        Una vez lleno hay que llamar a commit()."""
+        self._check_chunk(offset, size)
+        if self.buffer is None:
+            return None
+        return memoryview(self.buffer)[offset:offset + size]
+
+    def commit(self, data):
+        """Da por recibido un trozo ya escrito en su sitio."""
+        self.sha.update(data)
+        self.received += len(data)
+
+    def write(self, offset, data):
+        self._check_chunk(offset, len(data))
+        if self.buffer is not None:
+            # A través de un memoryview: asignar a un trozo del bytearray copiaría antes los datos
+            memoryview(self.buffer)[offset:offset + len(data)] = data
+        else:
+            self.file.write(data)
+        self.commit(data)
+
+    def is_complete(self):
+        return self.received >= self.size
+
+    def finish(self, blobs=None):
+        """Comprueba el hash, guarda el contenido en el almacén (si lo hay) y devuelve el mensaje recibido."""
+        offer = self.offer
+        if self.sha.hexdigest() != offer.digest:
+            self.discard()
+            raise ProtocolError(f"El contenido de la transferencia {self.transfer_id} no coincide con su hash")
+
+        if self.buffer is not None:
+            path = None
+            if blobs is not None:
+                blobs.put_bytes(self.buffer, offer.digest)
+                path = blobs.path(offer.digest)
+            return offer.message(memoryview(self.buffer), path)
+
+        self.file.close()
+        path = self.file.name
+        if blobs is not None:
+            blobs.adopt_file(path, offer.digest)
+            path = blobs.path(offer.digest)
+        return offer.message(path=path)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            os.unlink(self.file.name)
+
+
+# Modelo que gestiona la comunicación cliente-servidor y el envío/recepción de mensajes e imágenes
+class ChatModel:
+    def __init__(self, username, blobs=None, compression=None):
+        self.username = username  # Nombre del usuario
+        self.blobs = blobs        # Almacén local de imágenes (BlobStore); lo que ya está en él no se descarga
+        # Códecs que se ofrecen al servidor (por defecto todos, o los de CHAT_COMPRESSION; "none" desactiva)
+        if compression is None:
+            compression = os.environ.get("CHAT_COMPRESSION", ",".join(CODECS))
+        if isinstance(compression, str):
+            compression = [name for name in compression.split(",") if name in CODECS]
+        self.offered_codecs = compression
+        self.codec = None         # Códec acordado con el servidor (None = sin compresión)
+        self.sock = None          # Socket conectado al servidor de chat
+        self.reader = None        # FrameReader del socket (buffers de recepción reutilizables)
+        self.server = None        # Servidor embebido (solo en modo servidor)
+        self.is_server = False    # Indicador de modo (cliente o servidor)
+        self.max_buffer_size = MAX_PAYLOAD_SIZE  # Límite de tamaño de una trama recibida (1MB)
+        self.msg_ids = itertools.count(1)  # Ids de los mensajes enviados
+        # (prioridad, orden, id de mensaje, generador de tramas, conexión para la que se encoló)
+        self.send_queue = queue.PriorityQueue()
+        self.send_order = itertools.count()      # Desempate FIFO dentro de una misma prioridad
+        self.sender_thread = None  # Único hilo que escribe en el socket
+        # Reconexión: los mensajes se guardan hasta que el servidor confirma que los ha recibido
+        # (MSG_ACK) y, si la conexión se pierde, se reenvían al reconectar con el mismo id de
+        # sesión, que permite al servidor descartar duplicados y reanudar las subidas a medias
+        self.address = None       # (host, puerto) del servidor; None = sin reconexión automática
+        self.session_id = random.getrandbits(63) + 1
+        self.unacked = {}         # Mensajes sin confirmar (id -> (mensaje, id de transferencia))
+        self.traces = {}          # Instantes de los mensajes sin confirmar (id -> MessageTrace)
+        self.send_lock = threading.Lock()  # Protege `unacked` y el cambio de conexión
+        self.connection = 0       # Número de conexión; lo encolado para una anterior se descarta
+        self.connected = False    # False desde que se pierde la conexión hasta que se recupera
+        # Sockets de conexiones perdidas. Los cierra el hilo de envío cuando seguro que no está
+        # escribiendo en ellos: si se cerraran antes, su descriptor podría reutilizarse para la
+        # conexión nueva mientras un sendfile sigue escribiendo en él.
+        self.retired_socks = []
+        self.closed = threading.Event()
+        # Posición en el historial del servidor: su id de arranque y el número del último mensaje
+        # visto. Se envía al conectar para recibir solo lo que falta; se puede guardar entre sesiones.
+        self.server_epoch = 0
+        self.last_seq = 0
+        self.skip_seqs = set()  # Números posteriores a last_seq ya guardados en una sesión anterior
+        self.pending = deque()  # Mensajes de un lote de sincronización aún no devueltos
+        self.frame_received_at = None  # Instante en que se leyó la cabecera de la última trama
+        self.received_trace = None     # MessageTrace del último mensaje devuelto por receive_message
+        # Contadores para las métricas; cada uno lo actualiza un único hilo (el de envío o el de recepción)
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.transfers = {}       # Transferencias entrantes en curso (id -> IncomingTransfer)
+        self.encoded_images = OrderedDict()  # Últimas imágenes reducidas ((ruta, mtime, tamaño) -> datos)
+        self.offers = {}          # Ofertas enviadas a la espera de NEED/HAVE (id -> (id de mensaje, datos))
+        # Ficheros temporales de las imágenes grandes; junto al almacén para moverlas a él sin copiarlas
+        self.temp_dir = tempfile.mkdtemp(prefix="chat_", dir=blobs.directory if blobs else None)
+        self.on_progress = None   # Callback (id, bytes transferidos, bytes totales) de las transferencias
+        self.on_sent = None       # Callback (id de mensaje) cuando el servidor confirma un mensaje
+        self.on_send_error = None # Callback (id de mensaje, excepción) si un mensaje no se pudo enviar
+        self.on_transfer_error = None  # Callback (id de transferencia, error) si una descarga falla
+        self.on_connection_state = None  # Callback (conectado) al perder y al recuperar la conexión
+        metrics.register(self.collect_metrics)
+
+    def collect_metrics(self):
+        """Contadores y valores de este cliente para el registro de métricas (ver Metrics.register)."""
+        return ({"chat_frames_sent_total": self.frames_sent,
+                 "chat_bytes_sent_total": self.bytes_sent,
+                 "chat_frames_received_total": self.frames_received,
+                 "chat_bytes_received_total": self.reader.bytes_read if self.reader else 0,
+                 "chat_messages_sent_total": self.messages_sent,
+                 "chat_messages_received_total": self.messages_received},
+                {"chat_send_queue_depth": self.send_queue.qsize(),
+                 "chat_unacked_messages": len(self.unacked)})
+
+    # Inicia el modelo en modo servidor: levanta un ChatServer multicliente en segundo plano
+    # y se conecta a él como un cliente más
+    def start_server(self, host='localhost', port=12345):
+        from model.chat_server import ChatServer  # Import diferido para evitar el ciclo de imports
+
+        # El servidor embebido comparte el almacén local: lo que recibe ya no hay que descargarlo
+        self.server = ChatServer(host, port, blob_dir=self.blobs.directory if self.blobs else None)
+        self.server.start()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.is_server = True
+        self.start_client(host, port)
+
+    # Intenta conectar como cliente. Desde ese momento, si la conexión se pierde, se reconecta sola.
+    def start_client(self, host='localhost', port=12345):
+        sock = self._connect(host, port)
+        print(f"[DEBUG] Cliente conectado al servidor (compresión: {self.codec.name if self.codec else 'no'})")
+        self.address = (host, port)
+        self.use_socket(sock)
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    def _connect(self, host, port):
+        sock = socket.create_connection((host, port), timeout=HANDSHAKE_TIMEOUT)
+        # Sin Nagle: un texto corto no espera en el sistema detrás de los trozos de una imagen
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._handshake(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    # Saludo inicial: se envía el id de sesión y los códecs de compresión, y se espera el que elige el servidor
+    def _handshake(self, sock):
+        send_frame(sock, MSG_HELLO, encode_hello(self.session_id, self.offered_codecs, self.server_epoch, self.last_seq))
+        sock.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            msg_type, flags, msg_id, payload = read_frame(sock)
+        finally:
+            sock.settimeout(None)
+        if msg_type != MSG_HELLO:
+            raise ProtocolError(f"Respuesta inesperada al saludo: tipo {msg_type}")
+        session_id, epoch, server_seq, chosen = decode_hello(payload)
+        self.codec = CODECS.get(chosen[0]) if chosen else None
+        if epoch != self.server_epoch:
+            # Servidor reiniciado (o nuevo): sus números de secuencia empiezan de cero y nos envía todo lo que guarda
+            self.server_epoch = epoch
+            self.last_seq = 0
+            self.skip_seqs.clear()
+
+    # Posición en el historial del servidor que se puede guardar para la próxima sesión: (id de
+    # arranque, número de secuencia, números posteriores ya entregados). Mientras se descarga una
+    # imagen o un archivo, la posición se queda antes de su oferta, para recibirla de nuevo si la
+    # aplicación se cierra a medias; los mensajes posteriores ya entregados se descartarán entonces.
+    def sync_position(self):
+        offers = {transfer.seq for transfer in list(self.transfers.values()) if transfer.seq}
+        floor = min(min(offers) - 1, self.last_seq) if offers else self.last_seq
+        delivered = (set(range(floor + 1, self.last_seq + 1)) - offers) | {seq for seq in self.skip_seqs if seq > floor}
+        return self.server_epoch, floor, tuple(sorted(delivered))
+
+    def set_sync_position(self, epoch, seq, skip=()):
+        """Continúa desde una posición guardada con sync_position."""
+        self.server_epoch = epoch
+        self.last_seq = seq
+        self.skip_seqs = set(skip)
+
+    # Empieza a usar un socket ya conectado al servidor (o a otro extremo, p. ej. en los benchmarks)
+    def use_socket(self, sock):
+        self.sock = sock
+        self.reader = FrameReader(sock)
+        self.connected = True
+        self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
+        self.sender_thread.start()
+
+    # Enviar mensaje (texto, imagen o archivo según el prefijo). No bloquea: encola el mensaje para
+    # el hilo de envío y devuelve su id; on_sent se llama con ese id cuando el servidor lo confirma.
+    def send_message(self, msg):
+        with self.send_lock:
+            msg_id = next(self.msg_ids)
+            transfer_id = None
+            if msg.startswith(("IMG:", "FILE:")):
+                transfer_id = random.getrandbits(64)  # Aleatorio: no se repite entre los distintos remitentes
+            self.unacked[msg_id] = (msg, transfer_id)
+            if metrics.tracing:
+                self.traces[msg_id] = MessageTrace(send=time.perf_counter())
+            self._enqueue_message(msg_id, msg, transfer_id)
+        return msg_id
+
+    def _enqueue_message(self, msg_id, msg, transfer_id):
+        if msg.startswith("IMG:"):
+            # Se extrae la ruta de imagen y se envía
+            self._enqueue(PRIORITY_TRANSFER, msg_id, self._image_frames(msg[4:], msg_id, transfer_id))
+        elif msg.startswith("FILE:"):
+            # Archivo adjunto de cualquier tipo
+            self._enqueue(PRIORITY_TRANSFER, msg_id, self._file_frames(msg[5:], msg_id, transfer_id))
+        else:
+            # Se envía texto normal
+            self._enqueue(PRIORITY_TEXT, msg_id, self._text_frames(msg))
+
+    def _enqueue(self, priority, msg_id, frames):
+        self.send_queue.put((priority, next(self.send_order), msg_id, frames, self.connection))
+
+    # Hilo de envío: toma siempre el mensaje más prioritario, envía UNA trama suya y, si le quedan
+    # más, lo vuelve a encolar. Así los textos se intercalan entre los trozos de una imagen. Un
+    # generador también puede devolver None para ceder el turno mientras prepara su siguiente trama.
+    def _sender_loop(self):
+        while True:
+            priority, order, msg_id, frames, connection = self.send_queue.get()
+            if frames is None:
+                break  # Señal de cierre
+            while self.retired_socks:
+                self.retired_socks.pop().close()
+            if connection != self.connection or not self.connected:
+                continue  # Conexión perdida: lo que sigue sin confirmar se reenvía al reconectar
+
+            sock = self.sock
+            try:
+                frame = next(frames)
+            except StopIteration:
+                continue  # Todas las tramas del mensaje ya se escribieron en el socket
+            except Exception as e:
+                self._report_send_error(msg_id, e)
+                continue
+
+            try:
+                if frame is not None:
+                    msg_type, payload = frame
+                    if isinstance(payload, FileRegion):
+                        send_file_frame(sock, msg_type, payload, msg_id)
+                        length = len(payload.prefix) + payload.count
+                    else:
+                        flags = 0
+                        if msg_type in COMPRESSIBLE_TYPES:
+                            if len(payload) > MAX_PAYLOAD_SIZE:
+                                # Comprimido cabría, pero nadie podría descomprimirlo
+                                raise ProtocolError(f"Payload demasiado grande: {len(payload)} bytes")
+                            payload, compressed = compress_payload(self.codec, payload)
+                            flags = FLAG_COMPRESSED if compressed else 0
+                        send_frame(sock, msg_type, payload, msg_id, flags)
+                        length = len(payload)
+                    self.frames_sent += 1
+                    self.bytes_sent += HEADER.size + length
+                    trace = self.traces.get(msg_id)
+                    if trace:
+                        trace.stamp("flush")  # La última antes de la confirmación es la de la última trama
+            except OSError as e:
+                if self.address is None:
+                    self._report_send_error(msg_id, e)
+                elif self.connected and connection == self.connection:
+                    # El mensaje sigue sin confirmar y se reenviará al reconectar
+                    print(f"[DEBUG] Conexión perdida al enviar el mensaje {msg_id}: {e}")
+                    self._connection_lost(sock)
+                continue
+            except ProtocolError as e:
+                self._report_send_error(msg_id, e)
+                continue
+
+            self.send_queue.put((priority, next(self.send_order), msg_id, frames, connection))
+
+    def _report_send_error(self, msg_id, error):
+        print(f"[ERROR] Error al enviar el mensaje {msg_id}: {error}")
+        with self.send_lock:
+            self.unacked.pop(msg_id, None)  # No se reintenta: fallaría igual
+            self.traces.pop(msg_id, None)
+        metrics.inc("chat_send_errors_total")
+        if self.on_send_error:
+            self.on_send_error(msg_id, error)
+
+    # El servidor confirma un mensaje: ya no hace falta guardarlo para reenviarlo
+    def _acknowledge(self, msg_id):
+        with self.send_lock:
+            confirmed = self.unacked.pop(msg_id, None) is not None
+            trace = self.traces.pop(msg_id, None)
+        if trace:
+            trace.stamp("ack")
+            # La confirmación puede llegar antes de que el hilo emisor anote la escritura
+            metrics.observe("chat_send_flush_seconds", trace.send, trace.flush or trace.ack)
+            metrics.observe("chat_send_ack_seconds", trace.send, trace.ack)
+        if confirmed:
+            self.messages_sent += 1
+        if confirmed and self.on_sent:
+            self.on_sent(msg_id)
+
+    # Latidos: mantienen viva la conexión aunque no se escriba nada y permiten notar una caída
+    # silenciosa (p. ej. un cable desconectado), en la que el socket no da error hasta mucho después
+    def _heartbeat_loop(self):
+        last_bytes = -1
+        last_change = time.monotonic()
+        while not self.closed.wait(HEARTBEAT_INTERVAL):
+            now = time.monotonic()
+            if self.reader.bytes_read != last_bytes:
+                last_bytes = self.reader.bytes_read
+                last_change = now
+            elif now - last_change > HEARTBEAT_TIMEOUT:
+                print("[ADVERTENCIA] El servidor no responde, se da la conexión por perdida")
+                self._connection_lost(self.sock)
+                last_change = now
+            self._enqueue(PRIORITY_TEXT, 0, self._control_frames(MSG_PING, b""))
+
+    # Corta una conexión que se da por perdida: el hilo receptor lo nota y reconecta
+    def _connection_lost(self, sock):
+        self.connected = False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Reconecta con esperas crecientes (con algo de azar, para que los clientes no reintenten todos
+    # a la vez) hasta lograrlo o hasta que se cierre el modelo
+    def _reconnect(self, error):
+        print(f"[ADVERTENCIA] Conexión perdida ({error}), reconectando...")
+        metrics.inc("chat_connection_losses_total")
+        self._connection_lost(self.sock)
+        self.retired_socks.append(self.sock)
+        if self.on_connection_state:
+            self.on_connection_state(False)
+        delay = RECONNECT_MIN_DELAY
+        while not self.closed.is_set():
+            try:
+                sock = self._connect(*self.address)
+            except (OSError, ProtocolError) as e:
+                wait = delay * random.uniform(0.5, 1.5)
+                print(f"[DEBUG] Reconexión fallida ({e}), nuevo intento en {wait:.1f}s")
+                self.closed.wait(wait)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            self._resume(sock)
+            metrics.inc("chat_reconnects_total")
+            if self.on_connection_state:
+                self.on_connection_state(True)
+            return
+        raise ConnectionError("Modelo cerrado durante la reconexión")
+
+    # Sigue con una conexión nueva: se reenvían los mensajes sin confirmar, en orden (el servidor
+    # descarta los que ya tenía y pide solo lo que falta de las subidas a medias), y se piden de
+    # nuevo, desde donde se quedaron, las descargas en curso
+    def _resume(self, sock):
+        with self.send_lock:
+            self.connection += 1
+            self.sock = sock
+            self.reader.sock = sock
+            self.connected = True
+            self.offers.clear()
+            for msg_id in sorted(self.unacked):
+                msg, transfer_id = self.unacked[msg_id]
+                self._enqueue_message(msg_id, msg, transfer_id)
+            for transfer in self.transfers.values():
+                self._enqueue(PRIORITY_TEXT, 0, self._fetch_frames(transfer))
+        print(f"[DEBUG] Reconectado: {len(self.unacked)} mensajes por reenviar, "
+              f"{len(self.transfers)} descargas por reanudar")
+
+    # Tramas de un mensaje de texto
+    def _text_frames(self, msg):
+        yield MSG_TEXT, msg.encode('utf-8')
+
+    # Trama de control del protocolo (peticiones al servidor), con la prioridad de los textos
+    def _control_frames(self, msg_type, payload):
+        yield msg_type, payload
+
+    # Tramas de una imagen: bytes crudos con su cabecera de metadatos. La imagen se abre y
+    # redimensiona aquí, en el hilo de envío, no en el hilo de la interfaz.
+    def _image_frames(self, img_path, msg_id, transfer_id):
+        if not os.path.exists(img_path):
+            raise FileNotFoundError(f"El archivo {img_path} no existe.")
+
+        fmt, width, height, source = self._encode_image(img_path)
+        yield from self._offer_frames(msg_id, TRANSFER_IMAGE, fmt, width, height, source, "", transfer_id)
+
+    # Trama con la vista previa de una imagen: un JPEG de 64px que llega casi tan rápido como un
+    # texto, para que quien la recibe vea algo mientras se transfiere la imagen completa. Si la
+    # vista previa no se puede generar, simplemente no se envía.
+    def _preview_frames(self, img_path, transfer_id):
+        try:
+            if os.path.getsize(img_path) <= PREVIEW_MIN_FILE_SIZE:
+                return  # Imagen pequeña: llegará enseguida
+            from PIL import Image
+
+            with Image.open(img_path) as img:
+                width, height = fit_size(img.width, img.height, MAX_IMAGE_SIZE)
+                img.draft('RGB', (PREVIEW_SIZE, PREVIEW_SIZE))  # JPEG: se decodifica ya a escala reducida
+                preview = img.convert('RGB')
+            preview.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+            buffer = io.BytesIO()
+            preview.save(buffer, format='JPEG', quality=PREVIEW_QUALITY)
+        except Exception as e:
+            print(f"[ADVERTENCIA] No se pudo generar la vista previa de {img_path}: {e}")
+            return
+        yield MSG_TRANSFER_PREVIEW, ImagePreview(transfer_id, self.username, width, height, buffer.getvalue()).pack()
+
+    # Tramas de un archivo adjunto: se envía tal cual desde el disco
+    def _file_frames(self, path, msg_id, transfer_id):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"El archivo {path} no existe.")
+        size = os.path.getsize(path)
+        if size > MAX_TRANSFER_SIZE:
+            raise ValueError(f"El archivo es demasiado grande ({size} bytes)")
+        yield from self._offer_frames(msg_id, TRANSFER_FILE, "", 0, 0, path, os.path.basename(path), transfer_id)
+
+    # Prepara lo que se envía de una imagen: (formato, ancho, alto, datos). Si ya cabe en 800x600 y
+    # su formato lo entienden todos los clientes, los datos son la ruta del fichero, que se envía
+    # tal cual desde el disco; si no, se reduce (o se convierte a PNG) en memoria. Las últimas
+    # imágenes reducidas se guardan para no repetir el trabajo si se vuelven a enviar.
+    def _encode_image(self, img_path):
+        stat = os.stat(img_path)
+        key = (os.path.abspath(img_path), stat.st_mtime_ns, stat.st_size)
+        if key in self.encoded_images:
+            self.encoded_images.move_to_end(key)
+            return self.encoded_images[key]
+
+        from PIL import Image  # Import diferido: el servidor sin interfaz no necesita PIL
+
+        with Image.open(img_path) as img:  # Solo lee la cabecera hasta que se piden los píxeles
+            fmt = img.format or 'PNG'
+            fits = img.width <= MAX_IMAGE_SIZE[0] and img.height <= MAX_IMAGE_SIZE[1]
+            if fits and fmt in SENDFILE_FORMATS:
+                return fmt, img.width, img.height, img_path
+
+            if not fits:
+                img.thumbnail(MAX_IMAGE_SIZE)  # Redimensionar manteniendo proporciones
+            if fmt not in SENDFILE_FORMATS:
+                fmt = 'PNG'
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt)
+            encoded = fmt, img.width, img.height, buffer.getbuffer()
+
+        self.encoded_images[key] = encoded
+        if len(self.encoded_images) > ENCODED_CACHE_SIZE:
+            self.encoded_images.popitem(last=False)
+        return encoded
+
+    # Trama de oferta: solo metadatos y hash. Los datos (bytes en memoria o la ruta de un fichero) se
+    # guardan hasta que el servidor responda si los necesita (NEED) o si ya los tenía (HAVE), en cuyo
+    # caso no se vuelven a enviar.
+    def _offer_frames(self, msg_id, kind, fmt, width, height, source, name, transfer_id):
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+            sha = hashlib.sha256()
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    sha.update(block)
+                    yield None  # Cede el turno: los textos no esperan a que se calcule el hash de un fichero grande
+            digest = sha.hexdigest()
+        else:
+            size = len(source)
+            digest = hashlib.sha256(source).hexdigest()
+
+        offer = TransferOffer(transfer_id, kind, fmt, width, height, size, digest, self.username, name)
+        self.offers[transfer_id] = (msg_id, source, size)
+        yield MSG_TRANSFER_OFFER, offer.pack()
+
+    # Tramas con los trozos de una transferencia en memoria, en orden desde `start`
+    def _chunk_frames(self, transfer_id, data, start=0):
+        for offset in range(start, len(data), CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            yield MSG_TRANSFER_CHUNK, CHUNK_HEADER.pack(transfer_id, offset) + chunk
+            # Al reanudarse el generador, el trozo ya se ha enviado
+            if self.on_progress:
+                self.on_progress(transfer_id, offset + len(chunk), len(data))
+
+    # Tramas con los trozos de un fichero: los datos no pasan por memoria, se envían con sendfile
+    def _file_chunk_frames(self, transfer_id, path, size, start=0):
+        with open(path, 'rb') as f:
+            for offset in range(start, size, CHUNK_SIZE):
+                count = min(CHUNK_SIZE, size - offset)
+                yield MSG_TRANSFER_CHUNK, FileRegion(CHUNK_HEADER.pack(transfer_id, offset), f, offset, count)
+                if self.on_progress:
+                    self.on_progress(transfer_id, offset + count, size)
+
+    # Recepción de mensaje (texto, imagen o archivo). Si la conexión se pierde, reconecta y
+    # devuelve None; solo lanza la excepción si no hay reconexión automática o el modelo se ha cerrado.
+    def receive_message(self):
+        if self.pending:
+            msg = self.pending.popleft()
+        else:
+            try:
+                msg = self._receive_frame()
+            except (OSError, ProtocolError, ValueError, struct.error) as e:
+                # Una trama mal formada o truncada deja el flujo desalineado: es una conexión perdida
+                if self.address is None or self.closed.is_set():
+                    if isinstance(e, ConnectionError):
+                        print("[DEBUG] Conexión cerrada.")
+                    if isinstance(e, OSError):
+                        raise
+                    self._connection_lost(self.sock)
+                    raise ConnectionError(f"Trama inválida: {e}") from e
+                self._reconnect(e)
+                return None
+        if msg is not None:
+            if not isinstance(msg, ImagePreview):
+                self.messages_received += 1
+            if metrics.tracing:
+                # Quien muestra el mensaje completa la traza con el instante en que lo hace (render)
+                self.received_trace = MessageTrace(receive=self.frame_received_at)
+                self.received_trace.stamp("decode")
+                metrics.observe("chat_receive_decode_seconds", self.received_trace.receive, self.received_trace.decode)
+        return msg
+
+    # Lee una trama. Los payloads se leen en los buffers reutilizables del FrameReader y los trozos
+    # de imagen, directamente en el buffer de su transferencia.
+    def _receive_frame(self):
+        msg_type, flags, length, msg_id = self.reader.read_header()
+        if metrics.tracing:
+            self.frame_received_at = time.perf_counter()
+        self.frames_received += 1
+        if msg_type == MSG_TRANSFER_CHUNK and not flags & FLAG_COMPRESSED:
+            return self._receive_chunk(length)
+        payload = self.reader.read_payload(length)
+        if flags & FLAG_COMPRESSED:
+            if msg_type == MSG_TRANSFER_CHUNK:
+                raise ProtocolError("Los trozos de transferencia no se comprimen")
+            payload = decompress_payload(self.codec, payload)
+        return self._handle_message(msg_type, msg_id, payload)
+
+    # Según el tipo de trama, determina el tipo de mensaje
+    def _handle_message(self, msg_type, msg_id, payload):
+        if msg_type in SYNC_TYPES and msg_id:
+            if msg_id <= self.last_seq:
+                return None  # Ya recibido
+            self.last_seq = msg_id
+            if msg_id in self.skip_seqs:
+                self.skip_seqs.discard(msg_id)
+                return None  # Recibido y guardado en una sesión anterior
+
+        if msg_type == MSG_TEXT:
+            return str(payload, 'utf-8')
+        elif msg_type == MSG_TRANSFER_OFFER:
+            return self._receive_offer(payload, msg_id)
+        elif msg_type == MSG_SYNC_BATCH:
+            # Mensajes que se enviaron mientras no estábamos conectados: se devuelven de uno en uno
+            for entry_type, seq, entry in iter_sync_entries(payload):
+                msg = self._handle_message(entry_type, seq, entry)
+                if msg is not None:
+                    self.pending.append(msg)
+            return self.pending.popleft() if self.pending else None
+        elif msg_type == MSG_TRANSFER_PREVIEW:
+            return ImagePreview.unpack(payload)
+        elif msg_type == MSG_TRANSFER_NEED:
+            self._upload(*TRANSFER_NEED.unpack_from(payload))
+            return None
+        elif msg_type == MSG_TRANSFER_HAVE:
+            self._skip_upload(TRANSFER_REPLY.unpack_from(payload)[0])
+            return None
+        elif msg_type == MSG_TRANSFER_MISSING:
+            self._fail_download(TRANSFER_REPLY.unpack_from(payload)[0])
+            return None
+        elif msg_type == MSG_ACK:
+            self._acknowledge(msg_id)
+            # Todo lo numerado antes que nuestro mensaje ya nos ha llegado (el servidor lo encoló antes)
+            self.last_seq = max(self.last_seq, ACK_SEQ.unpack_from(payload)[0])
+            return None
+        elif msg_type == MSG_PONG:
+            return None
+        else:
+            print(f"[ADVERTENCIA] Tipo de mensaje desconocido: {msg_type}")
+            return None
+
+    # El servidor no tiene el contenido ofrecido (o solo una parte, si se reanuda una subida
+    # cortada): se encolan los trozos desde la posición que pide
+    def _upload(self, transfer_id, start):
+        msg_id, source, size = self.offers.pop(transfer_id, (None, None, 0))
+        if source is None:
+            print(f"[ADVERTENCIA] Petición de subida de una oferta desconocida: {transfer_id}")
+            return
+        if start:
+            print(f"[DEBUG] Se reanuda la subida {transfer_id} en {start} de {size} bytes")
+        else:
+            msg = self.unacked.get(msg_id, ("", None))[0]
+            if msg.startswith("IMG:"):
+                # La imagen se sube de verdad: antes, una vista previa diminuta con la prioridad de
+                # los textos. Si el servidor ya la tenía (HAVE) no hace falta: llega enseguida entera.
+                self._enqueue(PRIORITY_TEXT, 0, self._preview_frames(msg[4:], transfer_id))
+        if isinstance(source, str):
+            frames = self._file_chunk_frames(transfer_id, source, size, start)
+        else:
+            frames = self._chunk_frames(transfer_id, source, start)
+        self._enqueue(PRIORITY_TRANSFER, msg_id, frames)
+
+    # El servidor ya tenía el contenido: no hace falta subir nada
+    def _skip_upload(self, transfer_id):
+        msg_id, source, size = self.offers.pop(transfer_id, (None, None, 0))
+        if source is not None:
+            print(f"[DEBUG] El servidor ya tenía el contenido ({size} bytes), no se vuelve a enviar")
+
+    # El servidor no tiene el contenido de una oferta que hemos pedido: la descarga no terminará
+    def _fail_download(self, transfer_id):
+        transfer = self.transfers.pop(transfer_id, None)
+        if transfer is None:
+            return
+        transfer.discard()
+        print(f"[ERROR] El servidor no tiene el contenido de la transferencia {transfer_id}")
+        if self.on_transfer_error:
+            self.on_transfer_error(transfer_id, "el servidor no tiene el contenido")
+
+    # Oferta de otro participante: si el contenido ya está en el almacén local se muestra sin
+    # descargarlo; si no, se registra la transferencia y se piden los datos al servidor
+    def _receive_offer(self, payload, seq=0):
+        offer = TransferOffer.unpack(payload)
+        if self.blobs is not None and self.blobs.has(offer.digest):
+            return offer.message(path=self.blobs.path(offer.digest))
+
+        transfer = IncomingTransfer(offer, self.temp_dir)
+        if transfer.is_complete():
+            return transfer.finish(self.blobs)  # Transferencia vacía: no llegará ningún trozo
+        transfer.seq = seq
+        self.transfers[offer.transfer_id] = transfer
+        self._enqueue(PRIORITY_TEXT, 0, self._fetch_frames(transfer))
+        return None
+
+    # Petición de los datos de una transferencia entrante, desde lo que ya se ha recibido
+    def _fetch_frames(self, transfer):
+        request = FETCH_REQUEST.pack(transfer.transfer_id, bytes.fromhex(transfer.offer.digest), transfer.received)
+        yield MSG_TRANSFER_FETCH, request
+
+    # Lee un trozo y lo escribe en su transferencia; devuelve el mensaje (imagen o archivo) cuando se completa
+    def _receive_chunk(self, length):
+        if length < CHUNK_HEADER.size:
+            raise ProtocolError("Trozo de transferencia demasiado corto")
+        transfer_id, offset = CHUNK_HEADER.unpack(self.reader.read_payload(CHUNK_HEADER.size))
+        size = length - CHUNK_HEADER.size
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None:
+            self.reader.read_payload(size)  # Se descarta
+            print(f"[ADVERTENCIA] Trozo de una transferencia desconocida: {transfer_id}")
+            return None
+
+        target = transfer.chunk_view(offset, size)
+        if target is not None:
+            # Sin copias: el socket escribe directamente en el buffer de la imagen
+            self.reader.read_into(target)
+            transfer.commit(target)
+        else:
+            transfer.write(offset, self.reader.read_payload(size))
+        if self.on_progress:
+            self.on_progress(transfer_id, transfer.received, transfer.size)
+        if not transfer.is_complete():
+            return None
+
+        del self.transfers[transfer_id]
+        try:
+            return transfer.finish(self.blobs)
+        except (ProtocolError, OSError) as e:
+            print(f"[ERROR] Transferencia recibida descartada: {e}")
+            return None
+
+    # Cierre seguro de sockets
+    def close(self):
+        self.closed.set()
+        self.send_queue.put((-1, -1, 0, None, 0))  # Detiene el hilo de envío
+        self.sock.close()
+        for sock in self.retired_socks:
+            sock.close()
+        if self.server:
+            self.server.stop()
+        for transfer in self.transfers.values():
+            transfer.discard()
+        self.transfers.clear()
+        self.offers.clear()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
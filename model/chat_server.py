@@ -0,0 +1,502 @@
+import collections
+import random
+import selectors
+import shutil
+import socket
+import struct
+import tempfile
+import time
+
+from model.blob_store import BlobStore
+from model.chat_model import (FrameDecoder, ProtocolError, encode_frame, TransferOffer, IncomingTransfer,
+                              MSG_TRANSFER_OFFER, MSG_TRANSFER_CHUNK, MSG_TRANSFER_NEED,
+                              MSG_TRANSFER_HAVE, MSG_TRANSFER_FETCH, MSG_TRANSFER_MISSING,
+                              MSG_HELLO, MSG_ACK, MSG_PING, MSG_PONG,
+                              MSG_SYNC_BATCH, SYNC_TYPES, SYNC_ENTRY, ACK_SEQ,
+                              CHUNK_HEADER, TRANSFER_REPLY, TRANSFER_NEED, FETCH_REQUEST, CHUNK_SIZE,
+                              FLAG_COMPRESSED, COMPRESSIBLE_TYPES, HEARTBEAT_TIMEOUT,
+                              decompress_payload, encode_hello, decode_hello)
+from model.compression import choose_codec, compress_payload
+from model.metrics import metrics
+
+MAX_OUTPUT_BUFFER = 32 * 1024 * 1024  # Si un cliente acumula más de 32MB sin leer, se le desconecta
+DOWNLOAD_WINDOW = 256 * 1024          # Bytes de descargas que se adelantan al buffer de salida de un cliente
+RECV_SIZE = 64 * 1024
+CLIENT_TIMEOUT = 2 * HEARTBEAT_TIMEOUT  # Sin recibir nada (ni latidos) en este tiempo, se desconecta al cliente
+SESSION_TIMEOUT = 300                   # Segundos que se guarda la sesión de un cliente desconectado
+SEEN_IDS_LIMIT = 10000                  # Ids de mensaje recordados por sesión para descartar reenvíos
+MESSAGE_LOG_MAX_MESSAGES = 5000         # Mensajes que se guardan para los clientes que se conectan después
+MESSAGE_LOG_MAX_BYTES = 16 * 1024 * 1024
+SYNC_BATCH_SIZE = 256 * 1024            # Tamaño (sin comprimir) de cada lote de sincronización
+SYNC_CACHE_SIZE = 4                     # Lotes ya preparados que se recuerdan (p. ej. muchos clientes reconectando a la vez)
+
+
+# Lo que sobrevive a una reconexión de un cliente: sus subidas a medias y los ids de los mensajes
+# ya recibidos, para no reenviar al resto un mensaje que el cliente repite porque no le llegó la
+# confirmación. Los clientes sin id de sesión (0) tienen una sesión nueva en cada conexión.
+class ClientSession:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.uploads = {}               # Subidas en curso (id -> IncomingTransfer)
+        self.seen_ids = set()           # Ids de mensaje ya recibidos enteros
+        self.seen_order = collections.deque()
+        self.client = None              # Conexión actual (None si está desconectado)
+        self.disconnected_at = None
+        self.last_published = 0         # Número de secuencia del último mensaje suyo reenviado al resto
+
+    def seen(self, msg_id):
+        return msg_id in self.seen_ids
+
+    def mark_seen(self, msg_id):
+        self.seen_ids.add(msg_id)
+        self.seen_order.append(msg_id)
+        if len(self.seen_order) > SEEN_IDS_LIMIT:
+            self.seen_ids.discard(self.seen_order.popleft())
+
+    def discard_uploads(self):
+        for upload in self.uploads.values():
+            upload.discard()
+        self.uploads.clear()
+
+
+# Estado de cada cliente conectado al servidor
+class ClientConnection:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.decoder = FrameDecoder()   # Tramas entrantes a medio recibir
+        self.out_buffer = bytearray()   # Bytes pendientes de enviar a este cliente
+        self.downloads = collections.deque()  # Descargas pendientes (generadores de tramas)
+        self.codec = None               # Códec de compresión acordado en el saludo
+        self.session = ClientSession(0) # Anónima hasta el saludo
+        self.last_activity = time.monotonic()
+
+
+# Servidor de chat multicliente: un único bucle de eventos (selectors) con sockets no bloqueantes
+# que reenvía cada mensaje recibido al resto de participantes. Las imágenes se guardan en un
+# almacén direccionado por contenido: cada una se sube una sola vez y los clientes solo descargan
+# las que no tienen ya.
+class ChatServer:
+    def __init__(self, host='localhost', port=12345, backlog=128, blob_dir=None):
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        # Sin directorio indicado, las imágenes se guardan en uno temporal que se borra al terminar
+        self.owns_blob_dir = blob_dir is None
+        self.blobs = BlobStore(blob_dir or tempfile.mkdtemp(prefix="chat_server_"))
+        self.selector = selectors.DefaultSelector()
+        self.listen_sock = None
+        self.clients = {}       # socket -> ClientConnection
+        self.sessions = {}      # id de sesión -> ClientSession
+        # Registro de los últimos mensajes reenviados, numerados, para quien se conecta después. Los
+        # números empiezan de cero en cada arranque, que se identifica con `epoch`.
+        self.epoch = random.getrandbits(63) + 1
+        self.seq = 0
+        self.message_log = collections.deque()  # (número, tipo, payload, flags, códec del payload, id de sesión)
+        self.message_log_bytes = 0
+        self.sync_cache = collections.OrderedDict()  # (desde, hasta, códec) -> tramas de sincronización
+        self.last_timeout_check = 0
+        self.recv_buffer = bytearray(RECV_SIZE)  # Buffer de lectura reutilizado para todos los clientes
+        self.recv_view = memoryview(self.recv_buffer)
+        self.running = False
+        # Contadores para las métricas (solo los actualiza el hilo del bucle de eventos)
+        self.connections_accepted = 0
+        self.disconnects = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        metrics.register(self.collect_metrics)
+
+    def collect_metrics(self):
+        """Contadores y valores del servidor para el registro de métricas (ver Metrics.register)."""
+        return ({"chat_server_connections_total": self.connections_accepted,
+                 "chat_server_disconnects_total": self.disconnects,
+                 "chat_server_frames_received_total": self.frames_received,
+                 "chat_server_bytes_received_total": self.bytes_received,
+                 "chat_server_bytes_sent_total": self.bytes_sent,
+                 "chat_server_messages_published_total": self.seq},
+                {"chat_server_clients": len(self.clients)})
+
+    # Abre el socket de escucha (lanza OSError si el puerto está ocupado)
+    def start(self):
+        self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_sock.bind((self.host, self.port))
+        self.listen_sock.listen(self.backlog)
+        self.listen_sock.setblocking(False)
+        self.selector.register(self.listen_sock, selectors.EVENT_READ)
+        self.running = True
+        print(f"[DEBUG] Servidor escuchando en {self.host}:{self.port}")
+
+    # Bucle principal de eventos; termina al llamar a stop()
+    def serve_forever(self):
+        try:
+            while self.running:
+                for key, events in self.selector.select(timeout=0.5):
+                    if key.fileobj is self.listen_sock:
+                        self._accept()
+                        continue
+                    client = self.clients.get(key.fileobj)
+                    if client and events & selectors.EVENT_READ:
+                        self._read(client)
+                    if client and client.sock in self.clients and events & selectors.EVENT_WRITE:
+                        self._write(client)
+                self._check_timeouts()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        self.running = False
+
+    def _accept(self):
+        try:
+            sock, addr = self.listen_sock.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients[sock] = ClientConnection(sock, addr)
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.connections_accepted += 1
+        print(f"[DEBUG] Conexión establecida con {addr} ({len(self.clients)} clientes)")
+
+    def _read(self, client):
+        try:
+            n = client.sock.recv_into(self.recv_view)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"[DEBUG] Error leyendo de {client.addr}: {e}")
+            self._disconnect(client)
+            return
+
+        if not n:
+            self._disconnect(client)
+            return
+        client.last_activity = time.monotonic()
+        self.bytes_received += n
+
+        try:
+            frames = client.decoder.feed(self.recv_view[:n])
+        except (ProtocolError, ValueError, struct.error) as e:
+            print(f"[ERROR] Trama inválida de {client.addr}: {e}")
+            self._disconnect(client)
+            return
+        self.frames_received += len(frames)
+
+        for msg_type, flags, msg_id, payload in frames:
+            if client.sock not in self.clients:
+                return  # Desconectado mientras se procesaban sus tramas (p. ej. demasiado lento)
+            try:
+                self._handle_frame(client, msg_type, flags, msg_id, payload)
+            except (ProtocolError, OSError, ValueError, struct.error) as e:
+                # Una trama mal formada solo desconecta a quien la envió, nunca detiene el servidor
+                print(f"[ERROR] Trama inválida de {client.addr}: {e}")
+                self._disconnect(client)
+                return
+
+    def _handle_frame(self, client, msg_type, flags, msg_id, payload):
+        if msg_type == MSG_HELLO:
+            self._hello(client, payload)
+            return
+        if msg_type == MSG_PING:
+            self._queue(client, encode_frame(MSG_PONG, b""))
+            return
+        if flags & FLAG_COMPRESSED and client.codec is None:
+            # Se reenviaría tal cual a los demás clientes sin códec, que no podrían leerla
+            raise ProtocolError("Trama comprimida sin códec acordado")
+        if flags & FLAG_COMPRESSED and msg_type in (MSG_TRANSFER_OFFER, MSG_TRANSFER_CHUNK, MSG_TRANSFER_FETCH):
+            payload = decompress_payload(client.codec, payload)
+            flags &= ~FLAG_COMPRESSED
+        elif flags & FLAG_COMPRESSED:
+            # Se guarda y se reenvía comprimida, pero antes se comprueba que descomprimida no pase del
+            # límite: si no, ningún cliente podría leerla y envenenaría el registro de mensajes
+            decompress_payload(client.codec, payload)
+
+        if msg_type == MSG_TRANSFER_OFFER:
+            self._receive_offer(client, msg_id, flags, payload)
+        elif msg_type == MSG_TRANSFER_CHUNK:
+            self._receive_chunk(client, payload)
+        elif msg_type == MSG_TRANSFER_FETCH:
+            self._start_download(client, payload)
+        elif msg_id and client.session.seen(msg_id):
+            self._ack(client, msg_id)  # Reenvío tras una reconexión de un mensaje que ya llegó
+        elif msg_type in SYNC_TYPES:
+            # Textos: se numeran, se guardan en el registro y se reenvían al resto
+            self._ack(client, msg_id, self._publish(client, msg_type, payload, flags))
+        else:
+            # Vistas previas (y cualquier tipo desconocido) solo se reenvían a los conectados
+            self._forward(client, msg_type, payload, 0, flags)
+            self._ack(client, msg_id)
+
+    # Saludo de un cliente: se elige el códec de compresión de entre los que ofrece y, si ya
+    # se había conectado antes con el mismo id de sesión, se recupera su sesión. Después se le
+    # envían los mensajes del registro que no ha visto.
+    def _hello(self, client, payload):
+        session_id, epoch, last_seq, codecs = decode_hello(payload)
+        client.codec = choose_codec(codecs)
+        if session_id:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = ClientSession(session_id)
+            elif session.client is not None and session.client is not client:
+                # La conexión anterior se cortó sin que el servidor lo notara
+                self._disconnect(session.client)
+            session.client = client
+            session.disconnected_at = None
+            client.session = session
+        reply = encode_hello(session_id, [client.codec.name] if client.codec else [], self.epoch, self.seq)
+        self._queue(client, encode_frame(MSG_HELLO, reply))
+        self._sync(client, last_seq if epoch == self.epoch else 0)
+
+    # Confirma al remitente que un mensaje ha llegado entero, con el número que se le ha asignado
+    def _ack(self, client, msg_id, seq=0):
+        if msg_id:
+            client.session.mark_seen(msg_id)
+            self._queue(client, encode_frame(MSG_ACK, ACK_SEQ.pack(seq), msg_id))
+
+    # Numera un mensaje, lo guarda en el registro y lo reenvía al resto; devuelve su número
+    def _publish(self, sender, msg_type, payload, flags):
+        self.seq += 1
+        self.message_log.append((self.seq, msg_type, payload, flags, sender.codec, sender.session.id))
+        self.message_log_bytes += len(payload)
+        while len(self.message_log) > MESSAGE_LOG_MAX_MESSAGES or self.message_log_bytes > MESSAGE_LOG_MAX_BYTES:
+            self.message_log_bytes -= len(self.message_log.popleft()[2])
+        sender.session.last_published = self.seq
+        self._forward(sender, msg_type, payload, self.seq, flags)
+        return self.seq
+
+    # Envía a un cliente los mensajes del registro posteriores a `after`, agrupados en lotes
+    # comprimidos con su códec. Los lotes se recuerdan: si muchos clientes vuelven a la vez desde el
+    # mismo punto (p. ej. tras un corte de red), se preparan y comprimen una sola vez.
+    def _sync(self, client, after):
+        if after >= self.seq:
+            return
+        session = client.session
+        if session.id and session.last_published > after:
+            # Entre lo que le falta hay mensajes suyos, que no se le devuelven: lotes solo para él
+            frames = self._sync_frames(after, client.codec, session.id)
+        else:
+            key = (after, self.seq, client.codec.name if client.codec else None)
+            frames = self.sync_cache.get(key)
+            if frames is None:
+                frames = self.sync_cache[key] = self._sync_frames(after, client.codec)
+                if len(self.sync_cache) > SYNC_CACHE_SIZE:
+                    self.sync_cache.popitem(last=False)
+            else:
+                self.sync_cache.move_to_end(key)
+        for frame in frames:
+            self._queue(client, frame)
+
+    def _sync_frames(self, after, codec, skip_session=0):
+        frames = []
+        batch = bytearray()
+
+        def flush():
+            if batch:
+                payload, compressed = compress_payload(codec, bytes(batch))
+                frames.append(encode_frame(MSG_SYNC_BATCH, payload, 0, FLAG_COMPRESSED if compressed else 0))
+                batch.clear()
+
+        for seq, msg_type, payload, flags, payload_codec, session_id in self.message_log:
+            if seq <= after or (skip_session and session_id == skip_session):
+                continue
+            if flags & FLAG_COMPRESSED:
+                payload = decompress_payload(payload_codec, payload)
+            if SYNC_ENTRY.size + len(payload) > SYNC_BATCH_SIZE:
+                # Un mensaje muy largo no cabe en un lote: va en su propia trama, como si llegara ahora
+                flush()
+                out, compressed = payload, False
+                if msg_type in COMPRESSIBLE_TYPES:
+                    out, compressed = compress_payload(codec, payload)
+                frames.append(encode_frame(msg_type, out, seq, FLAG_COMPRESSED if compressed else 0))
+                continue
+            if len(batch) + SYNC_ENTRY.size + len(payload) > SYNC_BATCH_SIZE:
+                flush()
+            batch += SYNC_ENTRY.pack(msg_type, seq, len(payload))
+            batch += payload
+        flush()
+        return frames
+
+    # Reenvía una trama al resto de clientes, cada uno con su códec. Una trama comprimida se reenvía
+    # tal cual a quienes usan el mismo códec que el remitente y solo se descomprime (una vez) si
+    # alguno usa otro; la trama de cada códec se construye una sola vez.
+    def _forward(self, sender, msg_type, payload, msg_id, flags):
+        codec_name = lambda codec: codec.name if codec else None
+        frames = {}
+        raw = None
+        if flags & FLAG_COMPRESSED:
+            frames[codec_name(sender.codec)] = encode_frame(msg_type, payload, msg_id, flags)
+        else:
+            raw = payload
+        for client in list(self.clients.values()):
+            if client is sender:
+                continue
+            key = codec_name(client.codec)
+            frame = frames.get(key)
+            if frame is None:
+                if raw is None:
+                    raw = decompress_payload(sender.codec, payload)
+                compressed = False
+                out = raw
+                if msg_type in COMPRESSIBLE_TYPES:
+                    out, compressed = compress_payload(client.codec, raw)
+                out_flags = (flags & ~FLAG_COMPRESSED) | (FLAG_COMPRESSED if compressed else 0)
+                frame = frames[key] = encode_frame(msg_type, out, msg_id, out_flags)
+            self._queue(client, frame)
+
+    # Oferta de un cliente: si el contenido ya está en el almacén se anuncia directamente al resto;
+    # si no, se pide la subida (o lo que falta de ella, si se cortó en una conexión anterior) y se
+    # anuncia cuando termine
+    def _receive_offer(self, client, msg_id, flags, payload):
+        offer = TransferOffer.unpack(payload)
+        session = client.session
+        reply = TRANSFER_REPLY.pack(offer.transfer_id)
+        if msg_id and session.seen(msg_id):
+            # Reenvío tras una reconexión de una transferencia que ya se completó y anunció
+            self._queue(client, encode_frame(MSG_TRANSFER_HAVE, reply))
+            self._ack(client, msg_id)
+            return
+        if self.blobs.has(offer.digest):
+            self._queue(client, encode_frame(MSG_TRANSFER_HAVE, reply))
+            self._ack(client, msg_id, self._publish(client, MSG_TRANSFER_OFFER, payload, flags))
+            return
+
+        upload = session.uploads.get(offer.transfer_id)
+        if upload is not None and upload.offer.digest != offer.digest:
+            upload.discard()
+            upload = None
+        if upload is None:
+            upload = IncomingTransfer(offer, self.blobs.directory)
+            upload.announcement = payload
+            upload.msg_id = msg_id
+            session.uploads[offer.transfer_id] = upload
+        self._queue(client, encode_frame(MSG_TRANSFER_NEED, TRANSFER_NEED.pack(offer.transfer_id, upload.received)))
+        if upload.is_complete():
+            self._finish_upload(client, upload)
+
+    def _receive_chunk(self, client, payload):
+        if len(payload) < CHUNK_HEADER.size:
+            raise ProtocolError("Trozo de transferencia demasiado corto")
+        transfer_id, offset = CHUNK_HEADER.unpack_from(payload)
+        upload = client.session.uploads.get(transfer_id)
+        if upload is None:
+            print(f"[ADVERTENCIA] Trozo de una subida desconocida de {client.addr}: {transfer_id}")
+            return
+        upload.write(offset, memoryview(payload)[CHUNK_HEADER.size:])
+        if upload.is_complete():
+            self._finish_upload(client, upload)
+
+    def _finish_upload(self, client, upload):
+        del client.session.uploads[upload.transfer_id]
+        upload.finish(self.blobs)  # Comprueba el hash y lo guarda en el almacén
+        self._ack(client, upload.msg_id, self._publish(client, MSG_TRANSFER_OFFER, upload.announcement, 0))
+
+    # Petición de descarga (desde el principio o desde donde se cortó): los trozos se van leyendo
+    # del almacén a medida que el cliente los acepta
+    def _start_download(self, client, payload):
+        if len(payload) != FETCH_REQUEST.size:
+            raise ProtocolError("Petición de descarga de tamaño incorrecto")
+        transfer_id, digest, offset = FETCH_REQUEST.unpack_from(payload)
+        digest = digest.hex()
+        if not self.blobs.has(digest):
+            print(f"[ADVERTENCIA] {client.addr} pide un contenido que no está en el almacén: {digest}")
+            # Se le avisa, para que dé la descarga por fallida en lugar de esperarla para siempre
+            self._queue(client, encode_frame(MSG_TRANSFER_MISSING, TRANSFER_REPLY.pack(transfer_id)))
+            return
+        client.downloads.append(self._download_frames(transfer_id, self.blobs.path(digest), offset))
+        self._fill_downloads(client)
+
+    def _download_frames(self, transfer_id, path, offset):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield encode_frame(MSG_TRANSFER_CHUNK, CHUNK_HEADER.pack(transfer_id, offset) + chunk)
+                offset += len(chunk)
+
+    # Adelanta trozos de las descargas pendientes al buffer de salida, repartiendo entre ellas, sin
+    # llenarlo: así los textos que lleguen después no esperan detrás de una imagen entera
+    def _fill_downloads(self, client):
+        while client.downloads and len(client.out_buffer) < DOWNLOAD_WINDOW:
+            frame = next(client.downloads[0], None)
+            if frame is None:
+                client.downloads.popleft()
+                continue
+            client.downloads.rotate(-1)
+            self._queue(client, frame)
+
+    # Encola bytes en el buffer de salida de un cliente y activa el aviso de escritura
+    def _queue(self, client, data):
+        if len(client.out_buffer) + len(data) > MAX_OUTPUT_BUFFER:
+            print(f"[ADVERTENCIA] Cliente {client.addr} demasiado lento, se desconecta")
+            self._disconnect(client)
+            return
+        was_empty = not client.out_buffer
+        client.out_buffer += data
+        if was_empty:
+            self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def _write(self, client):
+        try:
+            sent = client.sock.send(client.out_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"[DEBUG] Error escribiendo a {client.addr}: {e}")
+            self._disconnect(client)
+            return
+
+        del client.out_buffer[:sent]
+        self.bytes_sent += sent
+        self._fill_downloads(client)
+        if not client.out_buffer:
+            self.selector.modify(client.sock, selectors.EVENT_READ)
+
+    def _disconnect(self, client):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        client.downloads.clear()
+        self.disconnects += 1
+        session = client.session
+        if not session.id:
+            session.discard_uploads()
+        elif session.client is client:
+            # Las subidas a medias se guardan por si el cliente vuelve a conectarse
+            session.client = None
+            session.disconnected_at = time.monotonic()
+        print(f"[DEBUG] Cliente {client.addr} desconectado ({len(self.clients)} clientes)")
+
+    # Como mucho una vez por segundo: desconecta a los clientes que no dan señales de vida y
+    # olvida las sesiones de los que no han vuelto a conectarse
+    def _check_timeouts(self):
+        now = time.monotonic()
+        if now - self.last_timeout_check < 1:
+            return
+        self.last_timeout_check = now
+        for client in list(self.clients.values()):
+            if now - client.last_activity > CLIENT_TIMEOUT:
+                print(f"[ADVERTENCIA] Cliente {client.addr} sin actividad, se desconecta")
+                self._disconnect(client)
+        for session_id, session in list(self.sessions.items()):
+            if session.client is None and now - session.disconnected_at > SESSION_TIMEOUT:
+                session.discard_uploads()
+                del self.sessions[session_id]
+
+    def _shutdown(self):
+        for client in list(self.clients.values()):
+            self._disconnect(client)
+        for session in self.sessions.values():
+            session.discard_uploads()
+        self.sessions.clear()
+        if self.listen_sock:
+            self.selector.unregister(self.listen_sock)
+            self.listen_sock.close()
+            self.listen_sock = None
+        self.selector.close()
+        if self.owns_blob_dir:
+            shutil.rmtree(self.blobs.directory, ignore_errors=True)
@@ -0,0 +1,79 @@
+import lzma
+import zlib
+
+try:
+    import zstandard  # Dependencia opcional: si está instalada, se ofrece zstd
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE = 512  # Por debajo de este tamaño no merece la pena comprimir
+
+
+class CompressionError(Exception):
+    """Payload comprimido inválido o que excede el tamaño permitido al descomprimirlo."""
+
+
+# Un códec de compresión por trama. `decompress` recibe el tamaño máximo admitido del resultado,
+# así un payload malicioso no puede expandirse sin límite en memoria.
+class Codec:
+    def __init__(self, name, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _zlib_decompress(data, limit):
+    decompressor = zlib.decompressobj()
+    try:
+        result = decompressor.decompress(data, limit)
+    except zlib.error as e:
+        raise CompressionError(str(e))
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise CompressionError("Payload zlib demasiado grande o incompleto")
+    return result
+
+
+def _lzma_decompress(data, limit):
+    decompressor = lzma.LZMADecompressor()
+    try:
+        result = decompressor.decompress(data, max_length=limit)
+    except lzma.LZMAError as e:
+        raise CompressionError(str(e))
+    if not decompressor.eof:
+        raise CompressionError("Payload lzma demasiado grande o incompleto")
+    return result
+
+
+def _zstd_decompress(data, limit):
+    try:
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=limit)
+    except zstandard.ZstdError as e:
+        raise CompressionError(str(e))
+
+
+# Códecs disponibles, en orden de preferencia: zstd (si está instalado) y zlib son rápidos;
+# lzma comprime algo más pero es mucho más lento.
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = Codec("zstd", lambda data: zstandard.ZstdCompressor(level=3).compress(data), _zstd_decompress)
+CODECS["zlib"] = Codec("zlib", lambda data: zlib.compress(data, 6), _zlib_decompress)
+CODECS["lzma"] = Codec("lzma", lambda data: lzma.compress(data, preset=1), _lzma_decompress)
+
+
+def choose_codec(offered):
+    """Elige el códec preferido de entre los que ofrece el otro extremo (None si no hay ninguno común)."""
+    for name in CODECS:
+        if name in offered:
+            return CODECS[name]
+    return None
+
+
+def compress_payload(codec, payload):
+    """Comprime un payload si hay códec, supera el umbral y el resultado es más pequeño.
+    Devuelve (payload, comprimido)."""
+    if codec is None or len(payload) < COMPRESS_MIN_SIZE:
+        return payload, False
+    compressed = codec.compress(payload)
+    if len(compressed) >= len(payload):
+        return payload, False
+    return compressed, True
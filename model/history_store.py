@@ -0,0 +1,304 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from model.blob_store import BlobStore
+
+PAGE_SIZE = 100           # Mensajes que se cargan de cada vez al subir por el historial
+SEARCH_LIMIT = 200        # Máximo de resultados de una búsqueda
+BATCH_MAX_SIZE = 500      # Máximo de mensajes por transacción del hilo escritor
+BATCH_MAX_DELAY = 0.05    # Tiempo máximo (s) que espera el escritor para agrupar mensajes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    sender TEXT NOT NULL,
+    kind TEXT NOT NULL,          -- 'text', 'image' o 'file'
+    body TEXT,                   -- Mensaje completo ("nombre: texto") o nombre del archivo adjunto
+    blob_hash TEXT,              -- Hash de la imagen o del archivo en el BlobStore
+    image_format TEXT,
+    width INTEGER,
+    height INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Índice de texto completo (SQLite FTS5) sobre los textos. Usa la tabla `messages` como contenido
+# y se mantiene al día con un trigger, en la misma transacción que cada lote del escritor.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    body, content='messages', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages WHEN new.body IS NOT NULL BEGIN
+    INSERT INTO messages_fts(rowid, body) VALUES (new.id, new.body);
+END;
+"""
+
+
+# Directorio donde se guardan el historial y las imágenes (configurable con CHAT_DATA_DIR)
+def default_data_dir():
+    return os.environ.get("CHAT_DATA_DIR", os.path.join(os.path.expanduser("~"), ".chat_lnvf"))
+
+
+# Un mensaje leído del historial
+class HistoryRecord:
+    def __init__(self, record_id, timestamp, sender, kind, body, blob_hash, image_format, width, height):
+        self.id = record_id
+        self.timestamp = timestamp
+        self.sender = sender
+        self.kind = kind
+        self.body = body
+        self.blob_hash = blob_hash
+        self.image_format = image_format
+        self.width = width
+        self.height = height
+        self.blob_path = None  # Ruta del blob de la imagen o del archivo (la rellena HistoryStore)
+
+
+# Historial local de la conversación (SQLite, solo se añaden filas). Las escrituras las hace un
+# hilo en segundo plano que agrupa los mensajes en una transacción por lote; las lecturas son
+# páginas por id descendente, de modo que la vista solo carga lo que el usuario va viendo.
+class HistoryStore:
+    def __init__(self, username, data_dir=None):
+        data_dir = data_dir or default_data_dir()
+        os.makedirs(data_dir, exist_ok=True)
+        safe_name = re.sub(r"[^\w-]", "_", username) or "_"
+        self.db_path = os.path.join(data_dir, f"historial_{safe_name}.db")
+        self.blobs = BlobStore(os.path.join(data_dir, "blobs"))
+
+        # Conexión de lectura (hilo de la interfaz); también crea el esquema antes de arrancar el escritor
+        self.db = self._connect()
+        self.db.executescript(SCHEMA)
+        self.has_fts = self._create_fts_index()
+        self.db.commit()
+
+        # Los ids se asignan al añadir el mensaje (y no al escribirlo) para que la vista pueda
+        # asociar cada burbuja con su fila del historial, p. ej. al saltar a un resultado de búsqueda
+        self.id_lock = threading.Lock()
+        self.next_id = (self.db.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1
+
+        self.write_queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")    # Lecturas y escrituras concurrentes
+        db.execute("PRAGMA synchronous=NORMAL")  # Suficiente con WAL y mucho más rápido
+        return db
+
+    def _create_fts_index(self):
+        try:
+            is_new = not self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+            self.db.executescript(FTS_SCHEMA)
+            if is_new:
+                # Historial creado antes de existir el índice: se indexa lo que ya había
+                self.db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"[ADVERTENCIA] SQLite sin FTS5, la búsqueda será más lenta: {e}")
+            return False
+
+    def _new_id(self):
+        with self.id_lock:
+            record_id = self.next_id
+            self.next_id += 1
+        return record_id
+
+    # Guarda un mensaje de texto ("nombre: texto") y devuelve su id en el historial. Con
+    # `sync_position` (id de arranque, número de secuencia, posteriores ya recibidos), la posición en el historial del servidor
+    # se guarda en la misma transacción que el mensaje: si la aplicación se cierra de golpe, al
+    # volver no se reciben de nuevo mensajes que ya estaban guardados
+    def add_text(self, msg, sync_position=None):
+        sender = msg.split(":", 1)[0] if ":" in msg else ""
+        record_id = self._new_id()
+        self.write_queue.put((record_id, "text", time.time(), sender, msg, sync_position))
+        return record_id
+
+    # Guarda una imagen recibida (ImageMessage)
+    def add_image(self, sender, image, sync_position=None):
+        record_id = self._new_id()
+        self.write_queue.put((record_id, "image", time.time(), sender, image, sync_position))
+        return record_id
+
+    # Guarda una imagen propia a partir de su fichero
+    def add_image_file(self, sender, path):
+        record_id = self._new_id()
+        self.write_queue.put((record_id, "image_file", time.time(), sender, path, None))
+        return record_id
+
+    # Guarda un archivo adjunto recibido (FileMessage)
+    def add_file(self, sender, file, sync_position=None):
+        record_id = self._new_id()
+        self.write_queue.put((record_id, "file", time.time(), sender, file, sync_position))
+        return record_id
+
+    # Guarda un archivo adjunto propio a partir de su ruta
+    def add_file_path(self, sender, path):
+        record_id = self._new_id()
+        self.write_queue.put((record_id, "file_path", time.time(), sender, path, None))
+        return record_id
+
+    # Devuelve hasta `limit` mensajes anteriores a `before_id` (o los últimos), en orden cronológico
+    def load_page(self, before_id=None, limit=PAGE_SIZE):
+        query = ("SELECT id, timestamp, sender, kind, body, blob_hash, image_format, width, height "
+                 "FROM messages")
+        if before_id is None:
+            rows = self.db.execute(query + " ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = self.db.execute(query + " WHERE id < ? ORDER BY id DESC LIMIT ?",
+                                   (before_id, limit)).fetchall()
+        return self._to_records(reversed(rows))
+
+    # Devuelve hasta `limit` mensajes posteriores a `after_id`, en orden cronológico
+    def load_after(self, after_id, limit=PAGE_SIZE):
+        rows = self.db.execute("SELECT id, timestamp, sender, kind, body, blob_hash, image_format, "
+                               "width, height FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                               (after_id, limit)).fetchall()
+        return self._to_records(rows)
+
+    # Busca texto en el historial; devuelve los ids de los mensajes encontrados, del más reciente al más antiguo
+    def search(self, text, limit=SEARCH_LIMIT):
+        words = text.split()
+        if not words:
+            return []
+        if self.has_fts:
+            # Cada palabra entre comillas (sin operadores FTS), sin distinguir tildes ni mayúsculas.
+            # Solo se buscan prefijos si el usuario lo pide con "*" ("hol*" encuentra "hola"):
+            # un prefijo largo es mucho más lento que una palabra exacta.
+            terms = []
+            for word in words:
+                prefix = word.endswith("*")
+                word = word.rstrip("*")
+                if not any(ch.isalnum() for ch in word):
+                    continue  # "*" o signos sueltos: un término vacío haría que no coincidiera nada
+                word = word.replace('"', '""')
+                terms.append(f'"{word}"*' if prefix else f'"{word}"')
+            if not terms:
+                return []
+            query = " ".join(terms)
+            rows = self.db.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? "
+                                   "ORDER BY rowid DESC LIMIT ?", (query, limit)).fetchall()
+        else:
+            conditions = " AND ".join("body LIKE ?" for _ in words)
+            rows = self.db.execute(f"SELECT id FROM messages WHERE {conditions} ORDER BY id DESC LIMIT ?",
+                                   [f"%{word.rstrip('*')}%" for word in words] + [limit]).fetchall()
+        return [row[0] for row in rows]
+
+    # Posición en el historial del servidor (id de arranque, número de secuencia y números
+    # posteriores ya recibidos, ver ChatModel.sync_position) con la que se cerró la última sesión:
+    # al volver a conectar solo se reciben los mensajes que faltan
+    def load_sync_position(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'sync_position'").fetchone()
+        if row is None:
+            return 0, 0, ()
+        epoch, seq, *skip = row[0].split(":")
+        skip = tuple(int(value) for value in skip[0].split(",")) if skip and skip[0] else ()
+        return int(epoch), int(seq), skip
+
+    # Se guarda desde el hilo escritor, después de los mensajes encolados antes
+    def save_sync_position(self, epoch, seq, skip=()):
+        self.write_queue.put((None, "sync_position", time.time(), None, None, (epoch, seq, skip)))
+
+    def _to_records(self, rows):
+        records = [HistoryRecord(*row) for row in rows]
+        for record in records:
+            if record.blob_hash:
+                record.blob_path = self.blobs.path(record.blob_hash)
+        return records
+
+    # Hilo escritor: espera al primer mensaje y agrupa los que lleguen poco después en una transacción
+    def _writer_loop(self):
+        db = self._connect()
+        running = True
+        while running:
+            batch = [self.write_queue.get()]
+            deadline = time.monotonic() + BATCH_MAX_DELAY
+            while len(batch) < BATCH_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False  # Señal de cierre: se escribe lo pendiente y se termina
+                batch = [item for item in batch if item is not None]
+
+            rows = []
+            sync_position = None  # La última del lote
+            for *item, position in batch:
+                if position is not None:
+                    sync_position = position
+                if item[1] == "sync_position":
+                    continue
+                try:
+                    rows.append(self._to_row(*item))
+                except Exception as e:
+                    print(f"[ERROR] No se pudo guardar el mensaje en el historial: {e}")
+            try:
+                with db:
+                    db.executemany("INSERT INTO messages (id, timestamp, sender, kind, body, blob_hash, "
+                                   "image_format, width, height) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self._write_sync_position(db, sync_position)
+            except sqlite3.IntegrityError:
+                # Otro proceso ha usado ya alguno de los ids (mismo usuario abierto dos veces):
+                # se guardan igualmente con ids nuevos
+                with db:
+                    db.executemany("INSERT INTO messages (timestamp, sender, kind, body, blob_hash, "
+                                   "image_format, width, height) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [row[1:] for row in rows])
+                    self._write_sync_position(db, sync_position)
+            except sqlite3.Error as e:
+                print(f"[ERROR] Error escribiendo el historial: {e}")
+        db.close()
+
+    def _write_sync_position(self, db, sync_position):
+        if sync_position is not None:
+            epoch, seq, skip = sync_position
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sync_position', ?)",
+                       (f"{epoch}:{seq}:{','.join(map(str, skip))}",))
+
+    # Convierte un elemento de la cola en una fila de la tabla (imágenes y archivos se guardan en el
+    # BlobStore; de los archivos se guarda el nombre como texto, así también se encuentran al buscar)
+    def _to_row(self, record_id, kind, timestamp, sender, content):
+        if kind == "text":
+            return record_id, timestamp, sender, "text", content, None, None, None, None
+        if kind == "file":
+            digest = content.digest if content.digest and self.blobs.has(content.digest) \
+                else self.blobs.put_file(content.path)
+            return record_id, timestamp, sender, "file", content.name, digest, None, None, None
+        if kind == "file_path":
+            digest = self.blobs.put_file(content)
+            return record_id, timestamp, sender, "file", os.path.basename(content), digest, None, None, None
+        if kind == "image":
+            if content.digest and self.blobs.has(content.digest):
+                digest = content.digest  # Ya está en el almacén (se guardó al recibirla)
+            elif content.path:
+                digest = self.blobs.put_file(content.path)
+            else:
+                digest = self.blobs.put_bytes(content.data)
+            return (record_id, timestamp, sender, "image", None, digest, content.format,
+                    content.width, content.height)
+
+        from PIL import Image  # Import diferido: solo hace falta para leer el tamaño de la imagen
+
+        digest = self.blobs.put_file(content)
+        with Image.open(content) as img:
+            return record_id, timestamp, sender, "image", None, digest, img.format, img.width, img.height
+
+    def close(self):
+        self.write_queue.put(None)
+        self.writer_thread.join()  # Espera a que se escriba todo lo pendiente
+        self.db.close()
@@ -0,0 +1,296 @@
+import math
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+# Métricas del proceso (cliente o servidor): contadores, valores instantáneos e histogramas de
+# latencia. Los contadores se llevan siempre; las trazas de latencia por mensaje (unos 10us de CPU
+# por mensaje) solo si se publican las métricas, que se pide con variables de entorno:
+#   CHAT_METRICS_LOG=-|ruta   registro estructurado periódico (una línea JSON por intervalo; "-" = salida estándar)
+#   CHAT_METRICS_FILE=ruta    fichero con el texto de Prometheus, reescrito en cada intervalo
+#   CHAT_METRICS_PORT=9100    endpoint http://127.0.0.1:9100/metrics en formato de Prometheus
+#   CHAT_METRICS_INTERVAL=10  segundos entre volcados (por defecto: 10)
+
+METRIC_HELP = {
+    "chat_frames_sent_total": ("counter", "Tramas escritas en el socket por el cliente"),
+    "chat_frames_received_total": ("counter", "Tramas leídas del socket por el cliente"),
+    "chat_bytes_sent_total": ("counter", "Bytes escritos en el socket por el cliente (cabeceras incluidas)"),
+    "chat_bytes_received_total": ("counter", "Bytes leídos del socket por el cliente (cabeceras incluidas)"),
+    "chat_messages_sent_total": ("counter", "Mensajes enviados (confirmados por el servidor)"),
+    "chat_messages_received_total": ("counter", "Mensajes recibidos de otros participantes"),
+    "chat_send_errors_total": ("counter", "Mensajes que no se pudieron enviar"),
+    "chat_connection_losses_total": ("counter", "Conexiones con el servidor perdidas"),
+    "chat_reconnects_total": ("counter", "Reconexiones con el servidor"),
+    "chat_send_queue_depth": ("gauge", "Mensajes en la cola de envío"),
+    "chat_unacked_messages": ("gauge", "Mensajes enviados aún sin confirmar"),
+    "chat_send_flush_seconds": ("summary", "Desde send_message hasta escribir la última trama del mensaje en el socket"),
+    "chat_send_ack_seconds": ("summary", "Desde send_message hasta la confirmación del servidor"),
+    "chat_receive_decode_seconds": ("summary", "Desde leer la cabecera de la trama hasta tener el mensaje decodificado"),
+    "chat_receive_render_seconds": ("summary", "Desde tener el mensaje decodificado hasta mostrarlo en la ventana"),
+    "chat_gui_stalls_total": ("counter", "Bloqueos de la interfaz detectados en modo de diagnóstico (CHAT_DIAGNOSTICS)"),
+    "chat_server_clients": ("gauge", "Clientes conectados al servidor"),
+    "chat_server_connections_total": ("counter", "Conexiones aceptadas por el servidor"),
+    "chat_server_disconnects_total": ("counter", "Clientes desconectados"),
+    "chat_server_frames_received_total": ("counter", "Tramas recibidas por el servidor"),
+    "chat_server_bytes_received_total": ("counter", "Bytes recibidos por el servidor"),
+    "chat_server_bytes_sent_total": ("counter", "Bytes enviados por el servidor"),
+    "chat_server_messages_published_total": ("counter", "Mensajes numerados y reenviados por el servidor"),
+    "chat_process_start_time_seconds": ("gauge", "Instante de arranque del proceso (segundos desde 1970)"),
+}
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+DEFAULT_INTERVAL = 10
+FOLD_SIZE = 1024  # Muestras que se acumulan antes de pasarlas al histograma
+
+
+class Histogram:
+    """Histograma al estilo HDR de valores enteros (p. ej. microsegundos): cada potencia de dos se
+    divide en 64 cubos, así que un percentil tiene un error relativo menor del 1,6% sea cual sea
+    la escala. Los de varios hilos o procesos se suman con merge."""
+
+    def __init__(self):
+        self.counts = {}  # Límite inferior del cubo -> muestras
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value) if value > 0 else 0
+        shift = value.bit_length() - 7  # Se conservan los 7 bits más altos
+        bucket = (value >> shift) << shift if shift > 0 else value
+        counts = self.counts
+        counts[bucket] = counts.get(bucket, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return bucket
+        return self.max
+
+
+# Instantes (time.perf_counter) por los que pasa un mensaje. Uno enviado: send (send_message),
+# flush (última trama escrita en el socket) y ack (confirmación del servidor). Uno recibido:
+# receive (cabecera leída), decode (mensaje listo) y render (insertado en la ventana).
+class MessageTrace:
+    def __init__(self, send=None, receive=None):
+        self.send = send
+        self.flush = None
+        self.ack = None
+        self.receive = receive
+        self.decode = None
+        self.render = None
+
+    def stamp(self, stage):
+        setattr(self, stage, time.perf_counter())
+
+
+# Registro de métricas. Los contadores del camino de cada trama no pasan por aquí: cada ChatModel
+# o ChatServer los lleva en atributos propios (los actualiza un solo hilo, sin cerrojos) y los
+# entrega al volcar con el método que registra en `register`; los de varias instancias se suman.
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}  # nombre -> Histogram de microsegundos
+        self.samples = {}     # nombre -> deque de muestras aún no pasadas a su histograma
+        self.collectors = []  # weakref.WeakMethod de métodos que devuelven ({contadores}, {valores})
+        self.tracing = False  # Se anotan las trazas de latencia de cada mensaje (ver MessageTrace)
+        self.started = time.time()
+
+    def register(self, collector):
+        """Registra un método que devuelve ({contadores}, {valores}) al volcar las métricas."""
+        with self.lock:
+            self.collectors.append(weakref.WeakMethod(collector))
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, start, end):
+        """Anota en el histograma `name` la duración de un tramo (instantes de perf_counter). Se
+        llama por cada mensaje desde varios hilos: la muestra se añade a una deque (sin cerrojo) y
+        pasa al histograma por tandas."""
+        if start is None or end is None or not self.tracing:
+            return
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples.setdefault(name, deque())
+        samples.append((end - start) * 1000000)
+        if len(samples) >= FOLD_SIZE:
+            with self.lock:
+                self._fold()
+
+    def _fold(self):
+        """Pasa las muestras pendientes a sus histogramas (con el cerrojo)."""
+        for name, samples in list(self.samples.items()):
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            while samples:
+                histogram.record(samples.popleft())
+
+    def _collect(self):
+        """Contadores y valores actuales, incluidos los de las instancias registradas (con el cerrojo)."""
+        self._fold()
+        counters, gauges = dict(self.counters), {}  # Los valores solo los dan las instancias
+        alive = []
+        for ref in self.collectors:
+            collector = ref()
+            if collector is None:
+                continue  # Instancia ya liberada
+            alive.append(ref)
+            instance_counters, instance_gauges = collector()
+            for target, values in ((counters, instance_counters), (gauges, instance_gauges)):
+                for name, value in values.items():
+                    target[name] = target.get(name, 0) + value
+        self.collectors = alive
+        return counters, gauges
+
+    def snapshot(self):
+        """Estado actual para el registro estructurado (latencias en milisegundos)."""
+        with self.lock:
+            counters, gauges = self._collect()
+            latencies = {name: {"count": h.count,
+                                **{f"p{q * 100:g}": h.percentile(q * 100) / 1000 for q in SUMMARY_QUANTILES},
+                                "max": h.max / 1000}
+                         for name, h in self.histograms.items() if h.count}
+            return {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "pid": os.getpid(),
+                    "counters": counters, "gauges": gauges, "latency_ms": latencies}
+
+    def prometheus_text(self):
+        """Métricas en el formato de texto de Prometheus. Los histogramas se exportan como summary
+        (percentiles del histograma, en segundos)."""
+        lines = []
+
+        def header(name, default_type):
+            kind, help_text = METRIC_HELP.get(name, (default_type, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            counters, gauges = self._collect()
+            for name, value in sorted(counters.items()):
+                header(name, "counter")
+                lines.append(f"{name} {value}")
+            for name, value in sorted(gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{name} {value}")
+            for name, h in sorted(self.histograms.items()):
+                header(name, "summary")
+                for q in SUMMARY_QUANTILES:
+                    value = h.percentile(q * 100)
+                    lines.append(f'{name}{{quantile="{q}"}} {value / 1e6 if value is not None else "NaN"}')
+                lines.append(f"{name}_sum {h.sum / 1e6}")
+                lines.append(f"{name}_count {h.count}")
+        header("chat_process_start_time_seconds", "gauge")
+        lines.append(f"chat_process_start_time_seconds {self.started}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()  # Registro único del proceso
+
+
+def _http_server(port):
+    """Servidor HTTP local con las métricas en formato de Prometheus. http.server se importa aquí,
+    solo si se pide el endpoint: cuesta decenas de ms y retrasaría el arranque de la aplicación."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Sin una línea por cada consulta
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+# Publica las métricas según las variables CHAT_METRICS_*: un hilo vuelca periódicamente el
+# registro estructurado y el fichero de Prometheus, y un servidor HTTP local las sirve a demanda.
+class MetricsReporter:
+    def __init__(self, log_path=None, prometheus_path=None, port=None, interval=DEFAULT_INTERVAL):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.http_server = None
+        if port:
+            self.http_server = _http_server(port)
+            threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+            print(f"[DEBUG] Métricas en http://127.0.0.1:{port}/metrics")
+        if log_path or prometheus_path:
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        try:
+            if self.log_path:
+                import json  # Solo hace falta con CHAT_METRICS_LOG
+                line = json.dumps(metrics.snapshot(), ensure_ascii=False)
+                if self.log_path == "-":
+                    print(f"[METRICAS] {line}")
+                else:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(line + "\n")
+            if self.prometheus_path:
+                temp_path = self.prometheus_path + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(metrics.prometheus_text())
+                os.replace(temp_path, self.prometheus_path)  # Quien lo lea nunca ve un fichero a medias
+        except OSError as e:
+            print(f"[ERROR] No se pudieron volcar las métricas: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        self.dump()  # Último volcado, con lo ocurrido desde el anterior
+
+
+def start_metrics_reporting():
+    """Arranca la publicación de métricas si alguna variable CHAT_METRICS_* lo pide (si no, None)."""
+    log_path = os.environ.get("CHAT_METRICS_LOG")
+    prometheus_path = os.environ.get("CHAT_METRICS_FILE")
+    port = int(os.environ.get("CHAT_METRICS_PORT", "0"))
+    if not (log_path or prometheus_path or port):
+        return None
+    interval = float(os.environ.get("CHAT_METRICS_INTERVAL", DEFAULT_INTERVAL))
+    try:
+        reporter = MetricsReporter(log_path, prometheus_path, port, interval)
+    except OSError as e:
+        print(f"[ERROR] No se pudo publicar las métricas: {e}")
+        return None
+    metrics.tracing = True
+    return reporter
@@ -0,0 +1,35 @@
+import argparse
+import os
+import signal
+
+from model.chat_server import ChatServer
+from model.metrics import start_metrics_reporting
+
+# Servidor de chat sin interfaz gráfica (no importa PyQt5). Pensado para ejecutarse como proceso
+# de larga duración en una máquina sin pantalla:
+#   python -m server --host 0.0.0.0 --port 12345 --backlog 128
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de chat sin interfaz gráfica")
+    parser.add_argument("--host", default=os.environ.get("CHAT_HOST", "0.0.0.0"),
+                        help="Dirección en la que escuchar (por defecto: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("CHAT_PORT", "12345")),
+                        help="Puerto en el que escuchar (por defecto: 12345)")
+    parser.add_argument("--backlog", type=int, default=128,
+                        help="Conexiones pendientes de aceptar que admite el sistema (por defecto: 128)")
+    parser.add_argument("--blob-dir", default=None,
+                        help="Directorio donde guardar las imágenes recibidas (por defecto: uno temporal)")
+    args = parser.parse_args()
+
+    server = ChatServer(args.host, args.port, args.backlog, args.blob_dir)
+    server.start()
+    reporter = start_metrics_reporting()  # Solo si se piden con CHAT_METRICS_LOG/FILE/PORT
+
+    # SIGTERM (p. ej. systemd o docker stop) detiene el servidor de forma ordenada
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    if reporter:
+        reporter.stop()
+    print("[DEBUG] Servidor detenido.")
@@ -0,0 +1,209 @@
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QApplication, QAbstractItemView, QStyle
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QRectF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QFont, QKeySequence, QPen
+
+from view.image_loader import THUMBNAIL_WIDTH
+
+MAX_TEXT_WIDTH = 300     # Ancho máximo del texto dentro de una burbuja
+BUBBLE_PADDING = 10      # Relleno interior de las burbujas
+BUBBLE_RADIUS = 10
+ROW_SPACING = 4          # Separación vertical entre burbujas
+SIDE_MARGIN = 10         # Separación entre la burbuja y el borde de la ventana
+SELF_COLOR = QColor("#d4f8d4")
+OTHER_COLOR = QColor("#add8e6")
+SELECTED_BORDER = QColor("#0078d7")
+SENT_MARK = " ✓"
+
+EntryRole = Qt.UserRole + 1
+
+
+# Un mensaje del chat tal y como se pinta en la lista
+class TimelineEntry:
+    TEXT = "text"
+    IMAGE = "image"
+    FILE = "file"    # Archivo adjunto: se pinta como un texto ("📎 nombre (tamaño)")
+
+    def __init__(self, kind, text="", is_self=False, sender="", image_size=None):
+        self.kind = kind
+        self.text = text              # Texto del mensaje (o aviso mientras la imagen se carga)
+        self.is_self = is_self
+        self.sender = sender          # Nombre mostrado encima de las imágenes
+        self.image_key = None         # Clave de la imagen en la caché de miniaturas (hash o ruta)
+        self.image_path = None        # Fichero desde el que se vuelve a decodificar la imagen
+        self.image_data = None        # Bytes de la imagen, si no hay fichero
+        self.image_format = None
+        self.file_path = None         # Fichero del archivo adjunto (solo archivos)
+        self.file_name = None         # Nombre original del archivo adjunto
+        self.image_size = image_size  # Tamaño reservado para la imagen, conocido antes de decodificarla
+        self.sent = False             # Mensaje propio ya escrito en el socket
+        self.position = None          # Posición absoluta en la lista (la asigna el modelo)
+        self.size_hint = None         # Tamaño calculado por el delegado (caché)
+        self.record_id = None         # Id del mensaje en el historial
+
+
+# Modelo de la conversación. Solo guarda datos: los widgets no existen, el delegado pinta
+# directamente las filas visibles.
+class ChatTimelineModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.first_position = 0  # Posición absoluta de la fila 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == EntryRole:
+            return entry
+        if role == Qt.DisplayRole:
+            return entry.text
+        return None
+
+    def append_entry(self, entry):
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        entry.position = self.first_position + row
+        self.entries.append(entry)
+        self.endInsertRows()
+        return entry
+
+    def append_entries(self, entries):
+        if not entries:
+            return
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row + len(entries) - 1)
+        for offset, entry in enumerate(entries):
+            entry.position = self.first_position + row + offset
+        self.entries.extend(entries)
+        self.endInsertRows()
+
+    def reset_entries(self):
+        self.beginResetModel()
+        self.entries = []
+        self.first_position = 0
+        self.endResetModel()
+
+    # Inserta al principio entradas más antiguas (historial), en orden cronológico
+    def prepend_entries(self, entries):
+        if not entries:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(entries) - 1)
+        self.first_position -= len(entries)
+        for offset, entry in enumerate(entries):
+            entry.position = self.first_position + offset
+        self.entries[:0] = entries
+        self.endInsertRows()
+
+    # Índice de una entrada; inválido si la entrada no está en el modelo (p. ej. tras un reset)
+    def index_of(self, entry):
+        row = -1 if entry.position is None else entry.position - self.first_position
+        if 0 <= row < len(self.entries) and self.entries[row] is entry:
+            return self.index(row)
+        return QModelIndex()
+
+    # Avisa a la vista de que una entrada ha cambiado (imagen cargada, mensaje enviado...)
+    def entry_changed(self, entry):
+        index = self.index_of(entry)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+
+# Delegado que pinta las burbujas. El tamaño de cada fila se calcula una vez y se guarda en la
+# entrada; las imágenes reservan su tamaño final desde el principio, así cargar una imagen o
+# marcar un mensaje como enviado nunca obliga a recolocar la lista. Las imágenes no se guardan
+# en las entradas: se piden al pintar a `image_provider` (entrada -> QPixmap o None si aún no está).
+class BubbleDelegate(QStyledItemDelegate):
+    def __init__(self, image_provider=None, parent=None):
+        super().__init__(parent)
+        self.image_provider = image_provider
+
+    def _content_size(self, entry, option):
+        metrics = option.fontMetrics
+        if entry.kind != TimelineEntry.IMAGE:
+            text = entry.text + (SENT_MARK if entry.is_self else "")
+            rect = metrics.boundingRect(QRect(0, 0, MAX_TEXT_WIDTH, 100000), Qt.TextWordWrap, text)
+            return rect.width(), rect.height()
+
+        width, height = entry.image_size or (THUMBNAIL_WIDTH, metrics.height())
+        if entry.sender:
+            height += metrics.height() + 4
+        return max(width, metrics.horizontalAdvance(entry.sender)), height
+
+    def sizeHint(self, option, index):
+        entry = index.data(EntryRole)
+        if entry.size_hint is None:
+            width, height = self._content_size(entry, option)
+            entry.size_hint = QSize(width + 2 * (BUBBLE_PADDING + SIDE_MARGIN),
+                                    height + 2 * BUBBLE_PADDING + ROW_SPACING)
+        return entry.size_hint
+
+    def paint(self, painter, option, index):
+        entry = index.data(EntryRole)
+        size = self.sizeHint(option, index)
+        bubble_width = size.width() - 2 * SIDE_MARGIN
+        bubble_height = size.height() - ROW_SPACING
+        if entry.is_self:
+            left = option.rect.right() - SIDE_MARGIN - bubble_width
+        else:
+            left = option.rect.left() + SIDE_MARGIN
+        bubble = QRect(left, option.rect.top() + ROW_SPACING // 2, bubble_width, bubble_height)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        path = QPainterPath()
+        path.addRoundedRect(QRectF(bubble), BUBBLE_RADIUS, BUBBLE_RADIUS)
+        painter.fillPath(path, SELF_COLOR if entry.is_self else OTHER_COLOR)
+        if option.state & QStyle.State_Selected:
+            # Mensaje seleccionado (p. ej. resultado de una búsqueda)
+            painter.strokePath(path, QPen(SELECTED_BORDER, 2))
+
+        content = bubble.adjusted(BUBBLE_PADDING, BUBBLE_PADDING, -BUBBLE_PADDING, -BUBBLE_PADDING)
+        painter.setPen(QColor("#000"))
+        if entry.kind != TimelineEntry.IMAGE:
+            text = entry.text + (SENT_MARK if entry.is_self and entry.sent else "")
+            painter.drawText(content, Qt.TextWordWrap, text)
+        else:
+            if entry.sender:
+                bold = QFont(option.font)
+                bold.setBold(True)
+                painter.setFont(bold)
+                painter.setPen(QColor("#333"))
+                painter.drawText(content, Qt.AlignLeft | Qt.AlignTop, entry.sender)
+                painter.setFont(option.font)
+                content.setTop(content.top() + option.fontMetrics.height() + 4)
+            pixmap = self.image_provider(entry) if self.image_provider else None
+            if pixmap is not None:
+                if entry.image_size and (pixmap.width(), pixmap.height()) != entry.image_size:
+                    # Vista previa: se amplía al hueco de la imagen completa
+                    painter.setRenderHint(QPainter.SmoothPixmapTransform)
+                    painter.drawPixmap(QRect(content.topLeft(), QSize(*entry.image_size)), pixmap)
+                else:
+                    painter.drawPixmap(content.topLeft(), pixmap)
+            else:
+                painter.drawText(content, Qt.AlignCenter | Qt.TextWordWrap, entry.text)
+        painter.restore()
+
+
+# Lista de mensajes virtualizada: solo se pintan las filas visibles
+class ChatTimelineView(QListView):
+    def __init__(self, image_provider=None, parent=None):
+        super().__init__(parent)
+        self.setItemDelegate(BubbleDelegate(image_provider, self))
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.verticalScrollBar().setSingleStep(20)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setLayoutMode(QListView.Batched)  # Recoloca las filas por lotes sin bloquear la interfaz
+        self.setBatchSize(500)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setFocusPolicy(Qt.ClickFocus)
+
+    # Ctrl+C copia el mensaje seleccionado (sustituye a las etiquetas seleccionables de antes)
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy) and self.currentIndex().isValid():
+            QApplication.clipboard().setText(self.currentIndex().data(Qt.DisplayRole))
+            return
+        super().keyPressEvent(event)
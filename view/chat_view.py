@@ -1,465 +1,812 @@
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, 
-                           QLabel, QScrollArea, QFrame, QFileDialog, QSizePolicy)
-from PyQt5.QtCore import Qt, pyqtSignal, QUrl
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent  
-from PIL import Image
-import io
-import base64
-import os
-
-class ChatView(QWidget):
-    new_message_signal = pyqtSignal(str)
-
-    def __init__(self, username):
-        super().__init__()
-        self.setWindowTitle("Chat local - LNVF")
-        self.username = username
-        self.new_message_signal.connect(self.display_message)
-        self.setGeometry(100, 100, 500, 600)
-        self.setup_ui()
-        
-        # Inicializamos el sistema de sonido
-        self.setup_notification_sound()
-
-    def setup_ui(self):
-        self.layout = QVBoxLayout(self)
-
-        # NUEVO: Título "Chat con: nombre"
-        self.chat_title_label = QLabel(f"Chat con: {self.username}")
-        self.chat_title_label.setAlignment(Qt.AlignCenter)
-        self.chat_title_label.setStyleSheet("""
-            QLabel {
-                font-size: 20px;
-                font-weight: bold;
-                padding: 10px;
-                color: #333;
-            }
-        """)
-        self.layout.addWidget(self.chat_title_label)
-
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-
-        self.chat_container = QWidget()
-        self.chat_layout = QVBoxLayout(self.chat_container)
-        self.chat_layout.setAlignment(Qt.AlignTop)
-        self.scroll_area.setWidget(self.chat_container)
-
-        self.message_input = QLineEdit()
-        self.message_input.setPlaceholderText("Escribe un mensaje...")
-
-        self.send_button = QPushButton("⬆️")
-        self.send_button.setFixedWidth(40)
-        self.send_button.setFixedHeight(36)
-        self.send_button.setStyleSheet("""
-            QPushButton {
-                font-size: 15px;
-                background-color: #0078d7;
-                color: white;
-                border: none;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #005fa3;
-            }
-        """)
-
-        self.emoji_button = QPushButton("😀")  # Botón para abrir emojis
-        self.emoji_button.setFixedWidth(40)
-        self.emoji_button.setFixedHeight(36)
-        self.emoji_button.setStyleSheet("""
-            QPushButton {
-                font-size: 15px;
-                background-color: #0078d7;
-                color: white;
-                border: none;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #005fa3;
-            }
-        """)
-
-        # Botón para subir imágenes
-        self.image_button = QPushButton("📷")
-        self.image_button.setFixedWidth(40)
-        self.image_button.setFixedHeight(36)
-        self.image_button.setStyleSheet("""
-            QPushButton {
-                font-size: 15px;
-                background-color: #0078d7;
-                color: white;
-                border: none;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #005fa3;
-            }
-        """)
-
-        # Panel oculto de emojis
-        self.emoji_panel = QWidget()
-        self.emoji_panel.setWindowFlags(Qt.Popup)
-        emoji_layout = QHBoxLayout(self.emoji_panel)
-        emojis = ['😀', '😂', '😍', '👍', '🙏', '🎉']
-        for e in emojis:
-            btn = QPushButton(e)
-            btn.setFixedSize(30, 30)
-            btn.setStyleSheet("font-size: 20px; border: none; background: transparent;")
-            btn.clicked.connect(lambda checked, emoji=e: self.insert_emoji(emoji))
-            emoji_layout.addWidget(btn)
-
-        bottom_layout = QHBoxLayout()
-        bottom_layout.addWidget(self.message_input)
-        bottom_layout.addWidget(self.emoji_button)
-        bottom_layout.addWidget(self.image_button)
-        bottom_layout.addWidget(self.send_button)
-
-        self.layout.addWidget(self.scroll_area)
-        self.layout.addLayout(bottom_layout)
-
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #eaeaea;
-                font-size: 14px;
-            }
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #ccc;
-                border-radius: 5px;
-                background-color: white;
-            }
-            QPushButton {
-                background-color: #0078d7;
-                color: white;
-                font-weight: bold;
-                padding: 8px 12px;
-                border: none;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #005fa3;
-            }
-        """)
-
-        self.emoji_button.clicked.connect(self.toggle_emoji_panel)
-
-    def setup_notification_sound(self):
-        """Inicializa el sistema de sonido de notificación"""
-        # Creamos el reproductor de medios
-        self.media_player = QMediaPlayer()
-        
-        # Buscamos el archivo de sonido en varias ubicaciones posibles
-        sound_file_name = "notification.mp3"  # Puede ser .mp3, .wav, etc.
-        
-        # Primero buscamos en el directorio de la aplicación
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-        sound_paths = [
-            os.path.join(app_dir, sound_file_name),  # En el directorio de la app
-            os.path.join(app_dir, "sounds", sound_file_name),  # En subdirectorio sounds
-        ]
-        
-        # La ruta del archivo de sonido que usaremos
-        self.notification_sound_path = None
-        
-        # Buscar el archivo en las rutas posibles
-        for path in sound_paths:
-            if os.path.exists(path):
-                self.notification_sound_path = path
-                break
-        
-        if not self.notification_sound_path:
-            print("[ADVERTENCIA] No se encontró el archivo de sonido.")
-            print(f"Por favor, añade un archivo llamado '{sound_file_name}' en la carpeta de la aplicación.")
-    
-    def play_notification_sound(self):
-        """Reproduce el sonido de notificación"""
-        try:
-            if self.notification_sound_path and os.path.exists(self.notification_sound_path):
-                # Establecer el archivo de audio
-                media_content = QMediaContent(QUrl.fromLocalFile(self.notification_sound_path))
-                self.media_player.setMedia(media_content)
-                # Reproducir
-                self.media_player.play()
-            else:
-                print("[ADVERTENCIA] No se puede reproducir el sonido: archivo no encontrado")
-        except Exception as e:
-            print(f"[ERROR] Error al reproducir el sonido de notificación: {e}")
-
-    def toggle_emoji_panel(self):
-        if self.emoji_panel.isVisible():
-            self.emoji_panel.hide()
-        else:
-            # Posicionar el panel justo encima del botón de emojis
-            pos = self.emoji_button.mapToGlobal(self.emoji_button.rect().bottomLeft())
-            self.emoji_panel.move(pos.x(), pos.y())
-            self.emoji_panel.show()
-
-    def insert_emoji(self, emoji):
-        cursor_pos = self.message_input.cursorPosition()
-        text = self.message_input.text()
-        new_text = text[:cursor_pos] + emoji + text[cursor_pos:]
-        self.message_input.setText(new_text)
-        self.message_input.setCursorPosition(cursor_pos + len(emoji))
-        self.message_input.setFocus()
-        self.emoji_panel.hide()
-
-    def chat_view_signal_image(self, file_path):
-        # Esta función se conectará en el controller para manejar el envío de imágenes
-        try:
-            # Crear un mensaje especial indicando que es una imagen
-            msg = f"IMG:{file_path}"
-            # Este es un mensaje indicando que se está enviando una imagen
-            # El formato "IMG:" se utilizará para identificar mensajes de imagen
-            from PyQt5.QtCore import pyqtSignal
-            # Emitir señal que será capturada por el controller
-            self.new_message_signal.emit(msg)
-        except Exception as e:
-            print(f"Error al señalizar la imagen: {e}")
-
-    def display_message(self, msg):
-        # Primero determinamos si el mensaje es propio o recibido
-        is_self = False
-        if ":" in msg:
-            sender = msg.split(":", 1)[0]
-            is_self = sender == self.username or sender == "Yo"
-        
-        # Reproducimos el sonido SOLO si el mensaje NO es propio
-        if not is_self:
-            self.play_notification_sound()
-            
-        # Comprobamos si es un mensaje de imagen
-        if msg.startswith("IMG:"):
-            # Extraemos la ruta o datos de la imagen
-            img_data = msg[4:]
-            if img_data.startswith("DATA:"):
-                # Es una imagen codificada en base64
-                img_base64 = img_data[5:]
-                self.display_image_from_base64(img_base64)
-            else:
-                # Es una ruta de archivo
-                self.display_image_from_path(msg)
-            return
-        
-        # Si no es una imagen, procesamos como mensaje normal
-        is_self = msg.startswith(f"{self.username}:")
-        
-        # Modificamos el mensaje para mostrar "Yo:" en lugar del nombre de usuario
-        if is_self:
-            prefix = f"{self.username}:"
-            msg = "Yo:" + msg[len(prefix):]
-            
-        bubble = self.create_message_bubble(msg, is_self)
-
-        bubble_layout = QHBoxLayout()
-        if is_self:
-            bubble_layout.addStretch()
-            bubble_layout.addWidget(bubble)
-        else:
-            bubble_layout.addWidget(bubble)
-            bubble_layout.addStretch()
-
-        container = QWidget()
-        container.setLayout(bubble_layout)
-        self.chat_layout.addWidget(container)
-        self.scroll_area.verticalScrollBar().setValue(self.scroll_area.verticalScrollBar().maximum())
-
-    def display_image_from_path(self, file_path):
-        try:
-            # Determinamos si el mensaje es propio o de otro usuario
-            is_self = False
-            actual_path = ""
-            
-            # Si es un mensaje con formato de nombre: ruta
-            if ":" in file_path:
-                parts = file_path.split(":", 1)
-                sender = parts[0]
-                is_self = sender == self.username
-                
-                if file_path.startswith("IMG:"):
-                    # Si empieza con IMG: es porque viene directamente del controller
-                    actual_path = file_path[4:]
-                elif len(parts) > 1:
-                    # Es un mensaje normal con nombre: ruta
-                    actual_path = parts[1].strip()
-            else:
-                # Si no tiene formato, asumimos que es la ruta directa
-                actual_path = file_path
-            
-            # Si la ruta empieza con IMG: debemos quitarlo también
-            if actual_path.startswith("IMG:"):
-                actual_path = actual_path[4:]
-                
-            # Verificamos que el archivo existe
-            if not os.path.exists(actual_path):
-                print(f"[ERROR] El archivo de imagen no existe: {actual_path}")
-                self.display_message(f"Error: No se pudo cargar la imagen {actual_path}")
-                return
-            
-            # Si es un mensaje propio, añadimos una etiqueta para mostrar "Yo" en lugar del nombre
-            sender_label = None
-            if is_self:
-                sender_label = QLabel("Yo:")
-                sender_label.setStyleSheet("""
-                    QLabel {
-                        font-weight: bold;
-                        color: #333;
-                        margin-right: 5px;
-                    }
-                """)
-            elif ":" in file_path:
-                # Mostrar el nombre del remitente para mensajes de otros
-                sender_name = parts[0]
-                if sender_name != "IMG":  # Evitamos mostrar "IMG:" como nombre
-                    sender_label = QLabel(f"{sender_name}:")
-                    sender_label.setStyleSheet("""
-                        QLabel {
-                            font-weight: bold;
-                            color: #333;
-                            margin-right: 5px;
-                        }
-                    """)
-                
-            pixmap = QPixmap(actual_path)
-            if pixmap.width() > 300:
-                pixmap = pixmap.scaledToWidth(300, Qt.SmoothTransformation)
-            
-            image_label = QLabel()
-            image_label.setPixmap(pixmap)
-            image_label.setStyleSheet(f"""
-                QLabel {{
-                    background-color: {'#d4f8d4' if is_self else '#add8e6'};
-                    padding: 10px;
-                    border-radius: 10px;
-                }}
-            """)
-            
-            # Creamos un layout para la burbuja de mensaje
-            bubble_layout = QHBoxLayout()
-            
-            # Layout vertical para contener la etiqueta del remitente y la imagen
-            if sender_label:
-                message_container = QVBoxLayout()
-                message_container.addWidget(sender_label)
-                message_container.addWidget(image_label)
-                message_container.setAlignment(Qt.AlignTop)
-                
-                # Creamos un widget para contener este layout vertical
-                msg_widget = QWidget()
-                msg_widget.setLayout(message_container)
-                
-                if is_self:
-                    bubble_layout.addStretch()
-                    bubble_layout.addWidget(msg_widget)
-                else:
-                    bubble_layout.addWidget(msg_widget)
-                    bubble_layout.addStretch()
-            else:
-                # Si no hay etiqueta de remitente, solo añadimos la imagen
-                if is_self:
-                    bubble_layout.addStretch()
-                    bubble_layout.addWidget(image_label)
-                else:
-                    bubble_layout.addWidget(image_label)
-                    bubble_layout.addStretch()
-
-            container = QWidget()
-            container.setLayout(bubble_layout)
-            self.chat_layout.addWidget(container)
-            self.scroll_area.verticalScrollBar().setValue(self.scroll_area.verticalScrollBar().maximum())
-        except Exception as e:
-            print(f"Error al mostrar la imagen desde archivo: {e}")
-            self.display_message(f"Error al mostrar la imagen: {e}")
-
-    def display_image_from_base64(self, img_base64):
-        try:
-            # Decodificamos la imagen desde base64
-            img_data = base64.b64decode(img_base64)
-            pixmap = QPixmap()
-            pixmap.loadFromData(img_data)
-            
-            if pixmap.width() > 300:
-                pixmap = pixmap.scaledToWidth(300, Qt.SmoothTransformation)
-            
-            # Determinamos si el mensaje es propio o de otro usuario
-            # Para mensajes en base64, necesitaríamos información adicional para
-            # saber si es un mensaje propio o recibido
-            is_self = False  # Por defecto asumimos que no es propio
-            
-            # Podemos añadir una etiqueta con el nombre del remitente
-            sender_label = None
-            if not is_self:
-                sender_label = QLabel("Foto:")
-                sender_label.setStyleSheet("""
-                    QLabel {
-                        font-weight: bold;
-                        color: #333;
-                        margin-right: 5px;
-                    }
-                """)
-            
-            image_label = QLabel()
-            image_label.setPixmap(pixmap)
-            image_label.setStyleSheet(f"""
-                QLabel {{
-                    background-color: {'#d4f8d4' if is_self else '#add8e6'};
-                    padding: 10px;
-                    border-radius: 10px;
-                }}
-            """)
-            
-            bubble_layout = QHBoxLayout()
-            
-            # Si hay etiqueta de remitente, creamos un layout vertical
-            if sender_label:
-                message_container = QVBoxLayout()
-                message_container.addWidget(sender_label)
-                message_container.addWidget(image_label)
-                message_container.setAlignment(Qt.AlignTop)
-                
-                msg_widget = QWidget()
-                msg_widget.setLayout(message_container)
-                
-                if is_self:
-                    bubble_layout.addStretch()
-                    bubble_layout.addWidget(msg_widget)
-                else:
-                    bubble_layout.addWidget(msg_widget)
-                    bubble_layout.addStretch()
-            else:
-                # Si no hay etiqueta, solo añadimos la imagen
-                if is_self:
-                    bubble_layout.addStretch()
-                    bubble_layout.addWidget(image_label)
-                else:
-                    bubble_layout.addWidget(image_label)
-                    bubble_layout.addStretch()
-
-            container = QWidget()
-            container.setLayout(bubble_layout)
-            self.chat_layout.addWidget(container)
-            self.scroll_area.verticalScrollBar().setValue(self.scroll_area.verticalScrollBar().maximum())
-        except Exception as e:
-            print(f"Error al mostrar la imagen desde base64: {e}")
-            self.display_message(f"Error al mostrar la imagen: {e}")
-
-    def create_message_bubble(self, msg, is_self):
-        label = QLabel(msg)
-        label.setWordWrap(True)
-        label.setStyleSheet(f"""
-            QLabel {{
-                background-color: {'#d4f8d4' if is_self else '#add8e6'};
-                padding: 10px;
-                border-radius: 10px;
-                max-width: 300px;
-            }}
-        """)
-        label.setTextInteractionFlags(Qt.TextSelectableByMouse)
-        return label
-
-    def get_message(self):
-        return self.message_input.text()
-
-    def clear_input(self):
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, 
+                           QLabel, QFileDialog, QProgressBar, QMessageBox)
+from PyQt5.QtCore import Qt, pyqtSignal, QPoint, QTimer
+from PyQt5.QtWidgets import QAbstractItemView
+from PyQt5.QtGui import QImageReader, QKeySequence, QPixmap
+from PyQt5.QtWidgets import QShortcut
+import os
+import shutil
+import threading
+from collections import deque
+
+from model.chat_model import ImageMessage, FileMessage, ImagePreview
+from model.metrics import metrics
+from view.notification_sound import NotificationSound
+from view.image_loader import ImageLoader, PixmapCache, thumbnail_size
+from view.chat_timeline import ChatTimelineModel, ChatTimelineView, TimelineEntry, EntryRole
+
+def format_size(size):
+    """Tamaño legible de un archivo ("820 B", "1.4 MB"...)."""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class ChatView(QWidget):
+    new_message_signal = pyqtSignal(object, object)  # (texto (str) o imagen (ImageMessage), id en el historial)
+    incoming_ready = pyqtSignal()  # Hay mensajes recibidos esperando en `incoming` (ver queue_incoming)
+    transfer_progress_signal = pyqtSignal(object, object, object)  # (id, bytes transferidos, bytes totales)
+    transfer_error_signal = pyqtSignal(object, str)  # (id, error) de una descarga que no se completará
+    message_sent_signal = pyqtSignal(object)  # id de un mensaje propio que ya se ha enviado
+    send_error_signal = pyqtSignal(str)
+    connection_state_signal = pyqtSignal(bool)  # Conexión con el servidor perdida (False) o recuperada (True)
+    history_requested = pyqtSignal(object)  # Arriba del todo: cargar los mensajes anteriores a este id (None = los últimos)
+    history_newer_requested = pyqtSignal(object)  # Abajo del todo en una zona antigua: cargar los posteriores a este id
+    history_jump_requested = pyqtSignal(object)  # id de un mensaje del historial que no está cargado
+    live_requested = pyqtSignal()  # Volver a mostrar el final de la conversación
+    search_requested = pyqtSignal(str)  # Texto a buscar en el historial
+
+    def __init__(self, username):
+        super().__init__()
+        self.setWindowTitle("Chat local - LNVF")
+        self.username = username
+        self.new_message_signal.connect(lambda msg, record_id: self.display_message(msg, record_id=record_id))
+        self.incoming_ready.connect(self.flush_incoming, Qt.QueuedConnection)  # Siempre en la siguiente vuelta del bucle
+        self.incoming = deque()  # (mensaje, id en el historial, MessageTrace) recibidos por el hilo de red, aún sin mostrar
+        self.incoming_lock = threading.Lock()
+        self.incoming_scheduled = False  # Ya hay un aviso a la interfaz en camino
+        self.batch = None  # Entradas del lote que se está mostrando (None fuera de display_messages)
+        self.batch_notify = False  # Algún mensaje del lote pide sonido
+        self.transfer_progress_signal.connect(self.update_transfer_progress)
+        self.transfer_error_signal.connect(self.show_transfer_error)
+        self.message_sent_signal.connect(self.mark_message_sent)
+        self.connection_state_signal.connect(self.show_connection_state)
+        self.transfers_in_progress = {}  # id de transferencia -> (bytes transferidos, bytes totales)
+        self.pending_entries = {}  # id de mensaje propio -> entrada que aún no se ha enviado
+
+        # Las imágenes se decodifican y escalan en un pool de hilos cuando se van a pintar, y las
+        # miniaturas se guardan en una caché LRU limitada por memoria
+        self.image_loader = ImageLoader(self)
+        self.image_loader.loaded.connect(self.show_loaded_image)
+        self.image_loader.failed.connect(self.show_image_error)
+        self.pixmap_cache = PixmapCache()
+        self.image_requests = {}  # id de petición -> entrada que pidió la imagen
+        self.loading_images = set()  # Claves de las imágenes que se están decodificando
+        self.image_errors = {}  # Clave de imagen -> error al decodificarla
+        self.preview_entries = {}  # id de transferencia -> entrada que muestra la vista previa
+        self.next_image_request = 0
+        self.history_exhausted = False  # Ya no quedan mensajes antiguos por cargar
+        self.loading_history = False
+        self.entries_by_record = {}  # id en el historial -> entrada de la conversación
+        self.oldest_record_id = None  # Mensaje más antiguo del historial que se está mostrando
+        self.newest_record_id = None  # Mensaje más reciente cargado desde el historial
+        self.detached = False         # Se está viendo una zona antigua, sin los mensajes en vivo
+        self.live_buffer = []         # Mensajes en vivo recibidos mientras se está en una zona antigua
+        self.search_hits = []        # ids de los resultados de la última búsqueda (del más reciente al más antiguo)
+        self.search_position = 0
+        self.setGeometry(100, 100, 500, 600)
+        self.setup_ui()
+        
+        # Inicializamos el sistema de sonido
+        self.setup_notification_sound()
+
+    def setup_ui(self):
+        self.layout = QVBoxLayout(self)
+
+        # NUEVO: Título "Chat con: nombre"
+        self.chat_title_label = QLabel(f"Chat con: {self.username}")
+        self.chat_title_label.setAlignment(Qt.AlignCenter)
+        self.chat_title_label.setStyleSheet("""
+            QLabel {
+                font-size: 20px;
+                font-weight: bold;
+                padding: 10px;
+                color: #333;
+            }
+        """)
+        self.layout.addWidget(self.chat_title_label)
+
+        # Conversación: lista virtualizada (modelo + delegado que pinta solo las burbujas visibles)
+        self.timeline_model = ChatTimelineModel(self)
+        self.timeline_view = ChatTimelineView(self.image_for_entry)
+        self.timeline_view.setModel(self.timeline_model)
+        self.timeline_view.setStyleSheet("QListView { border: none; }")
+        self.timeline_view.verticalScrollBar().valueChanged.connect(self.on_timeline_scrolled)
+        self.timeline_view.doubleClicked.connect(self.on_entry_activated)
+
+        self.message_input = QLineEdit()
+        self.message_input.setPlaceholderText("Escribe un mensaje...")
+
+        self.send_button = QPushButton("⬆️")
+        self.send_button.setFixedWidth(40)
+        self.send_button.setFixedHeight(36)
+        self.send_button.setStyleSheet("""
+            QPushButton {
+                font-size: 15px;
+                background-color: #0078d7;
+                color: white;
+                border: none;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #005fa3;
+            }
+        """)
+
+        self.emoji_button = QPushButton("😀")  # Botón para abrir emojis
+        self.emoji_button.setFixedWidth(40)
+        self.emoji_button.setFixedHeight(36)
+        self.emoji_button.setStyleSheet("""
+            QPushButton {
+                font-size: 15px;
+                background-color: #0078d7;
+                color: white;
+                border: none;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #005fa3;
+            }
+        """)
+
+        # Botón para subir imágenes
+        self.image_button = QPushButton("📷")
+        self.image_button.setFixedWidth(40)
+        self.image_button.setFixedHeight(36)
+        self.image_button.setStyleSheet("""
+            QPushButton {
+                font-size: 15px;
+                background-color: #0078d7;
+                color: white;
+                border: none;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #005fa3;
+            }
+        """)
+
+        # Botón para adjuntar archivos de cualquier tipo
+        self.file_button = QPushButton("📎")
+        self.file_button.setFixedWidth(40)
+        self.file_button.setFixedHeight(36)
+        self.file_button.setStyleSheet(self.image_button.styleSheet())
+
+        # Panel oculto de emojis
+        self.emoji_panel = QWidget()
+        self.emoji_panel.setWindowFlags(Qt.Popup)
+        emoji_layout = QHBoxLayout(self.emoji_panel)
+        emojis = ['😀', '😂', '😍', '👍', '🙏', '🎉']
+        for e in emojis:
+            btn = QPushButton(e)
+            btn.setFixedSize(30, 30)
+            btn.setStyleSheet("font-size: 20px; border: none; background: transparent;")
+            btn.clicked.connect(lambda checked, emoji=e: self.insert_emoji(emoji))
+            emoji_layout.addWidget(btn)
+
+        # Botón para buscar en el historial
+        self.search_button = QPushButton("🔍")
+        self.search_button.setFixedWidth(40)
+        self.search_button.setFixedHeight(36)
+        self.search_button.setStyleSheet(self.emoji_button.styleSheet())
+
+        bottom_layout = QHBoxLayout()
+        bottom_layout.addWidget(self.message_input)
+        bottom_layout.addWidget(self.search_button)
+        bottom_layout.addWidget(self.emoji_button)
+        bottom_layout.addWidget(self.image_button)
+        bottom_layout.addWidget(self.file_button)
+        bottom_layout.addWidget(self.send_button)
+
+        # Barra de progreso de las imágenes que se están enviando o recibiendo
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFixedHeight(14)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.hide()
+
+        # Barra de búsqueda (oculta hasta pulsar 🔍 o Ctrl+F)
+        self.search_bar = QWidget()
+        search_layout = QHBoxLayout(self.search_bar)
+        search_layout.setContentsMargins(0, 0, 0, 0)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Buscar en la conversación...")
+        self.search_result_label = QLabel("")
+        self.search_older_button = QPushButton("▲")
+        self.search_newer_button = QPushButton("▼")
+        self.search_close_button = QPushButton("✕")
+        search_layout.addWidget(self.search_input)
+        search_layout.addWidget(self.search_result_label)
+        for button in (self.search_older_button, self.search_newer_button, self.search_close_button):
+            button.setFixedWidth(36)
+            search_layout.addWidget(button)
+        self.search_bar.hide()
+
+        self.search_input.returnPressed.connect(self.on_search_submitted)
+        self.search_older_button.clicked.connect(lambda: self.move_search(1))
+        self.search_newer_button.clicked.connect(lambda: self.move_search(-1))
+        self.search_close_button.clicked.connect(self.hide_search_bar)
+        self.search_button.clicked.connect(self.show_search_bar)
+        QShortcut(QKeySequence.Find, self, activated=self.show_search_bar)
+        QShortcut(QKeySequence(Qt.Key_Escape), self.search_bar, activated=self.hide_search_bar,
+                  context=Qt.WidgetWithChildrenShortcut)
+
+        self.layout.addWidget(self.search_bar)
+        self.layout.addWidget(self.timeline_view)
+        self.layout.addWidget(self.progress_bar)
+        self.layout.addLayout(bottom_layout)
+
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #eaeaea;
+                font-size: 14px;
+            }
+            QLineEdit {
+                padding: 8px;
+                border: 1px solid #ccc;
+                border-radius: 5px;
+                background-color: white;
+            }
+            QPushButton {
+                background-color: #0078d7;
+                color: white;
+                font-weight: bold;
+                padding: 8px 12px;
+                border: none;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #005fa3;
+            }
+        """)
+
+        self.emoji_button.clicked.connect(self.toggle_emoji_panel)
+
+    def setup_notification_sound(self):
+        """Localiza el sonido de notificación; el reproductor se prepara en cuanto la ventana queda libre."""
+        self.notification_sound = NotificationSound(self)
+        QTimer.singleShot(0, self.notification_sound.load)  # Tras mostrar la ventana, no durante el arranque
+
+    def play_notification_sound(self):
+        """Reproduce el sonido de notificación"""
+        if self.batch is not None:
+            self.batch_notify = True  # Suena una sola vez, al terminar el lote
+            return
+        self.notification_sound.play()
+
+    def update_transfer_progress(self, transfer_id, done, total):
+        """Actualiza la barra de progreso con el avance conjunto de las transferencias en curso."""
+        if done >= total:
+            self.transfers_in_progress.pop(transfer_id, None)
+        else:
+            self.transfers_in_progress[transfer_id] = (done, total)
+        self.refresh_progress_bar()
+
+    def show_transfer_error(self, transfer_id, error):
+        """Una descarga ha fallado: sale de la barra de progreso y su vista previa muestra el error."""
+        self.transfers_in_progress.pop(transfer_id, None)
+        self.refresh_progress_bar()
+        entry = self.preview_entries.pop(transfer_id, None)
+        if entry is None:
+            self.display_message(f"Error al recibir un archivo: {error}")
+            return
+        self.pixmap_cache.discard(entry.image_key)
+        entry.text = f"Error al mostrar la imagen: {error}"
+        entry.image_size = None
+        entry.size_hint = None
+        self.timeline_view.scheduleDelayedItemsLayout()
+        self.timeline_view.viewport().update()
+
+    def refresh_progress_bar(self):
+        if not self.transfers_in_progress:
+            self.progress_bar.hide()
+            return
+
+        done_total = sum(d for d, _ in self.transfers_in_progress.values())
+        size_total = sum(t for _, t in self.transfers_in_progress.values())
+        self.progress_bar.setValue(int(done_total * 100 / size_total))
+        self.progress_bar.show()
+
+    def toggle_emoji_panel(self):
+        if self.emoji_panel.isVisible():
+            self.emoji_panel.hide()
+        else:
+            # Posicionar el panel justo encima del botón de emojis
+            pos = self.emoji_button.mapToGlobal(self.emoji_button.rect().bottomLeft())
+            self.emoji_panel.move(pos.x(), pos.y())
+            self.emoji_panel.show()
+
+    def insert_emoji(self, emoji):
+        cursor_pos = self.message_input.cursorPosition()
+        text = self.message_input.text()
+        new_text = text[:cursor_pos] + emoji + text[cursor_pos:]
+        self.message_input.setText(new_text)
+        self.message_input.setCursorPosition(cursor_pos + len(emoji))
+        self.message_input.setFocus()
+        self.emoji_panel.hide()
+
+    def chat_view_signal_image(self, file_path):
+        # Esta función se conectará en el controller para manejar el envío de imágenes
+        try:
+            # Crear un mensaje especial indicando que es una imagen
+            msg = f"IMG:{file_path}"
+            # Este es un mensaje indicando que se está enviando una imagen
+            # El formato "IMG:" se utilizará para identificar mensajes de imagen
+            from PyQt5.QtCore import pyqtSignal
+            # Emitir señal que será capturada por el controller
+            self.new_message_signal.emit(msg, None)
+        except Exception as e:
+            print(f"Error al señalizar la imagen: {e}")
+
+    # Llamado desde el hilo de red por cada mensaje recibido. Solo se avisa a la interfaz si no
+    # hay ya un aviso pendiente: los mensajes que lleguen mientras tanto se muestran en el mismo
+    # lote, así una ráfaga se pinta en tantos lotes como vueltas da el bucle de eventos, no en
+    # tantos como mensajes.
+    def queue_incoming(self, msg, record_id=None, trace=None):
+        with self.incoming_lock:
+            self.incoming.append((msg, record_id, trace))
+            if self.incoming_scheduled:
+                return
+            self.incoming_scheduled = True
+        self.incoming_ready.emit()
+
+    def flush_incoming(self):
+        with self.incoming_lock:
+            messages = list(self.incoming)
+            self.incoming.clear()
+            self.incoming_scheduled = False
+        self.display_messages([(msg, record_id) for msg, record_id, trace in messages])
+        # Trazas de latencia (MessageTrace del modelo): el lote ya está en la lista
+        for msg, record_id, trace in messages:
+            if trace is not None:
+                trace.stamp("render")
+                metrics.observe("chat_receive_render_seconds", trace.decode, trace.render)
+
+    # Muestra varios mensajes recibidos de una vez: se insertan en el modelo con una sola
+    # notificación a la lista, se baja al final una vez y suena como mucho una notificación
+    def display_messages(self, messages):
+        self.batch = []
+        self.batch_notify = False
+        self.timeline_view.setUpdatesEnabled(False)
+        try:
+            for msg, record_id in messages:
+                self.display_message(msg, record_id=record_id)
+        finally:
+            entries, self.batch = self.batch, None
+            self.insert_entries(entries)
+            self.timeline_view.setUpdatesEnabled(True)
+        if self.batch_notify:
+            self.play_notification_sound()
+
+    def display_message(self, msg, pending_id=None, record_id=None):
+        # Las imágenes recibidas llegan como bytes crudos con sus metadatos
+        if isinstance(msg, ImagePreview):
+            if msg.transfer_id in self.preview_entries:
+                return  # Repetida: la imagen se volvió a subir desde el principio tras una reconexión
+            self.play_notification_sound()
+            self.display_image_preview(msg)
+            return
+        if isinstance(msg, ImageMessage):
+            if msg.transfer_id not in self.preview_entries:
+                self.play_notification_sound()  # Si hubo vista previa, ya sonó al llegar esta
+            self.display_image_from_data(msg, record_id)
+            return
+        if isinstance(msg, FileMessage):
+            self.play_notification_sound()
+            self.display_file(msg.sender, msg.name, msg.size, msg.path, record_id=record_id)
+            return
+
+        # Primero determinamos si el mensaje es propio o recibido
+        is_self = False
+        if ":" in msg:
+            sender = msg.split(":", 1)[0]
+            is_self = sender == self.username or sender == "Yo"
+        
+        # Reproducimos el sonido SOLO si el mensaje NO es propio
+        if not is_self:
+            self.play_notification_sound()
+            
+        # Comprobamos si es un mensaje de imagen
+        if msg.startswith("IMG:"):
+            # Es una ruta de archivo
+            self.display_image_from_path(msg)
+            return
+        
+        # Si no es una imagen, procesamos como mensaje normal
+        entry = self.make_text_entry(msg)
+        entry.record_id = record_id
+        if pending_id is not None:
+            # Mensaje propio aún en la cola de envío: se marcará con ✓ al enviarse
+            self.pending_entries[pending_id] = entry
+        self.add_entry(entry)
+
+    def on_timeline_scrolled(self, value):
+        if self.loading_history:
+            return
+        scroll_bar = self.timeline_view.verticalScrollBar()
+        if value == scroll_bar.minimum() and not self.history_exhausted:
+            self.history_requested.emit(self.oldest_record_id)
+        elif value == scroll_bar.maximum() and self.detached:
+            self.history_newer_requested.emit(self.newest_record_id)
+
+    def history_entries(self, records):
+        """Convierte mensajes del historial (HistoryRecord) en entradas de la conversación."""
+        entries = []
+        for record in records:
+            if record.kind == "image":
+                is_self = record.sender == self.username
+                entry = TimelineEntry(TimelineEntry.IMAGE, "Cargando imagen...", is_self,
+                                      "Yo:" if is_self else f"{record.sender}:",
+                                      thumbnail_size(record.width or 0, record.height or 0))
+                entry.image_key = record.blob_hash
+                entry.image_path = record.blob_path
+                entry.image_format = record.image_format
+            elif record.kind == "file":
+                size = os.path.getsize(record.blob_path) if os.path.exists(record.blob_path) else 0
+                entry = self.make_file_entry(record.sender, record.body, size, record.blob_path)
+            else:
+                entry = self.make_text_entry(record.body)
+            entry.sent = True
+            entry.record_id = record.id
+            self.entries_by_record[record.id] = entry
+            entries.append(entry)
+        return entries
+
+    def prepend_history(self, records):
+        """Añade al principio una página de mensajes antiguos (HistoryRecord) sin mover lo que se está viendo."""
+        if not records:
+            self.history_exhausted = True
+            return
+
+        self.loading_history = True
+        try:
+            anchor_index = self.timeline_view.indexAt(QPoint(0, 0))
+            anchor = anchor_index.data(EntryRole) if anchor_index.isValid() else None
+
+            entries = self.history_entries(records)
+            self.timeline_model.prepend_entries(entries)
+            self.oldest_record_id = records[0].id
+            if self.newest_record_id is None:
+                self.newest_record_id = records[-1].id
+
+            if anchor is not None:
+                self.timeline_view.scrollTo(self.timeline_model.index_of(anchor), QAbstractItemView.PositionAtTop)
+            else:
+                self.timeline_view.scrollToBottom()
+        finally:
+            self.loading_history = False
+
+    def append_history(self, records, at_tail):
+        """Añade al final mensajes más recientes del historial mientras se navega por una zona antigua.
+        `at_tail` indica que ya no hay más: la conversación vuelve a mostrar los mensajes en vivo."""
+        self.loading_history = True
+        try:
+            entries = self.history_entries(records)
+            self.timeline_model.append_entries(entries)
+            if records:
+                self.newest_record_id = records[-1].id
+            if at_tail:
+                self.attach_live()
+        finally:
+            self.loading_history = False
+
+    def show_history_window(self, records, at_tail, focus_record_id=None):
+        """Sustituye la conversación mostrada por un tramo del historial (p. ej. alrededor de un
+        resultado de búsqueda). Así saltar a un mensaje antiguo no obliga a cargar todo lo que hay
+        entre medias; el resto se va cargando al desplazarse hacia arriba o hacia abajo."""
+        self.loading_history = True
+        try:
+            if not self.detached:
+                # Los últimos mensajes en vivo pueden no estar escritos aún en el historial: se guardan
+                # para añadirlos de nuevo al volver al final de la conversación
+                recent = []
+                for entry in reversed(self.timeline_model.entries):
+                    if entry.record_id is not None and self.newest_record_id is not None \
+                            and entry.record_id <= self.newest_record_id:
+                        break
+                    recent.append(entry)
+                self.live_buffer = recent[::-1] + self.live_buffer
+                self.detached = True
+
+            self.timeline_model.reset_entries()
+            self.entries_by_record = {}
+            self.history_exhausted = False
+            self.oldest_record_id = records[0].id if records else None
+            self.newest_record_id = records[-1].id if records else None
+            if not records:
+                self.history_exhausted = True
+
+            entries = self.history_entries(records)
+            self.timeline_model.append_entries(entries)
+            if at_tail:
+                self.attach_live()
+        finally:
+            self.loading_history = False
+
+        if focus_record_id is not None:
+            self.jump_to_record(focus_record_id)
+        else:
+            self.timeline_view.scrollToBottom()
+
+    # Vuelve a mostrar los mensajes en vivo, añadiendo los que llegaron mientras se navegaba por el historial
+    def attach_live(self):
+        entries = [entry for entry in self.live_buffer
+                   if entry.record_id is None or self.newest_record_id is None or entry.record_id > self.newest_record_id]
+        for entry in entries:
+            if entry.record_id is not None:
+                self.entries_by_record[entry.record_id] = entry
+        self.timeline_model.append_entries(entries)
+        self.live_buffer = []
+        self.detached = False
+
+    def make_text_entry(self, msg):
+        """Crea la entrada de un mensaje de texto, mostrando "Yo:" en lugar del nombre propio."""
+        is_self = msg.startswith(f"{self.username}:")
+        if is_self:
+            msg = "Yo:" + msg[len(self.username) + 1:]
+        return TimelineEntry(TimelineEntry.TEXT, msg, is_self)
+
+    def make_file_entry(self, sender, name, size, path):
+        """Crea la entrada de un archivo adjunto."""
+        is_self = sender == self.username
+        entry = TimelineEntry(TimelineEntry.FILE, f"{'Yo' if is_self else sender}: 📎 {name} ({format_size(size)})",
+                              is_self)
+        entry.file_path = path
+        entry.file_name = name
+        return entry
+
+    def display_file(self, sender, name, size, path, pending_id=None, record_id=None):
+        """Muestra un archivo adjunto (propio o recibido); con doble clic se guarda una copia."""
+        entry = self.make_file_entry(sender, name, size, path)
+        entry.record_id = record_id
+        if pending_id is not None:
+            # Archivo propio aún en la cola de envío: se marcará con ✓ al enviarse
+            self.pending_entries[pending_id] = entry
+        self.add_entry(entry)
+
+    def on_entry_activated(self, index):
+        entry = index.data(EntryRole)
+        if entry is None or entry.kind != TimelineEntry.FILE:
+            return
+        if not entry.file_path or not os.path.exists(entry.file_path):
+            QMessageBox.warning(self, "Error", "El archivo ya no está disponible.")
+            return
+        target, _ = QFileDialog.getSaveFileName(self, "Guardar archivo", os.path.basename(entry.file_name))
+        if target:
+            try:
+                shutil.copyfile(entry.file_path, target)
+            except OSError as e:
+                QMessageBox.warning(self, "Error", f"No se pudo guardar el archivo: {e}")
+
+    def add_entry(self, entry):
+        if self.batch is not None:
+            self.batch.append(entry)  # Se inserta con el resto del lote
+        else:
+            self.insert_entries([entry])
+
+    def insert_entries(self, entries):
+        if not entries:
+            return
+        if self.detached:
+            # Se está viendo una zona antigua del historial: los mensajes se añaden al volver al final
+            self.live_buffer.extend(entries)
+            if any(entry.is_self for entry in entries):
+                self.live_requested.emit()  # Al escribir, se vuelve a la conversación en vivo
+            return
+        for entry in entries:
+            if entry.record_id is not None:
+                self.entries_by_record[entry.record_id] = entry
+        self.timeline_model.append_entries(entries)
+        self.timeline_view.scrollToBottom()
+
+    # Mientras se reconecta, el título lo indica; los mensajes escritos se envían al reconectar
+    def show_connection_state(self, connected):
+        suffix = "" if connected else " (reconectando...)"
+        self.chat_title_label.setText(f"Chat con: {self.username}{suffix}")
+
+    def mark_message_sent(self, msg_id):
+        entry = self.pending_entries.pop(msg_id, None)
+        if entry is not None:
+            entry.sent = True
+            self.timeline_model.entry_changed(entry)
+
+    def display_image_from_path(self, file_path, record_id=None):
+        try:
+            # Determinamos si el mensaje es propio o de otro usuario
+            is_self = False
+            actual_path = ""
+            sender_name = ""
+            
+            # Si es un mensaje con formato de nombre: ruta
+            if ":" in file_path:
+                parts = file_path.split(":", 1)
+                sender = parts[0]
+                is_self = sender == self.username
+                
+                if file_path.startswith("IMG:"):
+                    # Si empieza con IMG: es porque viene directamente del controller
+                    actual_path = file_path[4:]
+                elif len(parts) > 1:
+                    # Es un mensaje normal con nombre: ruta
+                    actual_path = parts[1].strip()
+                    if sender != "IMG":  # Evitamos mostrar "IMG:" como nombre
+                        sender_name = sender
+            else:
+                # Si no tiene formato, asumimos que es la ruta directa
+                actual_path = file_path
+            
+            # Si la ruta empieza con IMG: debemos quitarlo también
+            if actual_path.startswith("IMG:"):
+                actual_path = actual_path[4:]
+                
+            # Verificamos que el archivo existe
+            if not os.path.exists(actual_path):
+                print(f"[ERROR] El archivo de imagen no existe: {actual_path}")
+                self.display_message(f"Error: No se pudo cargar la imagen {actual_path}")
+                return
+            
+            # Si es un mensaje propio, mostramos "Yo" en lugar del nombre
+            sender_label = "Yo:" if is_self else (f"{sender_name}:" if sender_name else "")
+
+            # Solo se lee la cabecera del fichero para reservar el hueco de la imagen
+            size = QImageReader(actual_path).size()
+            image_size = thumbnail_size(size.width(), size.height()) if size.isValid() else None
+
+            # La burbuja se inserta ya (para respetar el orden del chat) y la imagen llega después
+            entry = TimelineEntry(TimelineEntry.IMAGE, "Cargando imagen...", is_self, sender_label, image_size)
+            entry.record_id = record_id
+            entry.image_key = "file:" + os.path.abspath(actual_path)
+            entry.image_path = actual_path
+            self.add_entry(entry)
+        except Exception as e:
+            print(f"Error al mostrar la imagen desde archivo: {e}")
+            self.display_message(f"Error al mostrar la imagen: {e}")
+
+    def display_image_preview(self, preview):
+        """Muestra al momento la burbuja de una imagen que aún se está recibiendo, con su vista previa
+        ampliada (borrosa) en el hueco de la imagen completa, que la sustituirá al llegar."""
+        sender_label = f"{preview.sender}:" if preview.sender else "Foto:"
+        entry = TimelineEntry(TimelineEntry.IMAGE, "Cargando imagen...", False, sender_label,
+                              thumbnail_size(preview.width, preview.height))
+        entry.image_key = f"preview:{preview.transfer_id}"
+        entry.image_data = preview.data
+        entry.image_format = "JPEG"
+        self.preview_entries[preview.transfer_id] = entry
+        self.add_entry(entry)
+
+    def display_image_from_data(self, image, record_id=None):
+        try:
+            entry = self.preview_entries.pop(image.transfer_id, None)
+            is_preview = entry is not None
+            if is_preview:
+                # Ya se está mostrando su vista previa: se sustituye por la imagen completa
+                self.pixmap_cache.discard(entry.image_key)
+                entry.record_id = record_id
+                if record_id is not None and not self.detached:
+                    self.entries_by_record[record_id] = entry
+                image_size = thumbnail_size(image.width, image.height)
+                if entry.image_size != image_size:
+                    entry.image_size = image_size
+                    entry.size_hint = None
+                    self.timeline_view.scheduleDelayedItemsLayout()
+            else:
+                # Para imágenes recibidas mostramos el nombre del remitente que viene en los metadatos
+                sender_label = f"{image.sender}:" if image.sender else "Foto:"
+                entry = TimelineEntry(TimelineEntry.IMAGE, "Cargando imagen...", False, sender_label,
+                                      thumbnail_size(image.width, image.height))
+                entry.record_id = record_id
+            # La imagen se identifica por el hash de su contenido: si ya se mostró, no se vuelve a
+            # decodificar. Se lee de su blob; solo sin almacén local se conservan los bytes recibidos
+            entry.image_key = image.digest or f"data:{id(image)}"
+            entry.image_path = image.path
+            entry.image_data = None if image.path else image.data
+            entry.image_format = image.format
+            if is_preview:
+                self.timeline_view.viewport().update()
+            else:
+                self.add_entry(entry)
+        except Exception as e:
+            print(f"Error al mostrar la imagen recibida: {e}")
+            self.display_message(f"Error al mostrar la imagen: {e}")
+
+    def image_for_entry(self, entry):
+        """Miniatura de una entrada para el delegado; si no está en la caché, se pide en segundo plano."""
+        key = entry.image_key
+        pixmap = self.pixmap_cache.get(key)
+        if pixmap is not None:
+            return pixmap
+        if key in self.image_errors:
+            entry.text = f"Error al mostrar la imagen: {self.image_errors[key]}"
+        elif key not in self.loading_images and key is not None:
+            self.request_image(entry)
+        return None
+
+    def request_image(self, entry):
+        """Decodifica la imagen de una entrada en el pool de hilos."""
+        self.next_image_request += 1
+        # Se guarda también la clave: la entrada puede cambiar de imagen (vista previa -> completa)
+        # antes de que termine la decodificación
+        self.image_requests[self.next_image_request] = (entry, entry.image_key)
+        self.loading_images.add(entry.image_key)
+        if entry.image_path:
+            self.image_loader.load_path(self.next_image_request, entry.image_path, entry.image_format)
+        else:
+            self.image_loader.load_data(self.next_image_request, entry.image_data, entry.image_format)
+
+    def show_loaded_image(self, request_id, image):
+        entry, key = self.image_requests.pop(request_id, (None, None))
+        if entry is None:
+            return
+        self.loading_images.discard(key)
+        self.pixmap_cache.put(key, QPixmap.fromImage(image))
+        if key == entry.image_key and not key.startswith("preview:") \
+                and entry.image_size != (image.width(), image.height()):
+            # No se conocía el tamaño de antemano: la fila debe recolocarse
+            entry.image_size = (image.width(), image.height())
+            entry.size_hint = None
+            self.timeline_view.scheduleDelayedItemsLayout()
+        # Se repintan las filas visibles: otras entradas pueden mostrar la misma imagen
+        self.timeline_view.viewport().update()
+
+    def show_image_error(self, request_id, error):
+        entry, key = self.image_requests.pop(request_id, (None, None))
+        if entry is None:
+            return
+        print(f"[ERROR] No se pudo cargar la imagen: {error}")
+        self.loading_images.discard(key)
+        self.image_errors[key] = error
+        if key == entry.image_key:
+            # La burbuja pasa a mostrar el aviso de error en lugar de la imagen
+            entry.text = f"Error al mostrar la imagen: {error}"
+            entry.image_size = None
+            entry.size_hint = None
+            self.timeline_view.scheduleDelayedItemsLayout()
+            self.timeline_view.viewport().update()
+
+    def show_search_bar(self):
+        self.search_bar.show()
+        self.search_input.setFocus()
+        self.search_input.selectAll()
+
+    def hide_search_bar(self):
+        self.search_bar.hide()
+        self.timeline_view.clearSelection()
+        self.message_input.setFocus()
+
+    def on_search_submitted(self):
+        text = self.search_input.text().strip()
+        if text:
+            self.search_requested.emit(text)
+
+    def show_search_results(self, record_ids):
+        """Recibe los ids encontrados (del más reciente al más antiguo) y salta al primero."""
+        self.search_hits = record_ids
+        self.search_position = 0
+        if not record_ids:
+            self.search_result_label.setText("Sin resultados")
+            return
+        self.jump_to_search_hit()
+
+    # Avanza (1, hacia mensajes más antiguos) o retrocede (-1) entre los resultados
+    def move_search(self, step):
+        if not self.search_hits:
+            return
+        self.search_position = (self.search_position + step) % len(self.search_hits)
+        self.jump_to_search_hit()
+
+    def jump_to_search_hit(self):
+        self.search_result_label.setText(f"{self.search_position + 1}/{len(self.search_hits)}")
+        self.jump_to_record(self.search_hits[self.search_position])
+
+    def jump_to_record(self, record_id):
+        """Muestra y selecciona el mensaje del historial indicado; si aún no está cargado, lo pide."""
+        entry = self.entries_by_record.get(record_id)
+        if entry is None:
+            self.history_jump_requested.emit(record_id)
+            return
+        index = self.timeline_model.index_of(entry)
+        # Un salto al principio o al final de la lista no debe disparar la carga de otra página
+        self.loading_history = True
+        try:
+            self.timeline_view.setCurrentIndex(index)
+            self.timeline_view.scrollTo(index, QAbstractItemView.PositionAtCenter)
+        finally:
+            self.loading_history = False
+
+    def get_message(self):
+        return self.message_input.text()
+
+    def clear_input(self):
         self.message_input.clear()
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtGui import QKeySequence
+
+# Modo de diagnóstico de la interfaz, para averiguar por qué se congela la ventana. Se activa con
+# variables de entorno:
+#   CHAT_DIAGNOSTICS=1        vigilante de bloqueos del hilo de la interfaz y atajo del perfilador
+#   CHAT_STALL_MS=200         duración a partir de la cual un bloqueo se registra (por defecto: 200)
+#   CHAT_PROFILE=1            perfila desde el arranque (implica CHAT_DIAGNOSTICS)
+#   CHAT_DIAGNOSTICS_DIR=ruta carpeta de los volcados (por defecto: <CHAT_DATA_DIR>/diagnostics)
+# El perfilador (cProfile del hilo de la interfaz y tracemalloc) se enciende y apaga con
+# Ctrl+Shift+P en cualquier ventana o, desde fuera, con `kill -USR1 <pid>`. Al apagarlo se
+# escriben en la carpeta los .prof (para pstats o snakeviz), un resumen en texto y la memoria
+# reservada; los bloqueos se añaden a stalls_<pid>.log con la pila del hilo de la interfaz.
+
+HEARTBEAT_MS = 50       # Latido del bucle de eventos
+SAMPLE_INTERVAL = 0.02  # Segundos entre comprobaciones (y muestras de pila durante un bloqueo)
+DEFAULT_STALL_MS = 200
+PROFILE_SHORTCUT = QKeySequence("Ctrl+Shift+P")
+PROFILE_TOP = 40        # Funciones y líneas que aparecen en los resúmenes en texto
+TRACEMALLOC_FRAMES = 10
+
+
+def default_diagnostics_dir():
+    data_dir = os.environ.get("CHAT_DATA_DIR", os.path.join(os.path.expanduser("~"), ".chat_lnvf"))
+    return os.environ.get("CHAT_DIAGNOSTICS_DIR", os.path.join(data_dir, "diagnostics"))
+
+
+# Vigilante de bloqueos: un temporizador del hilo de la interfaz anota cuándo late el bucle de
+# eventos, y un hilo aparte comprueba que siga latiendo. Mientras no late, el hilo toma muestras de
+# la pila de Python del hilo de la interfaz (sys._current_frames); al terminar el bloqueo, las
+# pilas distintas se registran con cuántas veces aparecieron, así se ve dónde se fue el tiempo. Si
+# el bloqueo está en código de Qt sin Python por encima (p. ej. pintando), la pila acaba en el
+# app.exec_() de main.py.
+class StallWatchdog:
+    def __init__(self, log_path, threshold_ms=DEFAULT_STALL_MS):
+        self.log_path = log_path
+        self.threshold = threshold_ms / 1000
+        self.gui_thread = threading.get_ident()  # Se crea desde el hilo de la interfaz
+        self.last_beat = time.monotonic()
+        self.stopped = threading.Event()
+        self.timer = QTimer()
+        self.timer.setInterval(HEARTBEAT_MS)
+        self.timer.timeout.connect(self.beat)
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.timer.start()
+        self.thread.start()
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+
+    def _watch(self):
+        stall_start = None
+        samples = Counter()
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            last_beat = self.last_beat
+            if time.monotonic() - last_beat > self.threshold:
+                if stall_start is None:
+                    stall_start = last_beat
+                frame = sys._current_frames().get(self.gui_thread)
+                if frame is not None:
+                    samples["".join(traceback.format_stack(frame))] += 1
+            elif stall_start is not None:
+                self._report(last_beat - stall_start, samples)
+                stall_start = None
+                samples = Counter()
+        if stall_start is not None:  # Se cerró la aplicación justo al acabar el bloqueo
+            self._report(time.monotonic() - stall_start, samples)
+
+    def _report(self, duration, samples):
+        from model.metrics import metrics  # Solo cuando hay un bloqueo que contar
+        metrics.inc("chat_gui_stalls_total")
+        total = sum(samples.values())
+        where = "?"
+        if samples:
+            innermost = samples.most_common(1)[0][0].rstrip().splitlines()
+            where = innermost[-2].strip() if len(innermost) > 1 else innermost[-1].strip()
+        print(f"[ADVERTENCIA] La interfaz estuvo bloqueada {duration * 1000:.0f} ms en {where}")
+        lines = [f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} bloqueo de {duration * 1000:.0f} ms "
+                 f"({total} muestras cada {SAMPLE_INTERVAL * 1000:.0f} ms)\n"]
+        for stack, count in samples.most_common():
+            lines.append(f"--- {count} muestras ({count / total:.0%})\n{stack}")
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines) + "\n")
+        except OSError as e:
+            print(f"[ERROR] No se pudo guardar el bloqueo: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.timer.stop()
+        self.thread.join()
+
+
+# Perfilador bajo demanda: cProfile del hilo de la interfaz (los hilos de red y de carga de
+# imágenes no bloquean la ventana) y tracemalloc de todo el proceso. Se importan al encenderlo.
+class Profiler:
+    def __init__(self, directory):
+        self.directory = directory
+        self.profile = None
+        self.memory_start = None
+        self.started = 0
+        self.started_tracemalloc = False
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+
+        self.started_tracemalloc = not tracemalloc.is_tracing()  # Quizá ya con PYTHONTRACEMALLOC
+        if self.started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.memory_start = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        print("[DEBUG] Perfilador encendido (Ctrl+Shift+P para apagarlo y guardar)")
+
+    def stop(self):
+        """Apaga el perfilador y escribe los volcados; devuelve el prefijo de sus rutas."""
+        import tracemalloc
+
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        elapsed = time.perf_counter() - self.started
+        memory = tracemalloc.take_snapshot()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        import pstats  # Después de la instantánea, para que no cuente lo que reserva el import
+
+        prefix = os.path.join(self.directory, f"profile_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}")
+        try:
+            profile.dump_stats(prefix + ".prof")
+            with open(prefix + ".txt", "w", encoding="utf-8") as f:
+                f.write(f"Hilo de la interfaz durante {elapsed:.1f} s\n\n")
+                pstats.Stats(profile, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+                pstats.Stats(profile, stream=f).sort_stats("tottime").print_stats(PROFILE_TOP)
+            memory.dump(prefix + ".tracemalloc")  # tracemalloc.Snapshot.load para analizarla después
+            with open(prefix + "_memoria.txt", "w", encoding="utf-8") as f:
+                f.write("Memoria reservada desde que se encendió el perfilador (por línea)\n\n")
+                for stat in memory.compare_to(self.memory_start, "lineno")[:PROFILE_TOP]:
+                    f.write(f"{stat}\n")
+                f.write("\nMemoria reservada en total (por línea)\n\n")
+                for stat in memory.statistics("lineno")[:PROFILE_TOP]:
+                    f.write(f"{stat}\n")
+        except OSError as e:
+            print(f"[ERROR] No se pudo guardar el perfil: {e}")
+            return None
+        print(f"[DEBUG] Perfil de {elapsed:.1f} s guardado en {prefix}.*")
+        return prefix
+
+
+# Une el vigilante y el perfilador, y atiende el atajo de teclado en todas las ventanas (un filtro
+# de eventos de la aplicación, porque la ventana de login y la del chat se crean y cierran).
+class Diagnostics(QObject):
+    def __init__(self, app, directory, stall_ms=DEFAULT_STALL_MS):
+        super().__init__()
+        self.app = app
+        os.makedirs(directory, exist_ok=True)
+        self.watchdog = StallWatchdog(os.path.join(directory, f"stalls_{os.getpid()}.log"), stall_ms)
+        self.profiler = Profiler(directory)
+        app.installEventFilter(self)
+        if hasattr(signal, "SIGUSR1"):
+            # Python atiende la señal en el hilo principal cuando vuelve a ejecutar código (el
+            # latido del vigilante lo hace cada 50ms); el cambio se hace ya desde el bucle de eventos
+            signal.signal(signal.SIGUSR1, lambda signum, frame: QTimer.singleShot(0, self.profiler.toggle))
+        self.watchdog.start()
+        print(f"[DEBUG] Diagnóstico activado: bloqueos de más de {stall_ms} ms y perfiles en {directory}")
+
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.KeyPress and not event.isAutoRepeat()
+                and QKeySequence(int(event.modifiers()) | event.key()) == PROFILE_SHORTCUT):
+            self.profiler.toggle()
+            return True
+        return False
+
+    def stop(self):
+        self.watchdog.stop()
+        if self.profiler.active:
+            self.profiler.stop()  # Lo perfilado hasta el cierre no se pierde
+        self.app.removeEventFilter(self)
+
+
+def start_diagnostics(app):
+    """Activa el diagnóstico si lo piden CHAT_DIAGNOSTICS o CHAT_PROFILE (si no, None)."""
+    profile = os.environ.get("CHAT_PROFILE", "0") != "0"
+    if os.environ.get("CHAT_DIAGNOSTICS", "0") == "0" and not profile:
+        return None
+    stall_ms = int(os.environ.get("CHAT_STALL_MS", DEFAULT_STALL_MS))
+    try:
+        diagnostics = Diagnostics(app, default_diagnostics_dir(), stall_ms)
+    except OSError as e:
+        print(f"[ERROR] No se pudo activar el diagnóstico: {e}")
+        return None
+    if profile:
+        diagnostics.profiler.start()
+    return diagnostics
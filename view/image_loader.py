@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+
+THUMBNAIL_WIDTH = 300  # Ancho máximo con el que se muestran las imágenes en el chat
+PIXMAP_CACHE_BYTES = 64 * 1024 * 1024  # Memoria máxima de las miniaturas ya decodificadas
+
+
+def thumbnail_size(width, height):
+    """Tamaño final (ancho, alto) de una imagen una vez escalada para el chat."""
+    if width <= THUMBNAIL_WIDTH or width == 0:
+        return width, height
+    return THUMBNAIL_WIDTH, round(height * THUMBNAIL_WIDTH / width)
+
+
+class ImageLoaderSignals(QObject):
+    loaded = pyqtSignal(object, QImage)  # (id de petición, imagen ya escalada)
+    failed = pyqtSignal(object, str)     # (id de petición, mensaje de error)
+
+
+# Tarea que decodifica y escala una imagen fuera del hilo de la interfaz. Trabaja con QImage,
+# que (a diferencia de QPixmap) se puede usar desde cualquier hilo.
+class ImageDecodeTask(QRunnable):
+    def __init__(self, request_id, signals, path=None, data=None, fmt=None):
+        super().__init__()
+        self.request_id = request_id
+        self.signals = signals
+        self.path = path
+        self.data = data
+        self.format = fmt
+
+    def run(self):
+        try:
+            image = QImage()
+            if self.path:
+                loaded = image.load(self.path, self.format)
+            else:
+                loaded = image.loadFromData(self.data, self.format)
+            if not loaded:
+                raise ValueError(f"Formato de imagen no válido: {self.format or self.path}")
+
+            if image.width() > THUMBNAIL_WIDTH:
+                image = image.scaledToWidth(THUMBNAIL_WIDTH, Qt.SmoothTransformation)
+            self.signals.loaded.emit(self.request_id, image)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+        finally:
+            self.data = None  # Libera el buffer de recepción cuanto antes
+
+
+# Pool de hilos que prepara las miniaturas de las imágenes del chat. Las señales `loaded` y
+# `failed` se entregan en el hilo de la interfaz, que solo tiene que insertar el resultado.
+class ImageLoader(QObject):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.signals = ImageLoaderSignals()
+        self.loaded = self.signals.loaded
+        self.failed = self.signals.failed
+
+    def load_path(self, request_id, path, fmt=None):
+        self.pool.start(ImageDecodeTask(request_id, self.signals, path=path, fmt=fmt))
+
+    def load_data(self, request_id, data, fmt=None):
+        self.pool.start(ImageDecodeTask(request_id, self.signals, data=data, fmt=fmt))
+
+
+# Caché LRU de miniaturas ya decodificadas (QPixmap), limitada por memoria. La clave identifica el
+# contenido (hash del blob o ruta del fichero), así una imagen repetida se decodifica una sola vez.
+# Las imágenes que llevan más tiempo sin pintarse (las que quedan fuera de la vista al desplazarse)
+# son las primeras en salir; si se vuelven a ver, se decodifican de nuevo desde el disco.
+class PixmapCache:
+    def __init__(self, max_bytes=PIXMAP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.pixmaps = OrderedDict()  # clave -> QPixmap, de la menos a la más recientemente usada
+        self.total_bytes = 0
+
+    @staticmethod
+    def _cost(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, key):
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+        return pixmap
+
+    def discard(self, key):
+        pixmap = self.pixmaps.pop(key, None)
+        if pixmap is not None:
+            self.total_bytes -= self._cost(pixmap)
+
+    def put(self, key, pixmap):
+        old = self.pixmaps.pop(key, None)
+        if old is not None:
+            self.total_bytes -= self._cost(old)
+        self.pixmaps[key] = pixmap
+        self.total_bytes += self._cost(pixmap)
+        while self.total_bytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.total_bytes -= self._cost(evicted)
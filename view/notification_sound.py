@@ -0,0 +1,74 @@
+import os
+import time
+
+from PyQt5.QtCore import QUrl
+
+SOUND_FILE_NAMES = ("notification.wav", "notification.mp3")  # Se usa el primero que exista
+SOUND_DEBOUNCE = 1.0  # Segundos tras un aviso en los que no vuelve a sonar (una ráfaga suena una vez)
+SOUND_VOLUME = 0.8
+
+
+# Sonido de notificación de los mensajes recibidos. El fichero se busca una sola vez al arrancar y
+# QtMultimedia solo se importa al cargarlo (load), así no se paga si el sonido está desactivado
+# (CHAT_SOUND=0) o no hay fichero. Se carga una vez y se reutiliza: un WAV va a un QSoundEffect
+# (ya decodificado, de baja latencia); otros formatos, que QSoundEffect no entiende, a un único
+# QMediaPlayer con el fichero ya cargado.
+class NotificationSound:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.path = None
+        self.player = None
+        self.loaded = False
+        self.last_played = float("-inf")
+        if os.environ.get("CHAT_SOUND", "1") == "0":
+            return
+
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in SOUND_FILE_NAMES:
+            for path in (os.path.join(app_dir, name), os.path.join(app_dir, "sounds", name)):
+                if os.path.exists(path):
+                    self.path = path
+                    break
+            if self.path:
+                break
+        if not self.path:
+            print("[ADVERTENCIA] No se encontró el archivo de sonido.")
+            print(f"Por favor, añade un archivo llamado '{SOUND_FILE_NAMES[0]}' en la carpeta de la aplicación.")
+
+    def load(self):
+        """Prepara el reproductor (una sola vez). Sin sonido o sin QtMultimedia no hace nada."""
+        if self.loaded or not self.path:
+            return
+        self.loaded = True
+        try:
+            if self.path.endswith(".wav"):
+                from PyQt5.QtMultimedia import QSoundEffect
+
+                self.player = QSoundEffect(self.parent)
+                self.player.setSource(QUrl.fromLocalFile(self.path))
+                self.player.setVolume(SOUND_VOLUME)
+            else:
+                from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
+
+                self.player = QMediaPlayer(self.parent)
+                self.player.setMedia(QMediaContent(QUrl.fromLocalFile(self.path)))
+                self.player.setVolume(int(SOUND_VOLUME * 100))
+        except Exception as e:
+            print(f"[ADVERTENCIA] No se puede reproducir el sonido de notificación: {e}")
+            self.player = None
+
+    def play(self):
+        """Reproduce el aviso, salvo si ya sonó hace menos de SOUND_DEBOUNCE segundos."""
+        now = time.monotonic()
+        if now - self.last_played < SOUND_DEBOUNCE:
+            return
+        self.last_played = now
+        self.load()
+        if self.player is None:
+            return
+        try:
+            if hasattr(self.player, "setPosition"):
+                self.player.setPosition(0)  # QMediaPlayer: vuelve al principio sin recargar el fichero
+            self.player.play()
+        except Exception as e:
+            print(f"[ERROR] Error al reproducir el sonido de notificación: {e}")